@@ -0,0 +1,284 @@
+"""
+    End-to-end throughput and latency benchmark of the App.
+
+    Runs the App in a child process against simulated GoodWe HT inverters (src.simulator, one Modbus TCP
+    gateway per --per-client unit ids) and the in-process MQTT broker stand-in of benchmarks.broker.
+    For every fleet size it measures, over the poll loop only (setup and discovery excluded):
+        - cycle time: busy time of a poll cycle (sync runtime), or the mean time per cycle of all clients (async)
+        - Modbus requests and registers read per second, as served by the simulators
+        - MQTT messages per second, as received by the broker
+        - command latency: from a command published on a set topic to its read back on the state topic
+        - CPU time and peak RSS of the App process
+
+    With --replay, the servers of a Modbus recording (see src.modbus_recording) are polled instead, served by
+    ReplayClients at the recorded latencies, e.g. to compare read planner or scheduler changes on a captured session.
+
+    Run from the repository root, e.g.:
+        python -m benchmarks.bench_app --inverters 1,10,100 --cycles 20 --output results.json
+        python -m benchmarks.bench_app --replay modbus-20260101-120000-1.jsonl.gz --speed 10
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+from dataclasses import replace
+from statistics import mean, quantiles
+from time import monotonic, process_time
+from typing import Any, Callable, Optional
+
+from benchmarks.broker import StandInBroker
+from src.fault_proxy import FaultProxy, FaultProxyOptions, parse_faults
+from src.helpers import slugify
+from src.modbus_recording import Recording
+from src.options import ModbusTCPOptions, ServerOptions
+from src.simulator import Simulator, SimulatorOptions
+
+MAX_INVERTERS = 500
+COMMAND_TOPIC = "{base}/{nickname}/active_power_control/set"
+READBACK_TOPIC = "{base}/{nickname}/active_power_control/state"
+
+
+def server_name(index: int) -> str:
+    return f"inv{index:03d}"
+
+
+def distribution(samples: list[float]) -> Optional[dict[str, float]]:
+    """ Mean, median, 95th percentile and maximum of samples, in milliseconds. None without samples. """
+    if not samples:
+        return None
+    ms = sorted(1000 * s for s in samples)
+    p50, p95 = (quantiles(ms, n=100, method="inclusive")[i] for i in (49, 94)) if len(ms) > 1 else (ms[0], ms[0])
+    return {"mean": round(mean(ms), 3), "p50": round(p50, 3), "p95": round(p95, 3), "max": round(ms[-1], 3),
+            "samples": len(ms)}
+
+
+def run_app(settings: dict[str, Any], servers: list, clients: list, broker_port: int, events, go) -> None:
+    """ Child process: set up and connect the App, then poll for settings["cycles"] cycles once go is set. """
+    from src.app import App, instantiate_clients, instantiate_servers
+    from src.loader import load_validate_options
+    from src.mqtt_message_handler import MessageHandler
+
+    logging.getLogger().setLevel(settings["log_level"])
+    client_callback = instantiate_clients
+    if settings["replay"]:
+        from src.modbus_recording import ReplayClient
+        replay_clients = ReplayClient.from_file(settings["replay"], settings["speed"])
+        client_callback = lambda OPTIONS: replay_clients     # noqa: E731
+    options = replace(load_validate_options("config.yaml"), servers=servers, clients=clients,
+                      mqtt_host="127.0.0.1", mqtt_port=broker_port, runtime=settings["runtime"],
+                      pause_interval_seconds=settings["pause"], write_debounce=settings["write_debounce"],
+                      midnight_sleep_enabled=False, discovery_cache=False)
+    app = App(client_callback, instantiate_servers, MessageHandler, options=options)
+
+    busy: list[float] = []
+    cycle_start = [0.0]
+    modbus = [0, 0]     # requests and registers read by replay clients before the poll loop
+
+    def cycle_done():
+        # back to back cycles (pause 0) have no deadline to measure from
+        now = monotonic()
+        busy.append(app.pause_interval - app.scheduler.remaining() if app.pause_interval > 0 else now - cycle_start[0])
+        cycle_start[0] = now
+
+    if settings["runtime"] == "sync":
+        app.cycle_callbacks.append(cycle_done)
+    connect = app.connect
+
+    def connect_then_wait():
+        connect()
+        events.put(("connected", len(app.servers)))
+        go.wait()
+        if settings["replay"]:
+            modbus[:] = [-sum(c.requests for c in app.clients), -sum(c.registers_read for c in app.clients)]
+        cycle_start[0] = monotonic()
+
+    app.connect = connect_then_wait
+    app.setup()
+    if settings["runtime"] == "async":
+        from src.async_runtime import AsyncRuntime
+        runtime = AsyncRuntime(app)
+        cpu, start = process_time(), monotonic()
+        runtime.run(settings["cycles"])
+    else:
+        app.connect()
+        cpu, start = process_time(), monotonic()
+        app.loop(settings["cycles"])
+    duration, cpu = monotonic() - start, process_time() - cpu
+
+    cycles = app.cycle_count
+    stats = {
+        "duration": duration,
+        "cycles": cycles,
+        "cycle_time": distribution(busy) or {"mean": round(1000 * duration / max(cycles, 1), 3)},
+        "cpu_time": round(cpu, 3),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "egress": app.mqtt_client.egress.stats(),
+    }
+    if settings["replay"]:
+        stats["modbus"] = [modbus[0] + sum(c.requests for c in app.clients),
+                           modbus[1] + sum(c.registers_read for c in app.clients)]
+    events.put(("done", stats))
+    app.mqtt_client.close()
+    os._exit(0)     # skip the exit handlers of the App and pymodbus threads
+
+
+def command_latencies(broker: StandInBroker, base: str, nicknames: list[str], done, max_commands: int) -> list[float]:
+    """ Publish commands with distinct values, round robin over the servers, until the App is done polling. """
+    latencies = []
+    for i in range(max_commands if nicknames else 0):
+        if not done():
+            nickname = nicknames[i % len(nicknames)]
+            value = float(10 + i % 80)
+            readback = READBACK_TOPIC.format(base=base, nickname=nickname)
+            count = broker.count(readback)
+            start = monotonic()
+            broker.inject(COMMAND_TOPIC.format(base=base, nickname=nickname), str(value))
+            while (payload := broker.wait_for_message(readback, count, timeout=10)) is not None:
+                if float(payload) == value:
+                    latencies.append(monotonic() - start)
+                    break
+                count = broker.count(readback)
+    return latencies
+
+
+def benchmark(args: argparse.Namespace, servers: list[ServerOptions], clients: list,
+              modbus_counters: Optional[Callable[[], tuple[int, int]]] = None) -> dict[str, Any]:
+    """Run the App on servers and clients, and measure the poll loop.
+
+    Args:
+        modbus_counters: requests and registers read so far by the devices, if not counted by the App's clients
+    """
+    settings = {key: getattr(args, key) for key in ("cycles", "pause", "runtime", "write_debounce", "log_level",
+                                                    "replay", "speed")}
+    commanded = [slugify(s.name) for s in servers if s.server_type == "GOODWE_HT"]
+    broker = StandInBroker().start()
+    context = multiprocessing.get_context("spawn")
+    events, go = context.Queue(), context.Event()
+    process = context.Process(target=run_app, args=(settings, servers, clients, broker.port, events, go))
+    try:
+        process.start()
+        event, connected = events.get(timeout=600)
+        modbus = modbus_counters() if modbus_counters else (0, 0)
+        messages = broker.received
+        go.set()
+
+        # commands during the poll loop: the latency includes waiting on polls of the same bus
+        latencies = command_latencies(broker, "modbus", commanded, lambda: not events.empty(), args.commands)
+        event, stats = events.get(timeout=3600)
+        process.join(timeout=30)
+        messages = broker.received - messages
+    finally:
+        if process.is_alive():
+            process.kill()
+        broker.stop()
+
+    if modbus_counters:
+        requests, registers = (now - before for now, before in zip(modbus_counters(), modbus))
+    else:
+        requests, registers = stats["modbus"]
+    duration = stats["duration"]
+    return {
+        "connected": connected,
+        "clients": len(clients),
+        "runtime": args.runtime,
+        "cycles": stats["cycles"],
+        "duration_s": round(duration, 3),
+        "cycle_time_ms": stats["cycle_time"],
+        "modbus_requests_per_s": round(requests / duration, 1),
+        "registers_per_s": round(registers / duration, 1),
+        "mqtt_messages_per_s": round(messages / duration, 1),
+        "command_latency_ms": distribution(latencies),
+        "cpu_time_s": stats["cpu_time"],
+        "cpu_per_cycle_ms": round(1000 * stats["cpu_time"] / max(stats["cycles"], 1), 3),
+        "max_rss_mb": stats["max_rss_mb"],
+        "egress": stats["egress"],
+    }
+
+
+def run(inverters: int, args: argparse.Namespace) -> dict[str, Any]:
+    """ Benchmark a simulated fleet of inverters. Returns the results of the run. """
+    unit_counts = [min(args.per_client, inverters - start) for start in range(0, inverters, args.per_client)]
+    simulators = [Simulator(SimulatorOptions(unit_ids=tuple(range(1, n + 1)), port=0, latency=args.latency)).start()
+                  for n in unit_counts]
+    # faulty devices are behind the first gateway, reached through a fault injecting proxy
+    proxy = FaultProxy(FaultProxyOptions(upstream_port=simulators[0].port, unit_faults=args.fault, seed=0)).start() \
+        if args.fault else None
+    servers, clients = [], []
+    for g, simulator in enumerate(simulators):
+        gateway = f"gateway{g}"
+        clients.append(ModbusTCPOptions(gateway, "TCP", "127.0.0.1", proxy.port if proxy and g == 0 else simulator.port))
+        for unit_id in simulator.devices:
+            servers.append(ServerOptions(server_name(len(servers)), f"SIM{unit_id:05d}", "GOODWE_HT", gateway, unit_id))
+    devices = [device for simulator in simulators for device in simulator.devices.values()]
+    try:
+        result = benchmark(args, servers, clients, lambda: (sum(d.requests for d in devices),
+                                                            sum(d.registers_read for d in devices)))
+    finally:
+        if proxy is not None:
+            proxy.stop()
+        for simulator in simulators:
+            simulator.stop()
+    if proxy is not None:
+        result["faults_injected"] = {"dropped": proxy.dropped, "truncated": proxy.truncated, "resets": proxy.resets}
+    return {"inverters": inverters, **result}
+
+
+def run_replay(args: argparse.Namespace) -> dict[str, Any]:
+    """ Benchmark the servers of a recording, served by ReplayClients. Returns the results of the run. """
+    recording = Recording.load(args.replay)
+    # only the names of the clients are used, by the servers to find theirs
+    clients = [ModbusTCPOptions(name, "TCP", "127.0.0.1", 0) for name in recording.clients]
+    servers = [s for s in recording.servers if s.connected_client in recording.clients]
+    return {"replay": args.replay, "speed": args.speed, "inverters": len(servers), **benchmark(args, servers, clients)}
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the App against simulated inverters")
+    parser.add_argument("--inverters", default="1,10,100", help=f"comma separated fleet sizes, up to {MAX_INVERTERS}")
+    parser.add_argument("--per-client", type=int, default=50, help="unit ids per simulated Modbus TCP gateway")
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--pause", type=float, default=0, help="pause_interval_seconds, 0 to poll back to back")
+    parser.add_argument("--runtime", default="sync", choices=["sync", "async"])
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every simulated Modbus request")
+    parser.add_argument("--commands", type=int, default=20, help="commands published during each run, at most")
+    parser.add_argument("--fault", action="append", default=[], metavar="UNIT:FAULTS",
+                        help="inject faults into the responses of a unit id of the first gateway, e.g. 3:drop=0.2,delay=0.5. "
+                             "See src.fault_proxy")
+    parser.add_argument("--write-debounce", type=float, default=0)
+    parser.add_argument("--replay", help="instead of simulators, replay this Modbus recording (see modbus_recording)")
+    parser.add_argument("--speed", type=float, default=1, help="pace of the replay: 1 as recorded, 0 without delays")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+    args.inverters = [int(n) for n in args.inverters.split(",")]
+    args.fault = {int(unit): parse_faults(faults) for unit, _, faults in (f.partition(":") for f in args.fault)}
+    if not all(1 <= n <= MAX_INVERTERS for n in args.inverters) or not 1 <= args.per_client <= 247:
+        parser.error(f"fleet sizes must be 1 to {MAX_INVERTERS}, and --per-client 1 to 247")
+    if args.replay and args.runtime == "async":
+        parser.error("recordings are replayed by the sync runtime")
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    results = []
+    print(f"{'inverters':>9} {'cycle ms':>9} {'req/s':>9} {'regs/s':>10} {'msg/s':>9} {'cmd p50 ms':>10} {'cpu s':>7} {'rss MB':>7}")
+    for inverters in [None] if args.replay else args.inverters:
+        result = run_replay(args) if inverters is None else run(inverters, args)
+        results.append(result)
+        inverters = result["inverters"]
+        latency = result["command_latency_ms"]
+        print(f"{inverters:>9} {result['cycle_time_ms']['mean']:>9.1f} {result['modbus_requests_per_s']:>9.1f} "
+              f"{result['registers_per_s']:>10.1f} {result['mqtt_messages_per_s']:>9.1f} "
+              f"{latency['p50'] if latency else float('nan'):>10.1f} {result['cpu_time_s']:>7.2f} {result['max_rss_mb']:>7.1f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "output"}, "python": sys.version.split()[0],
+                       "results": results}, f, indent=2, default=vars)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+    Microbenchmark of the per-value decode cost of the register codec.
+
+    Compares the previous per-call pack/unpack decoding with codec.decode (one value from a
+    register list) and with buffer decoders reading every parameter of a block from one buffer,
+    as Server.decode_block does.
+
+    Run from the repository root:
+        python -m benchmarks.bench_codec
+"""
+import struct
+from timeit import repeat
+
+from src import codec
+from src.enums import DataType
+from src.goodwe_ht_registers import goodwe_ht_parameters
+from src.read_planner import plan_reads
+
+NUMBER = 20_000
+
+
+def legacy_decoded(registers, dtype):
+    """ Decoding as done before the codec module: pack registers to bytes and unpack on every call. """
+    if dtype == DataType.U16:
+        return registers[0]
+    elif dtype == DataType.I16:
+        return struct.unpack('>h', struct.pack('>H', registers[0]))[0]
+    elif dtype == DataType.U32:
+        return struct.unpack('>I', struct.pack('>HH', registers[0], registers[1]))[0]
+    elif dtype == DataType.I32:
+        return struct.unpack('>i', struct.pack('>HH', registers[0], registers[1]))[0]
+    elif dtype == DataType.U64:
+        return struct.unpack('>Q', struct.pack('>HHHH', *registers[:4]))[0]
+    elif dtype == DataType.I64:
+        return struct.unpack('>q', struct.pack('>HHHH', *registers[:4]))[0]
+    elif dtype == DataType.UTF8:
+        byte_data = b''
+        for reg in registers:
+            byte_data += struct.pack('>H', reg)
+        return byte_data.decode('ascii', errors='ignore').rstrip('\x00').strip()
+    raise NotImplementedError(dtype)
+
+
+def best_ns_per_value(stmt, values: int) -> float:
+    return min(repeat(stmt, number=NUMBER, repeat=5)) / (NUMBER * values) * 1e9
+
+
+def main() -> None:
+    print(f"{'dtype':<6} {'legacy':>10} {'codec':>10} {'buffer':>10}   (ns per value)")
+    samples = {
+        DataType.U16: [1234],
+        DataType.I16: [0xFFFE],
+        DataType.U32: [0x0001, 0x86A0],
+        DataType.I32: [0xFFFF, 0xFC18],
+        DataType.UTF8: [0x4757, 0x2D31, 0x3030, 0x4854, 0x0000],
+    }
+    for dtype, registers in samples.items():
+        decoder = codec.buffer_decoder(dtype, len(registers))
+        buffer = codec.registers_to_buffer(registers)
+        print(f"{dtype.value:<6} "
+              f"{best_ns_per_value(lambda: legacy_decoded(registers, dtype), 1):>10.0f} "
+              f"{best_ns_per_value(lambda: codec.decode(registers, dtype), 1):>10.0f} "
+              f"{best_ns_per_value(lambda: decoder(buffer, 0), 1):>10.0f}")
+
+    # every parameter of a planned block of the HT register map, decoded from one response
+    block = max(plan_reads(goodwe_ht_parameters, max_gap=10), key=lambda block: len(block.parameters))
+    registers = list(range(block.count))
+    params = list(block.parameters.values())
+    decoders = [(codec.buffer_decoder(p["dtype"], p["count"]), 2 * (p["addr"] - block.address)) for p in params]
+
+    def legacy_block():
+        for p in params:
+            offset = p["addr"] - block.address
+            legacy_decoded(registers[offset:offset + p["count"]], p["dtype"])
+
+    def buffer_block():
+        buffer = codec.registers_to_buffer(registers)
+        for decoder, offset in decoders:
+            decoder(buffer, offset)
+
+    print(f"\nblock of {len(params)} parameters, {block.count} registers:")
+    print(f"  legacy {best_ns_per_value(legacy_block, len(params)):>8.0f} ns per value")
+    print(f"  buffer {best_ns_per_value(buffer_block, len(params)):>8.0f} ns per value")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+    Minimal in-process MQTT 3.1.1 broker stand-in for benchmarks and tests.
+
+    Accepts any client, acknowledges QoS 1 and 2 publishes, keeps retained messages, forwards publishes
+    to matching subscriptions at QoS 0, and counts what it receives. Runs on its own thread and event loop.
+"""
+import asyncio
+import struct
+import threading
+from collections import defaultdict
+from time import monotonic
+from typing import Optional
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """ Whether topic matches a subscription filter with + and # wildcards. """
+    filter_levels, levels = topic_filter.split("/"), topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(levels) or (level != "+" and level != levels[i]):
+            return False
+    return len(filter_levels) == len(levels)
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    length, encoded = len(body), bytearray()
+    while True:
+        digit, length = length % 128, length // 128
+        encoded.append(digit | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes([packet_type << 4 | flags]) + bytes(encoded) + body
+
+
+def _string(data: bytes, offset: int) -> tuple[str, int]:
+    length = struct.unpack_from(">H", data, offset)[0]
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+def publish_packet(topic: str, payload: bytes, retain: bool = False) -> bytes:
+    encoded = topic.encode()
+    return _packet(PUBLISH, int(retain), struct.pack(">H", len(encoded)) + encoded + payload)
+
+
+class StandInBroker:
+    """
+        Counts the messages received (by QoS), and keeps the last payload and a message count per topic.
+        wait_for_message blocks until a topic receives a new message, e.g. the read back of a command.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.received = 0
+        self.received_by_qos = [0, 0, 0]
+        self.bytes_received = 0
+        self.retained: dict[str, bytes] = {}
+        self.last: dict[str, bytes] = {}
+        self.counts: dict[str, int] = defaultdict(int)
+        self._subscriptions: dict[asyncio.StreamWriter, set[str]] = {}
+        self._condition = threading.Condition()
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="broker", daemon=True)
+
+    def start(self) -> "StandInBroker":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result(timeout=10)
+        return self
+
+    async def _listen(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        async def close():
+            for writer in list(self._subscriptions):
+                writer.close()
+            if self._server is not None:
+                self._server.close()
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+
+    def __enter__(self) -> "StandInBroker":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def count(self, topic: str) -> int:
+        with self._condition:
+            return self.counts.get(topic, 0)
+
+    def wait_for_message(self, topic: str, after: int, timeout: float = 10) -> Optional[bytes]:
+        """ Wait until topic received more than after messages. Returns its last payload, None on timeout. """
+        deadline = monotonic() + timeout
+        with self._condition:
+            while self.counts.get(topic, 0) <= after:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self.last[topic]
+
+    def inject(self, topic: str, payload: str | bytes) -> None:
+        """ Publish to the subscribers of topic, as another client of the broker would. """
+        payload = payload.encode() if isinstance(payload, str) else payload
+        self._loop.call_soon_threadsafe(self._forward, topic, payload)
+
+    def _forward(self, topic: str, payload: bytes) -> None:
+        packet = publish_packet(topic, payload)
+        for writer, filters in self._subscriptions.items():
+            if any(topic_matches(f, topic) for f in filters):
+                writer.write(packet)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._subscriptions[writer] = set()
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, shift = 0, 0
+                while True:
+                    digit = (await reader.readexactly(1))[0]
+                    length += (digit & 0x7F) << shift
+                    shift += 7
+                    if not digit & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                if not self._on_packet(header[0] >> 4, header[0] & 0x0F, body, writer):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._subscriptions[writer]
+            writer.close()
+
+    def _on_packet(self, packet_type: int, flags: int, body: bytes, writer: asyncio.StreamWriter) -> bool:
+        """ Handle a packet from a client. Returns False once the client disconnected. """
+        if packet_type == CONNECT:
+            writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+        elif packet_type == PUBLISH:
+            qos, retain = (flags >> 1) & 0x03, flags & 0x01
+            topic, offset = _string(body, 0)
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+                writer.write(_packet(PUBACK if qos == 1 else PUBREC, 0, packet_id))
+            payload = body[offset:]
+            with self._condition:
+                self.received += 1
+                self.received_by_qos[qos] += 1
+                self.bytes_received += len(body)
+                self.last[topic] = payload
+                self.counts[topic] += 1
+                if retain:
+                    if payload:
+                        self.retained[topic] = payload
+                    else:
+                        self.retained.pop(topic, None)
+                self._condition.notify_all()
+            self._forward(topic, payload)
+        elif packet_type == PUBREL:
+            writer.write(_packet(PUBCOMP, 0, body[:2]))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, b""
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                offset += 1     # requested QoS: messages are forwarded at QoS 0
+                self._subscriptions[writer].add(topic_filter)
+                granted += b"\x00"
+                for topic, payload in self.retained.items():
+                    if topic_matches(topic_filter, topic):
+                        writer.write(publish_packet(topic, payload, retain=True))
+            writer.write(_packet(SUBACK, 0, packet_id + granted))
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                self._subscriptions[writer].discard(topic_filter)
+            writer.write(_packet(UNSUBACK, 0, body[:2]))
+        elif packet_type == PINGREQ:
+            writer.write(_packet(PINGRESP, 0, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
@@ -0,0 +1,54 @@
+import json
+import logging
+import os
+
+from .helpers import DATA_PATH, slugify
+
+logger = logging.getLogger(__name__)
+
+
+class AddressMap:
+    """
+        Learned map of the registers a device rejects with Modbus exception 2 (Illegal Data Address).
+
+        - illegal: parameters that cannot be read at all. Excluded from read plans.
+        - split_before: parameters that must start a new block read, because the device rejects
+          reads of the unmapped registers bridged before them.
+
+        Persisted as json per model and serial number, so a restart skips the probing.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        self.illegal: set[str] = set()
+        self.split_before: set[str] = set()
+
+    @classmethod
+    def for_device(cls, model: str, serial: str, data_path: str = DATA_PATH) -> "AddressMap":
+        path = os.path.join(data_path, "address_maps", f"{slugify(model)}_{slugify(serial)}.json")
+        address_map = cls(path)
+        address_map.load()
+        return address_map
+
+    def load(self) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.illegal = set(data.get("illegal", []))
+            self.split_before = set(data.get("split_before", []))
+            logger.info(f"Loaded address map {self.path}: {len(self.illegal)} unreadable parameters, "
+                        f"{len(self.split_before)} block splits")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load address map {self.path}: {e}")
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump({"illegal": sorted(self.illegal), "split_before": sorted(self.split_before)}, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not save address map {self.path}: {e}")
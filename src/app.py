@@ -1,21 +1,26 @@
-from time import sleep
+from time import monotonic, perf_counter, sleep
 from datetime import datetime, timedelta
 import atexit
 import logging
 from queue import Queue
-from typing import Callable
+from typing import Any, Callable
 
 from pymodbus import ModbusException
 
 from .loader import load_validate_options
 from .options import AppOptions
-from .client import Client
+from .client import AsyncClient, Client
 from .implemented_servers import ServerTypes
+from .enums import PollTier
 from .server import ReadException, Server
 from .modbus_mqtt import MqttClient
 from paho.mqtt.enums import MQTTErrorCode
 from paho.mqtt.client import MQTTMessage
 from .mqtt_message_handler import MessageHandler
+from .cycle_scheduler import CycleScheduler
+from .reconnect import ReconnectSupervisor
+from .address_map import AddressMap
+from .change_filter import ChangeFilter
 
 import sys
 
@@ -46,30 +51,48 @@ def exit_handler(
     servers: list[Server], modbus_clients: list[Client], mqtt_client: MqttClient
 ) -> None:
     logger.info("Exiting")
-    # publish offline availability for each server
-    for server in servers:
-        mqtt_client.publish_availability(False, server)
-    logger.info("Closing client connections on exit")
-    for client in modbus_clients:
-        client.close()
-
-    mqtt_client.loop_stop()
+    try:
+        # publish offline availability for each server
+        for server in servers:
+            mqtt_client.publish_availability(False, server)
+        logger.info("Closing client connections on exit")
+        for client in modbus_clients:
+            client.close()
+    finally:
+        mqtt_client.close()     # sends the queued messages, including the offline availability
 
 
 class App:
-    def __init__(self, client_instantiator_callback, server_instantiator_callback,  message_handler_instantiator: type[MessageHandler], options_rel_path=None) -> None:
+    def __init__(self, client_instantiator_callback, server_instantiator_callback,  message_handler_instantiator: type[MessageHandler], options_rel_path=None, options: AppOptions | None = None) -> None:
         self.OPTIONS: AppOptions
         # Read configuration
-        if options_rel_path:
+        if options is not None:     # already loaded, e.g. the subset of clients handled by one shard
+            self.OPTIONS = options
+        elif options_rel_path:
             self.OPTIONS = load_validate_options(options_rel_path)
         else:
             self.OPTIONS = load_validate_options()
 
         self.midnight_sleep_enabled, self.minutes_wakeup_after = self.OPTIONS.midnight_sleep_enabled, self.OPTIONS.midnight_sleep_wakeup_after
         self.pause_interval = self.OPTIONS.pause_interval_seconds
+        self.poll_intervals: dict[PollTier, float] = {
+            PollTier.FAST: 0,   # every cycle
+            PollTier.NORMAL: self.OPTIONS.poll_interval_normal,
+            PollTier.SLOW: self.OPTIONS.poll_interval_slow,
+        }
         # midnight_sleep_enabled=True, minutes_wakeup_after=5
 
         self.disconnect_stack = []
+        self.scheduler = CycleScheduler(self.pause_interval)
+        self.reconnector = ReconnectSupervisor()
+        self.change_filter = ChangeFilter.from_options(self.OPTIONS)
+
+        # called at the end of every poll cycle, e.g. for shard health reporting
+        self.cycle_callbacks: list[Callable[[], None]] = []
+        self.cycle_count = 0
+        self.egress_dropped = 0     # MQTT messages dropped by the egress queue, as last reported
+        self.diagnostics_interval = self.OPTIONS.diagnostics_interval
+        self._diagnostics_due = monotonic() + self.diagnostics_interval
 
         # Setup callbacks
         self.client_instantiator_callback = client_instantiator_callback
@@ -103,6 +126,7 @@ class App:
         for server in self.servers:
             success: bool = server.connect()
             if success:
+                self.plan_reads(server)
                 connected_servers.append(server) 
             else:
                 logger.error(f"Error Connecting to server {server.name}. Disable reading untill next loop")
@@ -122,8 +146,12 @@ class App:
             
         for server in disconnected_servers:
             self.mqtt_client.publish_availability(False, server)
+            self.reconnector.add(server)
+        self.reconnector.start()
 
-        self.message_handler = self.message_handler_instantiator(self.servers, self.mqtt_client)
+        self.message_handler = self.message_handler_instantiator(self.servers, self.mqtt_client,
+                                                                 write_debounce=self.OPTIONS.write_debounce,
+                                                                 write_dedupe=self.OPTIONS.write_dedupe)
         self.mqtt_client.message_handler = self.message_handler.decode_and_write
 
         atexit.register(exit_handler, self.servers + self.disconnected_servers,
@@ -145,72 +173,179 @@ class App:
         #     raise ValueError(
         #         f"In loop but no app servers or clients setup up or available")
 
-        # every read_interval seconds, read the registers and publish to mqtt
-        sleep(READ_INTERVAL)
+        # every pause_interval seconds (fixed rate), read the due registers and publish to mqtt
+        self.scheduler.reset()
         i = 0
         while True:
             self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
 
-            for server in self.servers:
-                sleep(READ_INTERVAL)
-                try: 
-                    for write_register_name, _ in server.write_parameters.items():
-                        sleep(READ_INTERVAL)
-                        if write_register_name == "Power Switch":
-                            continue
-                        value = server.read_registers(write_register_name)
-                        self.mqtt_client.publish_to_ha(
-                            write_register_name, value, server)
-                    logger.info(
-                        f"Published all Write parameter values for {server.name=}")
-                    for register_name, details in server.parameters.items():
-                        value = server.read_registers(register_name)
-                        self.mqtt_client.publish_to_ha(
-                            register_name, value, server)
-                    logger.info(
-                        f"Published all parameter values for {server.name=}")
-                except ReadException as rerr:
-                    logger.warning(f"Device returned error code response")
-                    self.disconnect_stack.append(server)
-                    continue
-                except ModbusException as e:
-                    logger.error(f"Modbus Error while reading from {server.name=}: {e} ")
-                    self.disconnect_stack.append(server)
-                    continue
+            # fast tier of every server first, then the other due tiers while the cycle deadline allows
+            self.poll_servers(fast=True)
+            self.poll_servers(fast=False)
+            self.mqtt_client.publish_state_documents(self.servers)
 
             for disconn_server in self.disconnect_stack:
-                self.servers.remove(disconn_server)
-                self.disconnected_servers.append(disconn_server)
-                self.mqtt_client.publish_availability(False, disconn_server)
+                self.mark_disconnected(disconn_server)
             self.disconnect_stack = []
 
-            # TODO: publish availability
-            sleep(self.pause_interval)
-
-            # try reconnecting to disconnected servers
-            for server in reversed(self.disconnected_servers):
-                logger.info("Retrying connection to %s" % server.name)
-                success: bool = server.connect()
-                if success:
-                    logger.info("Succesfully reconnected to %s" % server.name)
-                    self.servers.append(server) 
-                    self.disconnected_servers.remove(server)
+            # resume polling servers reconnected in the background
+            for server in self.reconnector.take_reconnected():
+                self.mark_reconnected(server)
 
-                    self.mqtt_client.publish_availability(True, server)
-                else:
-                    logger.error(f"Error Connecting to server %s. Disable reading untill next loop" % server.name)
-
-            self.sleep_if_midnight()
+            self.end_server_cycles(self.servers + self.disconnected_servers)
+            self.end_cycle()
 
             i += 1
             if loop_count is not None and i >= loop_count:
                 break
 
-    def sleep_if_midnight(self) -> None:
+            sleep(self.scheduler.wait_time())
+            if self.sleep_if_midnight():
+                self.scheduler.reset()
+
+    def poll_servers(self, fast: bool) -> None:
+        """ Poll the fast, or all other due, tiers of every connected server. Failing servers are noted on the disconnect stack. """
+        for server in self.servers:
+            if server in self.disconnect_stack:
+                continue
+            try: 
+                self.poll_server(server, fast)
+            except ReadException as rerr:
+                logger.warning(f"Device {server.name} returned error code response: {rerr}")
+                self.disconnect_stack.append(server)
+            except ModbusException as e:
+                logger.error(f"Modbus Error while reading from {server.name=}: {e} ")
+                self.disconnect_stack.append(server)
+
+    def poll_server(self, server: Server, fast: bool) -> None:
+        """ Read the due PollTier.FAST tier (fast=True) or other due tiers of server, and publish the values.
+
+            Other tiers are deferred to a later cycle once the cycle deadline has passed.
+        """
+        start = perf_counter()
+        try:
+            self._poll_server(server, fast)
+        finally:
+            server.metrics.observe_poll(perf_counter() - start)
+
+    def _poll_server(self, server: Server, fast: bool) -> None:
+        now = self.scheduler.sample_instant
+        schedule = server.poll_schedule
+        polled = []
+        for tier in schedule.due(now):
+            if (tier == PollTier.FAST) != fast:
+                continue
+            if not fast and self.scheduler.remaining() <= 0:
+                logger.info(f"Cycle deadline reached. Deferring {tier.value} parameters of {server.name} to the next cycle")
+                break
+            for block in schedule.plans[tier]:
+                self.publish_values(server, server.read_block(block))
+            schedule.polled(tier, now)
+            polled.append(tier)
+        if polled:
+            logger.info(
+                f"Published {', '.join(tier.value for tier in polled)} parameter values for {server.name=}")
+
+    def publish_values(self, server: Server, values: dict[str, Any]) -> None:
+        """ Publish the values read from server that pass the change filter.
+            In JSON state mode they are staged in the server's state document, published at the end of the cycle. """
+        start = perf_counter()
+        self.message_handler.shadow.record(server, values)
+        descriptors = server.descriptors
+        for register_name, value in values.items():
+            if not self.change_filter.should_publish(server.name, register_name, value, descriptors[register_name].device_class):
+                continue
+            if self.mqtt_client.state_mode == "json":
+                self.mqtt_client.stage_state(register_name, value, server)     # published once per cycle
+            else:
+                self.mqtt_client.publish_to_ha(register_name, value, server)
+        server.metrics.observe_publish(perf_counter() - start)
+
+    def end_server_cycles(self, servers: list[Server]) -> None:
+        """ End the poll cycle of servers in their metrics. """
+        for server in servers:
+            server.metrics.end_cycle()
+
+    def end_cycle(self) -> None:
+        """ Bookkeeping once per poll cycle of all servers. """
+        self.cycle_count += 1
+        self.publish_stale_values()
+        stats = self.mqtt_client.egress.stats()
+        if stats["dropped"] > self.egress_dropped:
+            logger.warning(f"MQTT egress queue full, dropped {stats['dropped'] - self.egress_dropped} state messages. {stats=}")
+            self.egress_dropped = stats["dropped"]
+        self.mqtt_client.log_throughput()
+        self.publish_diagnostics()
+        for callback in self.cycle_callbacks:
+            callback()
+
+    def publish_stale_values(self) -> None:
+        """ Publish again the values of connected servers not published for max_silence seconds,
+            also those of tiers not read that often, e.g. PollTier.ONCE. See ChangeFilter.stale """
+        servers = {server.name: server for server in self.servers}
+        for server_name, register_name, value in self.change_filter.stale():
+            server = servers.get(server_name)
+            if server is None:
+                continue
+            if self.mqtt_client.state_mode == "json":
+                self.mqtt_client.stage_state(register_name, value, server)
+            else:
+                self.mqtt_client.publish_to_ha(register_name, value, server)
+        self.mqtt_client.publish_state_documents(self.servers)
+
+    def publish_diagnostics(self) -> None:
+        """ Publish a summary of the request latencies and errors of every server, every diagnostics_interval seconds. """
+        if self.diagnostics_interval <= 0 or monotonic() < self._diagnostics_due:
+            return
+        self._diagnostics_due = monotonic() + self.diagnostics_interval
+        for server in self.servers + self.disconnected_servers:
+            summary = server.metrics.summary()
+            logger.debug(f"Diagnostics of {server.name}: {summary}")
+            self.mqtt_client.publish_diagnostics(server, summary)
+
+    def mark_disconnected(self, server: Server) -> None:
+        """ Stop polling a server after a read failure, publish it as offline and reconnect in the background. """
+        self.servers.remove(server)
+        self.disconnected_servers.append(server)
+        self.mqtt_client.publish_availability(False, server)
+        self.message_handler.shadow.forget(server)
+        self.change_filter.forget(server.name)      # not republished while offline, see publish_stale_values
+        self.reconnector.add(server)
+
+    def mark_reconnected(self, server: Server) -> None:
+        """ Resume polling a server after a successful server.connect() and publish it as online. """
+        logger.info("Succesfully reconnected to %s" % server.name)
+        self.plan_reads(server)
+        self.servers.append(server) 
+        self.disconnected_servers.remove(server)
+        self.change_filter.forget(server.name)
+        server.metrics.mark_reconnected()
+
+        self.mqtt_client.publish_availability(True, server)
+
+    def plan_reads(self, server: Server) -> None:
+        """ Plan block reads per poll tier of all parameters and write parameters of a connected server. """
+        server.compile_descriptors(self.OPTIONS.mqtt_base_topic)
+        if server.address_map is None:
+            server.address_map = AddressMap.for_device(server.model, server.serial)
+        parameter_names = [name for name in server.write_parameters if name != "Power Switch"]
+        parameter_names += list(server.parameters)
+        overrides = {o.parameter: PollTier(o.tier) for o in self.OPTIONS.poll_overrides
+                     if type(server) is ServerTypes[o.server_type].value}
+        for name in overrides:
+            if name not in parameter_names:
+                logger.warning(f"Poll tier override for unknown parameter {name} of server {server.name}")
+        server.build_poll_schedule(parameter_names, self.poll_intervals, overrides,
+                                   max_gap=self.OPTIONS.read_max_gap)
+
+    def sleep_if_midnight(self) -> bool:
         """
         Sleeps if the current time is within 3 minutes before or 5 minutes after midnight.
         Uses efficient sleep intervals instead of busy waiting.
+
+        Returns True if it slept.
         """
+        slept = False
         while self.midnight_sleep_enabled:
             current_time = datetime.now()
             is_before_midnight = current_time.hour == 23 and current_time.minute >= 57
@@ -234,10 +369,21 @@ class App:
             sleep_duration = min(
                 30, (next_check - current_time).total_seconds())
             sleep(sleep_duration)
+            slept = True
+
+        return slept
 
 
 def instantiate_clients(OPTIONS: AppOptions) -> list[Client]:
-    return [Client(cl_options) for cl_options in OPTIONS.clients]
+    if OPTIONS.runtime == "async":
+        return [AsyncClient(cl_options) for cl_options in OPTIONS.clients]
+    clients = [Client(cl_options) for cl_options in OPTIONS.clients]
+    if OPTIONS.modbus_recording:
+        from .modbus_recording import Recorder, RecordingClient
+        recorder = Recorder.in_data_path(OPTIONS.servers, max_bytes=OPTIONS.modbus_recording_max_size * 1024 ** 2,
+                                         max_files=OPTIONS.modbus_recording_max_files)
+        clients = [RecordingClient(client, recorder) for client in clients]
+    return clients
 
 
 def instantiate_servers(OPTIONS: AppOptions, clients: list[Client]) -> list[Server]:
@@ -250,9 +396,17 @@ def instantiate_servers(OPTIONS: AppOptions, clients: list[Client]) -> list[Serv
 if __name__ == "__main__":
     if len(sys.argv) <= 1:  # deployed on homeassistant
         app = App(instantiate_clients, instantiate_servers, MessageHandler)
+        if app.OPTIONS.shards > 1:
+            from .sharding import ShardSupervisor
+            ShardSupervisor(app.OPTIONS, instantiate_clients, instantiate_servers, MessageHandler).run()
+            sys.exit(0)
         app.setup()
-        app.connect()
-        app.loop()
+        if app.OPTIONS.runtime == "async":
+            from .async_runtime import AsyncRuntime
+            AsyncRuntime(app).run()
+        else:
+            app.connect()
+            app.loop()
     else:                   # running locally
         from .client import SpoofClient
         app = App(instantiate_clients, instantiate_servers, MessageHandler, sys.argv[1])
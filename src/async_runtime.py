@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from time import perf_counter
+
+from pymodbus import ModbusException
+
+from .client import AsyncClient, Client, ILLEGAL_DATA_ADDRESS
+from .cycle_scheduler import CycleScheduler
+from .enums import PollTier
+from .server import ReadException, Server
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """
+        asyncio polling engine. Selected with the add-on option runtime: async.
+
+        Each client (Modbus bus/ gateway) is polled by its own task and cycle scheduler, so servers on different
+        clients never wait on each other and a full cycle takes as long as the slowest bus,
+        not the sum of all buses. Servers sharing a client are still read one after the other.
+
+        Reuses the App for setup, MQTT and bookkeeping of connected/ disconnected servers.
+        App.end_cycle runs once per cycle, when every client completed it.
+        Requires clients instantiated as client.AsyncClient (see app.instantiate_clients).
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.client_cycles: dict[Client, int] = {}     # cycles completed by each client task
+        self.cycles_ended = 0
+
+    def run(self, loop_count: int | None = None) -> None:
+        asyncio.run(self.main(loop_count))
+
+    async def main(self, loop_count: int | None = None) -> None:
+        loop = asyncio.get_running_loop()
+        self.client_cycles = {client: 0 for client in self.app.clients}
+        for client in self.app.clients:
+            if isinstance(client, AsyncClient):
+                client.bind(loop)
+
+        # App.connect uses the blocking client interface, bridged back onto this loop
+        await asyncio.to_thread(self.app.connect)
+
+        try:
+            await asyncio.gather(*(self.poll_client(client, loop_count) for client in self.app.clients))
+        finally:
+            # the pymodbus clients need the loop to close, and asyncio.run closes it on return
+            for client in self.app.clients:
+                client.close()
+
+    async def poll_client(self, client: Client, loop_count: int | None = None) -> None:
+        """ Poll all servers connected to client at fixed-rate sample instants, every pause_interval. """
+        scheduler = CycleScheduler(self.app.pause_interval)
+        i = 0
+        while True:
+            await asyncio.to_thread(self.app.mqtt_client.ensure_connected, self.app.OPTIONS.mqtt_reconnect_attempts)
+
+            # fast tier of every server first, then the other due tiers while the cycle deadline allows
+            servers = [s for s in self.app.servers if s.connected_client is client]
+            for fast in (True, False):
+                for server in [s for s in servers if s in self.app.servers]:    # skip servers disconnected in the fast pass
+                    try:
+                        await self.poll_server(server, fast, scheduler)
+                    except ReadException as rerr:
+                        logger.warning(f"Device {server.name} returned error code response: {rerr}")
+                        self.app.mark_disconnected(server)
+                    except ModbusException as e:
+                        logger.error(f"Modbus Error while reading from {server.name=}: {e} ")
+                        self.app.mark_disconnected(server)
+            self.app.mqtt_client.publish_state_documents(servers)
+
+            # resume polling servers reconnected in the background (App.reconnector)
+            for server in self.app.reconnector.take_reconnected():
+                self.app.mark_reconnected(server)
+
+            self.app.end_server_cycles(servers)
+            self.client_cycles[client] += 1
+            self.end_cycles()
+
+            i += 1
+            if loop_count is not None and i >= loop_count:
+                break
+
+            await asyncio.sleep(scheduler.wait_time())
+            if await asyncio.to_thread(self.app.sleep_if_midnight):
+                scheduler.reset()
+
+    def end_cycles(self) -> None:
+        """ Run the App's cycle bookkeeping (cycle count, callbacks, egress and diagnostics) for every cycle
+            that all clients completed since the last call. """
+        while min(self.client_cycles.values()) > self.cycles_ended:
+            self.cycles_ended += 1
+            self.app.end_cycle()
+
+    async def poll_server(self, server: Server, fast: bool, scheduler: CycleScheduler) -> None:
+        """ Read the due fast, or other due, tiers of server and publish the values. See App.poll_server. """
+        client = server.connected_client
+        start = perf_counter()
+        try:
+            await self._poll_server(server, fast, scheduler, client)
+        finally:
+            server.metrics.observe_poll(perf_counter() - start)
+
+    async def _poll_server(self, server: Server, fast: bool, scheduler: CycleScheduler, client: Client) -> None:
+        now = scheduler.sample_instant
+        schedule = server.poll_schedule
+        polled = []
+        for tier in schedule.due(now):
+            if (tier == PollTier.FAST) != fast:
+                continue
+            if not fast and scheduler.remaining() <= 0:
+                logger.info(f"Cycle deadline reached. Deferring {tier.value} parameters of {server.name} to the next cycle")
+                break
+            for block in schedule.plans[tier]:
+                read_start = perf_counter()
+                error = True
+                try:
+                    if isinstance(client, AsyncClient):
+                        result = await client.read_async(block.address, block.count, server.modbus_id, block.register_type)
+                    else:
+                        result = client.read(block.address, block.count, server.modbus_id, block.register_type)
+                    error = result.isError()
+                finally:
+                    server.metrics.observe_read(block.register_type, block.address, block.count,
+                                                perf_counter() - read_start, error)
+                try:
+                    decode_start = perf_counter()
+                    values = server.decode_block(block, result)
+                    server.metrics.observe_decode(perf_counter() - decode_start)
+                except ReadException as e:
+                    if e.exception_code != ILLEGAL_DATA_ADDRESS or server.address_map is None:
+                        raise
+                    # probing is rare: run it with blocking reads, bridged back onto this loop
+                    values = await asyncio.to_thread(server.bisect_block, block)
+                self.app.publish_values(server, values)
+            schedule.polled(tier, now)
+            polled.append(tier)
+        if polled:
+            logger.info(
+                f"Published {', '.join(tier.value for tier in polled)} parameter values for {server.name=}")
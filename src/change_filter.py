@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+import logging
+from math import inf
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from .enums import DeviceClass
+from .options import AppOptions
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Deadband:
+    """ Changes a numeric value must exceed to be published: absolute units, or a fraction of the last published value. """
+    absolute: float = 0
+    relative: float = 0
+
+    def exceeded(self, last: float, value: float) -> bool:
+        threshold = max(self.absolute, self.relative * abs(last))
+        if threshold == 0:
+            return value != last
+        return abs(value - last) > threshold
+
+
+NO_DEADBAND = Deadband()
+
+
+class ChangeFilter:
+    """
+        Decides which values read are published, so unchanged values do not flood the broker and the HA recorder.
+
+        A value is published if it is the first of its parameter, or it changed by more than the deadband
+        of its parameter (else of its device class) and at least min_interval seconds passed since the last publish.
+        Unchanged values are republished after max_silence seconds, so HA never sees them as stale:
+        when read again, or by stale() if not read that often, e.g. of PollTier.ONCE.
+    """
+
+    def __init__(self,
+                 deadbands_by_device_class: Optional[dict[DeviceClass, Deadband]] = None,
+                 deadbands_by_parameter: Optional[dict[str, Deadband]] = None,
+                 min_interval: float = 0,
+                 max_silence: float = 300,
+                 enabled: bool = True,
+                 clock: Callable[[], float] = monotonic) -> None:
+        self.deadbands_by_device_class = deadbands_by_device_class or {}
+        self.deadbands_by_parameter = deadbands_by_parameter or {}
+        self.min_interval = min_interval
+        self.max_silence = max_silence
+        self.enabled = enabled
+        self.clock = clock
+        self._last: dict[tuple[str, str], tuple[Any, float]] = {}   # (server, parameter): (value, time published)
+        self._next_stale = 0.0      # earliest time a value recorded can become stale
+        self.published = 0
+        self.suppressed = 0
+
+    @classmethod
+    def from_options(cls, opts: AppOptions) -> "ChangeFilter":
+        by_device_class = {DeviceClass(d.device_class): Deadband(d.absolute, d.relative)
+                           for d in opts.deadbands if d.device_class}
+        by_parameter = {d.parameter: Deadband(d.absolute, d.relative)
+                        for d in opts.deadbands if d.parameter}
+        return cls(by_device_class, by_parameter, opts.publish_min_interval, opts.publish_max_silence,
+                   enabled=opts.publish_on_change)
+
+    def should_publish(self, server_name: str, parameter_name: str, value: Any,
+                       device_class: Optional[DeviceClass] = None) -> bool:
+        """ Whether to publish a value read. Values passed are recorded as published. """
+        if not self.enabled:
+            self.published += 1
+            return True
+
+        key = (server_name, parameter_name)
+        now = self.clock()
+        last = self._last.get(key)
+        if last is not None:
+            last_value, published_at = last
+            elapsed = now - published_at
+            if not (0 < self.max_silence <= elapsed) and (elapsed < self.min_interval
+                                                         or not self._changed(parameter_name, device_class, last_value, value)):
+                self.suppressed += 1
+                return False
+
+        self._last[key] = (value, now)
+        self.published += 1
+        return True
+
+    def _changed(self, parameter_name: str, device_class: Optional[DeviceClass], last: Any, value: Any) -> bool:
+        numeric = (isinstance(value, (int, float)) and isinstance(last, (int, float))
+                   and not isinstance(value, bool) and not isinstance(last, bool))
+        if not numeric:
+            return value != last
+        deadband = self.deadbands_by_parameter.get(parameter_name) or self.deadbands_by_device_class.get(device_class, NO_DEADBAND)  # type: ignore
+        return deadband.exceeded(last, value)
+
+    def stale(self) -> list[tuple[str, str, Any]]:
+        """ (server, parameter, value) of the values last published max_silence seconds ago or more,
+            to be published again. They are recorded as published. """
+        if not self.enabled or self.max_silence <= 0:
+            return []
+        now = self.clock()
+        if now < self._next_stale:
+            return []
+        stale = []
+        next_stale = inf
+        for key, (value, published_at) in self._last.items():
+            if published_at + self.max_silence <= now:
+                stale.append((*key, value))
+                self._last[key] = (value, now)
+                published_at = now
+            next_stale = min(next_stale, published_at + self.max_silence)
+        self._next_stale = next_stale   # values recorded later, at or after now, are stale no earlier
+        self.published += len(stale)
+        return stale
+
+    def forget(self, server_name: str) -> None:
+        """ Publish every value of a server again, e.g. after it reconnected. """
+        for key in [key for key in self._last if key[0] == server_name]:
+            del self._last[key]
@@ -1,17 +1,78 @@
 from .enums import RegisterTypes
 from .options import ModbusTCPOptions, ModbusRTUOptions
-from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+from pymodbus.client import ModbusSerialClient, ModbusTcpClient, AsyncModbusSerialClient, AsyncModbusTcpClient
 from pymodbus.pdu import ExceptionResponse
 from pymodbus import ModbusException
+from pymodbus.exceptions import ConnectionException
+import asyncio
+from contextlib import contextmanager, nullcontext
 import logging
+import threading
 from time import sleep
 logger = logging.getLogger(__name__)
 
+# Modbus exception code for a read or write of registers the device does not implement
+ILLEGAL_DATA_ADDRESS = 2
+
 from pymodbus.logging import pymodbus_apply_logging_config
 
 # pymodbus_apply_logging_config()
 
 
+class PriorityLock:
+    """
+        Reentrant lock on which urgent acquirers (MQTT commands) go before the normal acquirers (poll reads)
+        waiting at the same time. Normal acquirers also wait while an urgent one is queued, so a command
+        waits for at most the one transaction in flight.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition(threading.Lock())
+        self._owner: int | None = None
+        self._depth = 0
+        self._urgent_waiting = 0
+
+    def acquire(self, urgent: bool = False) -> None:
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner == me:
+                self._depth += 1
+                return
+            if urgent:
+                self._urgent_waiting += 1
+            try:
+                while self._owner is not None or (not urgent and self._urgent_waiting):
+                    self._condition.wait()
+            finally:
+                if urgent:
+                    self._urgent_waiting -= 1
+            self._owner, self._depth = me, 1
+
+    def release(self) -> None:
+        with self._condition:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("PriorityLock released by a thread that does not hold it")
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def urgent(self):
+        self.acquire(urgent=True)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def __enter__(self) -> "PriorityLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
 class Client:
     """
         Modbus client representation: name, nickname (ha_display_name), and pymodbus client.
@@ -32,6 +93,8 @@ class Client:
         """
         self.name = cl_options.name
         self.client: ModbusSerialClient | ModbusTcpClient
+        # serialises transactions from the polling, reconnect and command threads on the shared connection
+        self.lock = PriorityLock()
 
         if isinstance(cl_options, ModbusTCPOptions):
             self.client = ModbusTcpClient(
@@ -58,19 +121,18 @@ class Client:
         Returns:
             ModbusPDU: modbus client response
         """        
-        if not register_type == RegisterTypes.HOLDING_REGISTER:
-            logger.info(f"unsupported write register type {register_type}")
-            raise ValueError(f"unsupported register type {register_type}")
-        
-        result = self.client.write_registers(address=address-1,
-                                            values=values,
-                                            device_id=slave_id)
-        
-        if result.isError():
-            self._handle_error_response(result)
-            raise ModbusException(f"Error writing register at address {address=} on {slave_id=}")
-    
-        return result
+        with self.lock:
+            try:
+                result = self._write_request(values, address, slave_id, register_type)
+            except OSError as exc:
+                logger.error(f"Connection error writing slave {slave_id} at address {address}: {exc}")
+                self.client.close()     # still holding the lock: no other transaction is in flight
+                raise ConnectionException(str(exc)) from exc
+        return self._check_write_result(result, address, slave_id)
+
+    def command_priority(self):
+        """ Context in which the transactions of the calling thread go before waiting poll reads, see PriorityLock. """
+        return self.lock.urgent()
 
     def read(self, address, count, slave_id, register_type):
         """
@@ -85,28 +147,55 @@ class Client:
         Raises:
             ModbusException: Re-raised for connection/communication failures
         """
-        try:
-            if register_type == RegisterTypes.HOLDING_REGISTER:
-                result = self.client.read_holding_registers(address=address-1,
-                                                            count=count,
-                                                            device_id=slave_id)
-            elif register_type == RegisterTypes.INPUT_REGISTER:
-                result = self.client.read_input_registers(address=address-1,
-                                                          count=count,
-                                                          device_id=slave_id)
-            else:
-                logger.info(f"unsupported register type {register_type}")
-                raise ValueError(f"unsupported register type {register_type}")
-            return result
-        except ModbusException as exc:
-            logger.error(f"ModbusException reading slave {slave_id} at address {address}: {exc}")
-            raise
+        with self.lock:
+            try:
+                return self._read_request(address, count, slave_id, register_type)
+            except ModbusException as exc:
+                logger.error(f"ModbusException reading slave {slave_id} at address {address}: {exc}")
+                raise
+            except OSError as exc:     # e.g. the connection reset by the gateway while waiting for the response
+                logger.error(f"Connection error reading slave {slave_id} at address {address}: {exc}")
+                # reconnected by the next request. Closed while holding the lock: no other transaction is in flight
+                self.client.close()
+                raise ConnectionException(str(exc)) from exc
+
+    def _read_request(self, address, count, slave_id, register_type):
+        """ Issue the pymodbus read call for register_type. Returns a coroutine for async pymodbus clients. """
+        if register_type == RegisterTypes.HOLDING_REGISTER:
+            return self.client.read_holding_registers(address=address-1,
+                                                      count=count,
+                                                      device_id=slave_id)
+        elif register_type == RegisterTypes.INPUT_REGISTER:
+            return self.client.read_input_registers(address=address-1,
+                                                    count=count,
+                                                    device_id=slave_id)
+        else:
+            logger.info(f"unsupported register type {register_type}")
+            raise ValueError(f"unsupported register type {register_type}")
+
+    def _write_request(self, values: list[int], address: int, slave_id: int, register_type):
+        """ Issue the pymodbus write call. Returns a coroutine for async pymodbus clients. """
+        if not register_type == RegisterTypes.HOLDING_REGISTER:
+            logger.info(f"unsupported write register type {register_type}")
+            raise ValueError(f"unsupported register type {register_type}")
+
+        return self.client.write_registers(address=address-1,
+                                           values=values,
+                                           device_id=slave_id)
+
+    def _check_write_result(self, result, address: int, slave_id: int):
+        if result.isError():
+            self._handle_error_response(result)
+            raise ModbusException(f"Error writing register at address {address=} on {slave_id=}")
+
+        return result
 
     def connect(self, num_retries=2, sleep_interval=3) -> None:
         logger.info(f"Connecting to client {self}")
 
         for i in range(num_retries):
-            connected: bool = self.client.connect()
+            with self.lock:
+                connected: bool = self.client.connect()
             if connected:
                 break
 
@@ -137,7 +226,7 @@ class Client:
             # Modbus exception codes and their meanings
             exception_messages = {
                 1: "Illegal Function",
-                2: "Illegal Data Address",
+                ILLEGAL_DATA_ADDRESS: "Illegal Data Address",
                 3: "Illegal Data Value",
                 4: "Slave Device Failure",
                 5: "Acknowledge",
@@ -157,6 +246,112 @@ class Client:
                 f"Non Standard Modbus Exception. Cannot Decode Response")
 
 
+class AsyncClient(Client):
+    """
+        Modbus client backed by the pymodbus asyncio clients, used by the async runtime.
+
+        The coroutines read_async/ write_async/ connect_async are awaited on the event loop the client is bound to.
+        The blocking Client interface (read, write, connect) is bridged onto that loop, so Server.connect
+        and MQTT-triggered writes keep working from worker threads. Never call the blocking interface
+        from the event loop thread itself.
+    """
+    # created by bind. The request helpers shared with Client return its coroutines
+    client: AsyncModbusSerialClient | AsyncModbusTcpClient  # type: ignore[assignment]
+
+    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions):
+        self.name = cl_options.name
+        self.options = cl_options
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def command_priority(self):
+        """ Bridged commands are scheduled on the event loop, between the awaited requests of the poll. """
+        return nullcontext()
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """ Bind to the running event loop, on which all pymodbus calls are made.
+            The pymodbus asyncio clients are created here, as they require the running loop. """
+        self.loop = loop
+        cl_options = self.options
+        if isinstance(cl_options, ModbusTCPOptions):
+            self.client = AsyncModbusTcpClient(
+                host=cl_options.host, port=cl_options.port)
+        elif isinstance(cl_options, ModbusRTUOptions):
+            self.client = AsyncModbusSerialClient(port=cl_options.port, baudrate=cl_options.baudrate,
+                                                  bytesize=cl_options.bytesize, parity='Y' if cl_options.parity else 'N',
+                                                  stopbits=cl_options.stopbits)
+
+    async def read_async(self, address, count, slave_id, register_type):
+        try:
+            return await self._read_request(address, count, slave_id, register_type)
+        except ModbusException as exc:
+            logger.error(f"ModbusException reading slave {slave_id} at address {address}: {exc}")
+            raise
+        except OSError as exc:     # e.g. the connection reset by the gateway while waiting for the response
+            logger.error(f"Connection error reading slave {slave_id} at address {address}: {exc}")
+            self.client.close()     # reconnected by the next request
+            raise ConnectionException(str(exc)) from exc
+
+    async def write_async(self, values: list[int], address: int, slave_id: int, register_type):
+        try:
+            result = await self._write_request(values, address, slave_id, register_type)
+        except OSError as exc:
+            logger.error(f"Connection error writing slave {slave_id} at address {address}: {exc}")
+            self.client.close()
+            raise ConnectionException(str(exc)) from exc
+        return self._check_write_result(result, address, slave_id)
+
+    async def connect_async(self, num_retries=2, sleep_interval=3) -> None:
+        logger.info(f"Connecting to client {self}")
+
+        for i in range(num_retries):
+            connected: bool = await self.client.connect()
+            if connected:
+                break
+
+            logging.info(f"Couldn't connect to {self}. Retrying")
+            await asyncio.sleep(sleep_interval)
+
+        if not connected:
+            logger.error(
+                f"Client Connection Issue after {num_retries} attempts.")
+            raise ConnectionError(f"Client {self} Connection Issue")
+
+        logger.info(f"Sucessfully connected to {self}")
+
+    def read(self, address, count, slave_id, register_type):
+        return self._run(self.read_async(address, count, slave_id, register_type))
+
+    def write(self, values: list[int], address: int, slave_id: int, register_type):
+        return self._run(self.write_async(values, address, slave_id, register_type))
+
+    def connect(self, num_retries=2, sleep_interval=3) -> None:
+        self._run(self.connect_async(num_retries, sleep_interval))
+
+    def close(self):
+        """ Close the pymodbus client on the bound event loop.
+
+            Nothing to do once the loop is closed: AsyncRuntime.main closes its clients before the loop ends.
+        """
+        if self.loop is None or self.loop.is_closed():
+            return
+        logger.info(f"Closing connection to {self}")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.client.close()
+        else:
+            self.loop.call_soon_threadsafe(self.client.close)
+
+    def _run(self, coro):
+        """ Run coro on the bound event loop from another thread and wait for its result. """
+        if self.loop is None:
+            coro.close()
+            raise RuntimeError(f"AsyncClient {self} is not bound to an event loop")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
 class SpoofClient(Client):
     """
         Spoofed Modbus client representation: name, nickname (ha_display_name), and pymodbus client.
@@ -172,6 +367,7 @@ class SpoofClient(Client):
 
     def __init__(self, name: str):
         self.name = name
+        self.lock = PriorityLock()
 
     def read(self, address, count, slave_id, register_type):
         logger.info(f"SPOOFING READ {slave_id=} {address=}")
@@ -0,0 +1,124 @@
+"""
+    Big-endian Modbus register codecs, shared by the GoodWe server types.
+
+    Modbus is big-endian ("MODBUS uses a 'big-Endian' to represent addresses and data items"):
+    the first register of a multi-register value is the most significant word.
+    Strings are ASCII, two characters per register, padded with null bytes.
+
+    Values are decoded straight from a buffer holding the packed registers of a whole read
+    (see registers_to_buffer) with precompiled struct.Struct objects.
+"""
+import struct
+from typing import Any, Callable
+
+from .enums import DataType
+
+# precompiled structs of the fixed size data types
+STRUCTS: dict[DataType, struct.Struct] = {
+    DataType.U16: struct.Struct(">H"),
+    DataType.I16: struct.Struct(">h"),
+    DataType.U32: struct.Struct(">I"),
+    DataType.I32: struct.Struct(">i"),
+    DataType.U64: struct.Struct(">Q"),
+    DataType.I64: struct.Struct(">q"),
+}
+
+RANGES: dict[DataType, tuple[int, int]] = {
+    DataType.U16: (0, 2**16 - 1),
+    DataType.I16: (-2**15, 2**15 - 1),
+    DataType.U32: (0, 2**32 - 1),
+    DataType.I32: (-2**31, 2**31 - 1),
+    DataType.U64: (0, 2**64 - 1),
+    DataType.I64: (-2**63, 2**63 - 1),
+}
+
+
+# structs packing 0..125 (the maximum read count) registers, indexed by count
+_REGISTERS_STRUCTS = [struct.Struct(f">{count}H") for count in range(126)]
+
+
+def _registers_struct(count: int) -> struct.Struct:
+    if count < len(_REGISTERS_STRUCTS):
+        return _REGISTERS_STRUCTS[count]
+    return struct.Struct(f">{count}H")
+
+
+def registers_to_buffer(registers: list[int]) -> bytes:
+    """ Pack 16-bit registers into a big-endian byte buffer. """
+    return _registers_struct(len(registers)).pack(*registers)
+
+
+def buffer_to_registers(buffer: bytes) -> list[int]:
+    """ Unpack a big-endian byte buffer of even length into 16-bit registers. """
+    return list(_registers_struct(len(buffer) // 2).unpack(buffer))
+
+
+def decode_ascii(raw: bytes) -> str:
+    """ Decode an ASCII register string, stripping null padding and whitespace. Non-ASCII bytes are dropped. """
+    return raw.decode("ascii", errors="ignore").rstrip("\x00").strip()
+
+
+def buffer_decoder(dtype: DataType, count: int) -> Callable[[bytes, int], Any]:
+    """ Return a decoder of a value of dtype, spanning count registers, at a byte offset of a register buffer.
+        A decoder of a dtype that cannot be decoded raises NotImplementedError when called. """
+    if dtype == DataType.UTF8:
+        unpack_string = struct.Struct(f">{2 * count}s").unpack_from
+        return lambda buffer, offset: decode_ascii(unpack_string(buffer, offset)[0])
+
+    if dtype not in STRUCTS:
+        def not_implemented(buffer: bytes, offset: int) -> Any:
+            raise NotImplementedError(f"Data type {dtype} decoding not implemented")
+        return not_implemented
+    unpack_from = STRUCTS[dtype].unpack_from
+    return lambda buffer, offset: unpack_from(buffer, offset)[0]
+
+
+def decode(registers: list[int], dtype: DataType) -> Any:
+    """Decode a single value from the registers read.
+
+    Raises:
+        NotImplementedError: if dtype cannot be decoded
+    """
+    dtype_struct = STRUCTS.get(dtype)
+    if dtype_struct is not None:
+        return dtype_struct.unpack_from(_registers_struct(len(registers)).pack(*registers))[0]
+    if dtype == DataType.UTF8:
+        return decode_ascii(registers_to_buffer(registers))
+    raise NotImplementedError(f"Data type {dtype} decoding not implemented")
+
+
+def encode(value: Any, dtype: DataType) -> list[int]:
+    """Encode a value into the 16-bit registers to write.
+
+    Floats are truncated to integers for the integer data types. Strings are encoded
+    as ASCII and padded with a null byte to a whole number of registers.
+
+    Raises:
+        ValueError: if the value is out of range for dtype, or a string is not ASCII
+        NotImplementedError: if dtype cannot be encoded
+    """
+    if dtype == DataType.UTF8:
+        if not isinstance(value, str):
+            value = str(value)
+        try:
+            byte_data = value.encode("ascii")
+        except UnicodeEncodeError as e:
+            raise ValueError(f"String '{value}' contains non-ASCII characters. "
+                             f"GoodWe registers require ASCII encoding only.") from e
+        if len(byte_data) % 2 != 0:
+            byte_data += b"\x00"
+        return buffer_to_registers(byte_data)
+
+    dtype_struct = STRUCTS.get(dtype)
+    if dtype_struct is None:
+        raise NotImplementedError(f"Data type {dtype} encoding not implemented")
+    value = int(value)
+    min_value, max_value = RANGES[dtype]
+    if not min_value <= value <= max_value:
+        raise ValueError(f"Cannot write {value=} to {dtype.value} register (range {min_value} to {max_value})")
+    return buffer_to_registers(dtype_struct.pack(value))
+
+
+def encoder(dtype: DataType) -> Callable[[Any], list[int]]:
+    """ Return the encoder of values of dtype. See encode. """
+    return lambda value: encode(value, dtype)
@@ -0,0 +1,42 @@
+import logging
+from queue import Queue
+import threading
+from typing import Callable
+
+from .client import Client
+
+logger = logging.getLogger(__name__)
+
+
+class CommandExecutor:
+    """
+        Runs the MQTT commands of one Modbus client in order on its own worker thread,
+        so writes and their read-backs never block the paho network thread.
+
+        Each command holds the client's connection with priority over the poll reads for all of its
+        transactions, see Client.command_priority: it starts at the next request boundary of the poll.
+    """
+
+    def __init__(self, client: Client) -> None:
+        self.client = client
+        self._queue: Queue[tuple[Callable, tuple]] = Queue()
+        self._thread = threading.Thread(target=self._run, name=f"commands-{client}", daemon=True)
+        self._thread.start()
+
+    def submit(self, command: Callable, *args) -> None:
+        self._queue.put((command, args))
+
+    def join(self) -> None:
+        """ Block until every command submitted has run. """
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            command, args = self._queue.get()
+            try:
+                with self.client.command_priority():
+                    command(*args)
+            except Exception as e:
+                logger.error(f"Exception while executing command on client {self.client}: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,61 @@
+import logging
+from math import ceil, inf
+from time import monotonic
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class CycleScheduler:
+    """
+        Fixed-rate poll cycle deadlines on a monotonic clock.
+
+        Cycles start at fixed sample instants start + k * period, independent of how long the
+        reads take. When a cycle overruns its period, the overrun is reported and the missed
+        sample instants are dropped, so lag never accumulates.
+        A period of 0 runs cycles back to back, without a deadline.
+    """
+
+    def __init__(self, period: float, clock: Callable[[], float] = monotonic) -> None:
+        self.period = period
+        self.clock = clock
+        self.overruns = 0           # cycles that did not finish within their period
+        self.skipped = 0            # sample instants dropped because of overruns
+        self.reset()
+
+    def reset(self) -> None:
+        """ Start a new cycle now, e.g. after the midnight sleep. """
+        self.deadline = self.clock() + self.period
+
+    @property
+    def sample_instant(self) -> float:
+        """ Sample instant at which the current cycle started, on the fixed grid whatever the wake-up delay.
+            Poll tiers are scheduled from it, see PollSchedule. """
+        return self.deadline - self.period
+
+    def remaining(self) -> float:
+        """ Seconds left until the current cycle's deadline. Negative once overrun. Infinite without a period. """
+        if self.period <= 0:
+            return inf
+        return self.deadline - self.clock()
+
+    def wait_time(self) -> float:
+        """Finish the current cycle. Returns the seconds to wait until the next sample instant.
+
+        If the deadline has passed, the overrun is logged and every missed sample instant is skipped.
+        """
+        now = self.clock()
+        if self.period <= 0:    # back to back cycles: the next one starts now
+            self.deadline = now
+            return 0.0
+        next_instant = self.deadline
+        if now > next_instant:
+            missed = ceil((now - next_instant) / self.period)
+            self.overruns += 1
+            self.skipped += missed
+            logger.warning(f"Poll cycle overran its {self.period}s period by {now - next_instant:.3f}s. "
+                           f"Skipping {missed} sample instant(s) ({self.overruns} overruns in total)")
+            next_instant += missed * self.period
+
+        self.deadline = next_instant + self.period
+        return max(0.0, next_instant - now)
@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from .codec import registers_to_buffer
+from .enums import DataType, DeviceClass, HAEntityType, Parameter, RegisterTypes, WriteParameter, device_class_to_rounding
+from .helpers import slugify
+
+# rounding digits of numeric values without a device_class_to_rounding entry
+DEFAULT_ROUNDING = 2
+
+
+@dataclass(frozen=True, slots=True)
+class ParameterDescriptor:
+    """
+        Compiled, immutable form of a Parameter/ WriteParameter register map entry.
+
+        Everything the read and write paths need is resolved once: the decoder and encoder
+        for the data type, scale and rounding, the slug and the MQTT topics.
+        The register map entry is kept as definition, e.g. for discovery payloads.
+    """
+    name: str
+    slug: str
+    addr: int
+    count: int
+    dtype: DataType
+    register_type: RegisterTypes
+    multiplier: float
+    rounding: int
+    unit: Optional[str]
+    device_class: Optional[DeviceClass]
+    ha_entity_type: Optional[HAEntityType]
+    decoder: Callable[[bytes, int], Any]
+    encoder: Callable[[Any], list[int]]
+    state_topic: str
+    command_topic: str
+    definition: Parameter | WriteParameter
+
+    def decode(self, registers: list[int]) -> Any:
+        """ Decode, scale and round the raw registers of the parameter. """
+        return self.decode_from(registers_to_buffer(registers), 0)
+
+    def decode_from(self, buffer: bytes, offset: int) -> Any:
+        """ Decode, scale and round the parameter at byte offset of a buffer of packed registers. See codec. """
+        val = self.decoder(buffer, offset)
+        if self.multiplier != 1:
+            val *= self.multiplier
+        if isinstance(val, (int, float)):
+            val = round(val, self.rounding)
+        return val
+
+
+def compile_descriptors(parameters: dict[str, Parameter] | dict[str, WriteParameter],
+                        nickname: str,
+                        base_topic: str,
+                        decoder_for: Callable[[DataType, int], Callable[[bytes, int], Any]],
+                        encoder_for: Callable[[DataType], Callable[[Any], list[int]]]) -> dict[str, ParameterDescriptor]:
+    """Compile register map entries into descriptors.
+
+    Args:
+        parameters (dict[str, Parameter] | dict[str, WriteParameter]): register map entries by name
+        nickname (str): slug of the server name, used in the MQTT topics
+        base_topic (str): MQTT base topic
+        decoder_for (Callable): returns the buffer decoder of a DataType and register count, e.g. Server._decoder
+        encoder_for (Callable): returns the encoder of a DataType, e.g. Server._encoder
+
+    Returns:
+        dict[str, ParameterDescriptor]: descriptors by parameter name
+    """
+    descriptors = {}
+    for name, param in parameters.items():
+        slug = slugify(name)
+        item_topic = f"{base_topic}/{nickname}/{slug}"
+        descriptors[name] = ParameterDescriptor(
+            name=name,
+            slug=slug,
+            addr=param["addr"],
+            count=param["count"],
+            dtype=param["dtype"],
+            register_type=param["register_type"],
+            multiplier=param["multiplier"],
+            rounding=device_class_to_rounding.get(param.get("device_class"), DEFAULT_ROUNDING),  # type: ignore
+            unit=param.get("unit"),
+            device_class=param.get("device_class"),
+            ha_entity_type=param.get("ha_entity_type"),  # type: ignore
+            decoder=decoder_for(param["dtype"], param["count"]),
+            encoder=encoder_for(param["dtype"]),
+            state_topic=f"{item_topic}/state",
+            command_topic=f"{item_topic}/set",
+            definition=param,
+        )
+    return descriptors
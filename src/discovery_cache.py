@@ -0,0 +1,87 @@
+from hashlib import sha256
+import json
+import logging
+import os
+import threading
+
+from .helpers import DATA_PATH, slugify
+
+logger = logging.getLogger(__name__)
+
+
+class DiscoveryCache:
+    """
+        Hashes of the retained discovery configs published for one server, persisted as json.
+
+        Lets MqttClient.publish_discovery_topics skip configs the broker already retains unchanged,
+        and clear the configs of entities that are no longer in the register maps.
+        A config is only recorded once it was sent to the broker, see expect and sent.
+        The cache is only valid for the broker it was recorded for.
+        One file per server, so that shards never write the same file.
+    """
+
+    def __init__(self, path: str | None = None, broker: str = "") -> None:
+        self.path = path
+        self.broker = broker
+        self.hashes: dict[str, str] = {}    # discovery topic: payload hash
+        self._pending: set[str] = set()     # topics expected to be sent before the next save
+        self._lock = threading.Lock()       # sent is called on the MQTT egress thread
+
+    @classmethod
+    def for_server(cls, server_name: str, host: str, port: int, data_path: str = DATA_PATH) -> "DiscoveryCache":
+        cache = cls(os.path.join(data_path, "discovery_cache", f"{slugify(server_name)}.json"), f"{host}:{port}")
+        cache.load()
+        return cache
+
+    @staticmethod
+    def hash(payload: str) -> str:
+        return sha256(payload.encode()).hexdigest()
+
+    def changed(self, topic: str, payload: str) -> bool:
+        """ Whether payload differs from the one last recorded on topic. """
+        return self.hashes.get(topic) != self.hash(payload)
+
+    def removed(self, configs: dict[str, str]) -> list[str]:
+        """ Topics recorded that are not in configs, the complete set of discovery configs of the server. To be cleared. """
+        with self._lock:
+            return [topic for topic in self.hashes if topic not in configs]
+
+    def expect(self, topics) -> None:
+        """ Topics about to be published. The cache is saved once all of them were sent. """
+        with self._lock:
+            self._pending.update(topics)
+
+    def sent(self, topic: str, payload: str) -> None:
+        """ Record a config sent to the broker. An empty payload clears the config. """
+        with self._lock:
+            if payload == "":
+                self.hashes.pop(topic, None)
+            else:
+                self.hashes[topic] = self.hash(payload)
+            self._pending.discard(topic)
+            if not self._pending:
+                self.save()
+
+    def load(self) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load discovery cache {self.path}: {e}")
+            return
+        if data.get("broker") != self.broker:
+            logger.info(f"Discovery cache {self.path} is for another broker. Publishing all discovery configs")
+            return
+        self.hashes = data.get("hashes", {})
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump({"broker": self.broker, "hashes": self.hashes}, f)
+        except OSError as e:
+            logger.warning(f"Could not save discovery cache {self.path}: {e}")
@@ -0,0 +1,84 @@
+"""
+    Compact Home Assistant MQTT discovery payloads: abbreviated keys, `~` base topic substitution and
+    collapsed template whitespace. See https://www.home-assistant.io/integrations/mqtt/#discovery-payload
+"""
+import re
+from typing import Any
+
+# abbreviations of the discovery keys used by MqttClient.discovery_configs
+ABBREVIATIONS: dict[str, str] = {
+    "availability_topic": "avty_t",
+    "command_template": "cmd_tpl",
+    "command_topic": "cmd_t",
+    "components": "cmps",
+    "device": "dev",
+    "device_class": "dev_cla",
+    "entity_category": "ent_cat",
+    "json_attributes_template": "json_attr_tpl",
+    "json_attributes_topic": "json_attr_t",
+    "options": "ops",
+    "origin": "o",
+    "payload_off": "pl_off",
+    "payload_on": "pl_on",
+    "payload_press": "pl_prs",
+    "platform": "p",
+    "state_class": "stat_cla",
+    "state_topic": "stat_t",
+    "unique_id": "uniq_id",
+    "unit_of_measurement": "unit_of_meas",
+    "value_template": "val_tpl",
+}
+
+DEVICE_ABBREVIATIONS: dict[str, str] = {
+    "identifiers": "ids",
+    "manufacturer": "mf",
+    "model": "mdl",
+}
+
+ORIGIN_ABBREVIATIONS: dict[str, str] = {
+    "support_url": "url",
+    "sw_version": "sw",
+}
+
+_TEMPLATE_KEYS = ("value_template", "command_template")
+
+
+def collapse_template(template: str) -> str:
+    """ Join the lines of a Jinja template, dropping the indentation. Whitespace within a line is kept. """
+    return re.sub(r"\s*\n\s*", " ", template).strip()
+
+
+def compact_payload(payload: dict[str, Any], base: str, full_device: bool = True) -> dict[str, Any]:
+    """Abbreviate a discovery payload.
+
+    Args:
+        payload (dict[str, Any]): discovery payload with full key names
+        base (str): topic prefix replaced by `~` in every topic, e.g. {base_topic}/{nickname}
+        full_device (bool, optional): include all device details, rather than only the identifiers that link
+            the entity to a device another config of the same server describes. Defaults to True.
+    """
+    compact: dict[str, Any] = {"~": base}
+    for key, value in payload.items():
+        if key.endswith("_topic") and isinstance(value, str) and value.startswith(base):
+            value = "~" + value[len(base):]
+        elif key in _TEMPLATE_KEYS and isinstance(value, str):
+            value = collapse_template(value)
+        elif key == "device":
+            device = value if full_device else {"identifiers": value["identifiers"]}
+            value = {DEVICE_ABBREVIATIONS.get(k, k): v for k, v in device.items()}
+        compact[ABBREVIATIONS.get(key, key)] = value
+    return compact
+
+
+def compact_device_payload(payload: dict[str, Any], base: str) -> dict[str, Any]:
+    """Abbreviate a device-based discovery payload, see MqttClient.device_discovery_config.
+
+    Args:
+        payload (dict[str, Any]): device discovery payload with full key names
+        base (str): topic prefix replaced by `~` in the topics of every component
+    """
+    return {
+        "dev": {DEVICE_ABBREVIATIONS.get(k, k): v for k, v in payload["device"].items()},
+        "o": {ORIGIN_ABBREVIATIONS.get(k, k): v for k, v in payload["origin"].items()},
+        "cmps": {key: compact_payload(component, base) for key, component in payload["components"].items()},
+    }
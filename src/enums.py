@@ -137,15 +137,36 @@ class DeviceClass(Enum):
     WEIGHT = "weight"
     WIND_SPEED = "wind_speed"
 
+# digits numeric values are rounded to after scaling. Others are rounded to 2 digits
 device_class_to_rounding: dict[DeviceClass, int] = { 
         DeviceClass.REACTIVE_POWER: 0,
         DeviceClass.ENERGY: 1,
-        DeviceClass.FREQUENCY: 1,
+        DeviceClass.FREQUENCY: 2,
         DeviceClass.POWER_FACTOR: 1,
         DeviceClass.APPARENT_POWER: 0, 
         DeviceClass.CURRENT: 1,
-        DeviceClass.VOLTAGE: 0,
-        DeviceClass.POWER: 0
+        DeviceClass.VOLTAGE: 1,
+        DeviceClass.POWER: 1
+    }
+
+class PollTier(Enum):
+    """
+    How often a parameter is read. Intervals are set by the add-on options.
+    """
+    FAST = "fast"       # every cycle
+    NORMAL = "normal"
+    SLOW = "slow"
+    ONCE = "once"       # once after every (re)connect, for static values such as serial numbers
+
+# default tier of read-only parameters without a poll_tier. Others default to PollTier.NORMAL
+device_class_to_poll_tier: dict[DeviceClass, PollTier] = {
+        DeviceClass.POWER: PollTier.FAST,
+        DeviceClass.REACTIVE_POWER: PollTier.FAST,
+        DeviceClass.APPARENT_POWER: PollTier.FAST,
+        DeviceClass.POWER_FACTOR: PollTier.FAST,
+        DeviceClass.CURRENT: PollTier.FAST,
+        DeviceClass.VOLTAGE: PollTier.FAST,
+        DeviceClass.FREQUENCY: PollTier.FAST,
     }
 
 class HAEntityType(Enum):
@@ -176,6 +197,7 @@ class Parameter(ParameterReq, total=False):
     remarks: str
     state_class: Literal["measurement", "total", "total_increasing"]
     value_template: str
+    poll_tier: PollTier
 
     # all oarameters are required to have these fields
 WriteParameterReq = TypedDict(
@@ -197,6 +219,7 @@ class WriteSelectParameterReq(WriteParameterReq, total=True):
 class WriteSelectParameter(WriteSelectParameterReq, total=False):
     value_template: str
     command_template: str
+    poll_tier: PollTier
     
 class WriteParameter(WriteParameterReq, total=False):
     device_class: DeviceClass # when not specified w=for a switch, a none type switch is used
@@ -212,6 +235,7 @@ class WriteParameter(WriteParameterReq, total=False):
     payload_press: int # button HAEntityType
 
     always_available: bool
+    poll_tier: PollTier
     
 
 if __name__ == "__main__":
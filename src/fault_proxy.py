@@ -0,0 +1,222 @@
+"""
+    Local Modbus TCP proxy that injects gateway misbehaviour between a Client and a Modbus TCP endpoint,
+    e.g. the simulator: delayed responses with jitter, dropped responses, truncated frames, connection resets,
+    and a gateway that is down. Faults apply to all unit ids, or to chosen ones, to measure how one bad
+    device behind a gateway degrades the others.
+
+        python -m src.fault_proxy --upstream 127.0.0.1:5020 --port 5021 --delay 0.05 --jitter 0.02 --unit 3:drop=0.5
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field, fields, replace
+import logging
+import random
+import struct
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MBAP_LENGTH = 7     # transaction id, protocol id, length, unit id
+
+
+@dataclass(frozen=True)
+class Faults:
+    """ Faults injected into the responses of a unit id. Probabilities are per response """
+    delay: float = 0        # seconds added to every response
+    jitter: float = 0       # random seconds up to which are added to the delay
+    drop: float = 0         # probability that a response is never sent
+    truncate: float = 0     # probability that a response is cut short
+    reset: float = 0        # probability that the connection is reset instead of responding
+
+
+@dataclass
+class FaultProxyOptions:
+    """ Proxied endpoint and faults, as read from the command line """
+    upstream_host: str = "127.0.0.1"
+    upstream_port: int = 5020
+    host: str = "127.0.0.1"
+    port: int = 0                   # 0 picks a free port
+    faults: Faults = Faults()
+    unit_faults: dict[int, Faults] = field(default_factory=dict)     # unit id: faults, instead of faults
+    seed: Optional[int] = None
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(MBAP_LENGTH)
+    length = struct.unpack(">H", header[4:6])[0]
+    return header + await reader.readexactly(length - 1)
+
+
+class FaultProxy:
+    """
+        Forwards Modbus TCP frames between each accepted connection and its own connection to the upstream endpoint,
+        and injects the faults of the unit id of each response. Runs on its own thread and event loop.
+        Faults can be changed while running, see set_faults and set_down.
+    """
+
+    def __init__(self, options: FaultProxyOptions = FaultProxyOptions()) -> None:
+        self.options = options
+        self.port = options.port
+        self.faults = options.faults
+        self.unit_faults = dict(options.unit_faults)
+        self.down = False
+        self.rng = random.Random(options.seed)
+        self.connections = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self.truncated = 0
+        self.resets = 0
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fault-proxy", daemon=True)
+
+    def start(self) -> "FaultProxy":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result(timeout=10)
+        logger.info(f"Proxying {self.options.upstream_host}:{self.options.upstream_port} on port {self.port}")
+        return self
+
+    async def _listen(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.options.host, self.options.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        async def close():
+            self._abort_all()
+            if self._server is not None:
+                self._server.close()
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+
+    def __enter__(self) -> "FaultProxy":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def set_faults(self, unit_id: Optional[int] = None, **faults: float) -> None:
+        """ Change faults, e.g. set_faults(3, drop=1). Without a unit id, of the units without faults of their own.
+            Faults of a unit id start from those of the other units. """
+        if unit_id is None:
+            self.faults = replace(self.faults, **faults)
+        else:
+            self.unit_faults[unit_id] = replace(self.unit_faults.get(unit_id, self.faults), **faults)
+
+    def set_down(self, down: bool = True) -> None:
+        """ Gateway down: open connections are reset, and new ones are closed once accepted.
+            Returns once the open connections are reset. """
+        self.down = down
+        if down:
+            async def abort():
+                self._abort_all()
+            asyncio.run_coroutine_threadsafe(abort(), self._loop).result(timeout=10)
+
+    def _abort_all(self) -> None:
+        for writer in list(self._writers):
+            writer.transport.abort()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self.down:
+            writer.transport.abort()
+            return
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(self.options.upstream_host,
+                                                                             self.options.upstream_port)
+        except OSError as e:
+            logger.warning(f"Could not connect to the upstream endpoint: {e}")
+            writer.transport.abort()
+            return
+        if self.down:   # went down while connecting upstream, before _abort_all could see these writers
+            writer.transport.abort()
+            upstream_writer.transport.abort()
+            return
+        self.connections += 1
+        self._writers.update((writer, upstream_writer))
+        requests = asyncio.ensure_future(self._forward_requests(reader, upstream_writer))
+        try:
+            await self._forward_responses(upstream_reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            requests.cancel()
+            for w in (writer, upstream_writer):
+                self._writers.discard(w)
+                w.transport.abort()
+
+    async def _forward_requests(self, reader: asyncio.StreamReader, upstream: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                upstream.write(await _read_frame(reader))
+                await upstream.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            upstream.transport.abort()     # ends _forward_responses
+
+    async def _forward_responses(self, upstream: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            frame = await _read_frame(upstream)
+            faults = self.unit_faults.get(frame[6], self.faults)
+            delay = faults.delay + faults.jitter * self.rng.random()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.rng.random() < faults.reset:
+                self.resets += 1
+                return
+            if self.rng.random() < faults.drop:
+                self.dropped += 1
+                continue
+            if self.rng.random() < faults.truncate:
+                self.truncated += 1
+                frame = frame[:self.rng.randrange(1, len(frame))]
+            writer.write(frame)
+            await writer.drain()
+            self.forwarded += 1
+
+
+def parse_faults(text: str, faults: Faults = Faults()) -> Faults:
+    """ Faults from e.g. "drop=0.5,delay=1", on top of faults. """
+    names = {f.name for f in fields(Faults)}
+    values = {}
+    for part in text.split(","):
+        name, _, value = part.partition("=")
+        if name not in names:
+            raise ValueError(f"Unknown fault {name}, one of {', '.join(sorted(names))}")
+        values[name] = float(value)
+    return replace(faults, **values)
+
+
+def parse_options(argv: Optional[list[str]] = None) -> FaultProxyOptions:
+    parser = argparse.ArgumentParser(description="Modbus TCP proxy injecting delays, dropped responses, "
+                                                 "truncated frames and connection resets")
+    parser.add_argument("--upstream", default="127.0.0.1:5020", help="Modbus TCP endpoint, host:port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5021)
+    parser.add_argument("--delay", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="random seconds up to which are added to the delay")
+    parser.add_argument("--drop", type=float, default=0, help="probability that a response is never sent")
+    parser.add_argument("--truncate", type=float, default=0, help="probability that a response is cut short")
+    parser.add_argument("--reset", type=float, default=0, help="probability that the connection is reset")
+    parser.add_argument("--unit", action="append", default=[], metavar="UNIT:FAULTS",
+                        help="faults of one unit id instead, e.g. 3:drop=0.5,delay=1")
+    parser.add_argument("--seed", type=int, help="seed of the random faults, to repeat a run")
+    args = parser.parse_args(argv)
+    upstream_host, _, upstream_port = args.upstream.rpartition(":")
+    faults = Faults(args.delay, args.jitter, args.drop, args.truncate, args.reset)
+    unit_faults = {}
+    for unit in args.unit:
+        unit_id, _, text = unit.partition(":")
+        unit_faults[int(unit_id)] = parse_faults(text, faults)
+    return FaultProxyOptions(upstream_host, int(upstream_port), args.host, args.port, faults, unit_faults, args.seed)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    proxy = FaultProxy(parse_options()).start()
+    print(f"Proxying on port {proxy.port}. Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        proxy.stop()
@@ -1,4 +1,4 @@
-from .enums import DataType, DeviceClass, HAEntityType, Parameter, RegisterTypes, WriteParameter, WriteSelectParameter
+from .enums import DataType, DeviceClass, HAEntityType, Parameter, PollTier, RegisterTypes, WriteParameter, WriteSelectParameter
 
 goodwe_gt_parameters: dict[str, Parameter] = {
     # Grid Line Voltages (Address 32066-32068)
@@ -101,12 +101,14 @@ goodwe_gt_parameters: dict[str, Parameter] = {
     "Serial Number": Parameter(
         addr=35502+1, count=1, dtype=DataType.UTF8, multiplier=1, unit="",
         device_class=DeviceClass.ENUM,
-        register_type=RegisterTypes.HOLDING_REGISTER
+        register_type=RegisterTypes.HOLDING_REGISTER,
+        poll_tier=PollTier.ONCE
     ),
     "Model": Parameter(
         addr=35510+1, count=1, dtype=DataType.UTF8, multiplier=1, unit="",
         device_class=DeviceClass.ENUM,
-        register_type=RegisterTypes.HOLDING_REGISTER
+        register_type=RegisterTypes.HOLDING_REGISTER,
+        poll_tier=PollTier.ONCE
     ),
 
     # Status and Diagnostics
@@ -181,7 +183,8 @@ goodwe_gt_write_params: dict[str, WriteParameter | WriteSelectParameter] = {
         multiplier=1,
         register_type=RegisterTypes.HOLDING_REGISTER,
         ha_entity_type=HAEntityType.BUTTON,
-        payload_press=0
+        payload_press=0,
+        poll_tier=PollTier.ONCE
     ),
     "Command Power Off": WriteParameter(
         addr=41331+1,
@@ -190,7 +193,8 @@ goodwe_gt_write_params: dict[str, WriteParameter | WriteSelectParameter] = {
         multiplier=1,
         register_type=RegisterTypes.HOLDING_REGISTER,
         ha_entity_type=HAEntityType.BUTTON,
-        payload_press=0
+        payload_press=0,
+        poll_tier=PollTier.ONCE
     ),
     "Power Switch": WriteParameter(
         addr=41331+1,
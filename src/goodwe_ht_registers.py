@@ -1,4 +1,4 @@
-from .enums import DataType, DeviceClass, HAEntityType, Parameter, RegisterTypes, WriteParameter, WriteSelectParameter
+from .enums import DataType, DeviceClass, HAEntityType, Parameter, PollTier, RegisterTypes, WriteParameter, WriteSelectParameter
 
 goodwe_ht_parameters: dict[str, Parameter] = {
     # Status 1 (Register 32002)
@@ -158,24 +158,28 @@ goodwe_ht_parameters: dict[str, Parameter] = {
     "Serial Number": Parameter(
         addr=35502+1, count=1, dtype=DataType.UTF8, multiplier=1/1, unit="",
         device_class=DeviceClass.ENUM,
-        register_type=RegisterTypes.HOLDING_REGISTER
+        register_type=RegisterTypes.HOLDING_REGISTER,
+        poll_tier=PollTier.ONCE
     ),
     "Model": Parameter(
         addr=35510+1, count=8, dtype=DataType.UTF8, multiplier=1/1, unit="",
         device_class=DeviceClass.ENUM,
-        register_type=RegisterTypes.HOLDING_REGISTER
+        register_type=RegisterTypes.HOLDING_REGISTER,
+        poll_tier=PollTier.ONCE
     ),
 
     # DSP Versions (Registers 35515, 35516)
     "DSP1 Version": Parameter(
         addr=35515+1, count=1, dtype=DataType.U16, multiplier=1/1, unit="",
         device_class=DeviceClass.ENUM,
-        register_type=RegisterTypes.HOLDING_REGISTER
+        register_type=RegisterTypes.HOLDING_REGISTER,
+        poll_tier=PollTier.ONCE
     ),
     "DSP2 Version": Parameter(
         addr=35516+1, count=1, dtype=DataType.U16, multiplier=1/1, unit="",
         device_class=DeviceClass.ENUM,
-        register_type=RegisterTypes.HOLDING_REGISTER
+        register_type=RegisterTypes.HOLDING_REGISTER,
+        poll_tier=PollTier.ONCE
     ),
 
     # Fault Codes (Register 35710)
@@ -252,7 +256,8 @@ goodwe_ht_write_params: dict[str, WriteParameter | WriteSelectParameter] = {
         multiplier=1,
         register_type=RegisterTypes.HOLDING_REGISTER,
         ha_entity_type=HAEntityType.BUTTON,
-        payload_press=0
+        payload_press=0,
+        poll_tier=PollTier.ONCE
     ),
     "Command Power Off": WriteParameter(
         addr=41331+1,
@@ -261,7 +266,8 @@ goodwe_ht_write_params: dict[str, WriteParameter | WriteSelectParameter] = {
         multiplier=1,
         register_type=RegisterTypes.HOLDING_REGISTER,
         ha_entity_type=HAEntityType.BUTTON,
-        payload_press=0
+        payload_press=0,
+        poll_tier=PollTier.ONCE
     ),
     "Power Switch": WriteParameter(
         addr=41331+1,
@@ -1,3 +1,9 @@
+import os
+
+# persistent add-on storage
+DATA_PATH = os.environ.get("HASSIO_DATA_PATH", "/data")
+
+
 def slugify(text: str) -> str:
     return text.replace(' ', '_').replace('(', '').replace(')', '').replace('/', 'OR').replace('&', ' ').replace(':', '').replace('.', '').lower()
 
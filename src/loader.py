@@ -6,6 +6,7 @@ import yaml
 from cattrs import structure, unstructure, Converter
 from .options import *
 from .implemented_servers import ServerTypes
+from .enums import DeviceClass, PollTier
 
 logger = logging.getLogger(__name__)
 
@@ -42,12 +43,64 @@ def validate_server_implemented(servers: list):
             )
 
 
+def validate_poll_overrides(overrides: list) -> None:
+    """Validate the server type and tier of poll tier overrides."""
+    validate_server_implemented(overrides)
+    tiers = [t.value for t in PollTier]
+    for override in overrides:
+        if override.tier not in tiers:
+            raise ValueError(
+                f"Poll tier {override.tier} of {override.parameter} must be one of {tiers}"
+            )
+
+
+def validate_deadbands(deadbands: list) -> None:
+    """Validate that each deadband names either a valid device class or a parameter."""
+    device_classes = [d.value for d in DeviceClass]
+    for deadband in deadbands:
+        if (deadband.device_class is None) == (deadband.parameter is None):
+            raise ValueError(
+                f"Deadband must set either device_class or parameter: {deadband}"
+            )
+        if deadband.device_class is not None and deadband.device_class not in device_classes:
+            raise ValueError(
+                f"Deadband device_class {deadband.device_class} must be one of {device_classes}"
+            )
+        if deadband.absolute < 0 or deadband.relative < 0:
+            raise ValueError(
+                f"Deadband of {deadband.device_class or deadband.parameter} must not be negative"
+            )
+
+
+def validate_publish_policies(policies: list) -> None:
+    """Validate that each publish policy names either a valid poll tier or a parameter, and a valid QoS."""
+    tiers = [t.value for t in PollTier]
+    for policy in policies:
+        if (policy.tier is None) == (policy.parameter is None):
+            raise ValueError(
+                f"Publish policy must set either tier or parameter: {policy}"
+            )
+        if policy.tier is not None and policy.tier not in tiers:
+            raise ValueError(
+                f"Publish policy tier {policy.tier} must be one of {tiers}"
+            )
+        if policy.qos not in (None, 0, 1, 2):
+            raise ValueError(
+                f"Publish policy QoS of {policy.tier or policy.parameter} must be 0, 1 or 2"
+            )
+
+
 def validate_options(opts: AppOptions) -> None:
     client_names = [c.name for c in opts.clients]
     server_names = [s.name for s in opts.servers]
     validate_names(client_names)
     validate_names(server_names)
     validate_server_implemented(opts.servers)
+    validate_poll_overrides(opts.poll_overrides)
+    validate_deadbands(opts.deadbands)
+    validate_publish_policies(opts.publish_policies)
+    if opts.modbus_recording and opts.runtime == "async":
+        raise ValueError("modbus_recording is only supported by the sync runtime")
 
 
 def read_json(json_rel_path):
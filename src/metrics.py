@@ -0,0 +1,161 @@
+"""
+    Latency histograms and error counters of the Modbus and MQTT work done for each server: block reads,
+    writes, decoding, publishing and whole poll cycles. Summarised every diagnostics_interval into the
+    diagnostics document of the server, read by its diagnostic sensors in Home Assistant.
+"""
+from bisect import bisect_left
+import threading
+from typing import Any, Optional
+
+from .enums import RegisterTypes
+
+# upper bounds of the histogram buckets, in seconds: 4 per doubling from 0.1 ms to about 50 s, then an overflow bucket.
+# A quantile is interpolated within its bucket, so it is off by less than a fifth
+BUCKET_BOUNDS: tuple[float, ...] = tuple(0.0001 * 2 ** (i / 4) for i in range(77))
+
+# diagnostic sensors discovered per server: summary field: (name, unit, device class, state class)
+DIAGNOSTIC_SENSORS: dict[str, tuple[str, Optional[str], Optional[str], str]] = {
+    "cycle_duration": ("Modbus Cycle Duration", "ms", "duration", "measurement"),
+    "read_latency_p50": ("Modbus Read Latency p50", "ms", "duration", "measurement"),
+    "read_latency_p99": ("Modbus Read Latency p99", "ms", "duration", "measurement"),
+    "error_rate": ("Modbus Error Rate", "%", None, "measurement"),
+    "reconnects": ("Modbus Reconnects", None, None, "total_increasing"),
+}
+
+
+class LatencyHistogram:
+    """ Count of durations per bucket of BUCKET_BOUNDS, with their sum and maximum. Observing is a bisect and a few adds. """
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Estimated q quantile in seconds, e.g. q=0.99. None if nothing was observed. """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKET_BOUNDS[i - 1] if i else 0.0
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class ServerMetrics:
+    """
+        Metrics of one server. Histograms and error counts cover the window since the last summary,
+        reconnects count since the start.
+
+        Updated by the poll loop, the command executor and the async runtime, so updates take a lock.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reconnects = 0
+        self._poll_time = 0.0   # seconds spent polling the server in the current cycle
+        self._reset()
+
+    def _reset(self) -> None:
+        self.reads = LatencyHistogram()
+        self.writes = LatencyHistogram()
+        self.decodes = LatencyHistogram()
+        self.publishes = LatencyHistogram()
+        self.cycles = LatencyHistogram()
+        self.blocks: dict[tuple[RegisterTypes, int, int], LatencyHistogram] = {}   # (type, address, count): reads
+        self.read_errors = 0
+        self.write_errors = 0
+
+    def observe_read(self, register_type: RegisterTypes, address: int, count: int, seconds: float, error: bool = False) -> None:
+        """ A block read request, failed (exception or error response) or not. """
+        with self._lock:
+            self.reads.observe(seconds)
+            key = (register_type, address, count)
+            block = self.blocks.get(key)
+            if block is None:
+                block = self.blocks[key] = LatencyHistogram()
+            block.observe(seconds)
+            if error:
+                self.read_errors += 1
+
+    def observe_write(self, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self.writes.observe(seconds)
+            if error:
+                self.write_errors += 1
+
+    def observe_decode(self, seconds: float) -> None:
+        with self._lock:
+            self.decodes.observe(seconds)
+
+    def observe_publish(self, seconds: float) -> None:
+        with self._lock:
+            self.publishes.observe(seconds)
+
+    def observe_poll(self, seconds: float) -> None:
+        """ Time spent polling the server, added up over the passes of the current cycle. """
+        with self._lock:
+            self._poll_time += seconds
+
+    def end_cycle(self) -> None:
+        with self._lock:
+            if self._poll_time > 0:
+                self.cycles.observe(self._poll_time)
+            self._poll_time = 0.0
+
+    def mark_reconnected(self) -> None:
+        with self._lock:
+            self.reconnects += 1
+
+    def summary(self) -> dict[str, Any]:
+        """ Summary of the window, in milliseconds, and start a new window. Latencies are None without requests.
+
+            The fields of DIAGNOSTIC_SENSORS, plus counts, write, decode and publish times, and read latencies per block.
+        """
+        with self._lock:
+            requests = self.reads.count + self.writes.count
+            errors = self.read_errors + self.write_errors
+            summary = {
+                "cycle_duration": _ms(self.cycles.mean()),
+                "read_latency_p50": _ms(self.reads.quantile(0.5)),
+                "read_latency_p99": _ms(self.reads.quantile(0.99)),
+                "read_latency_max": _ms(self.reads.max if self.reads.count else None),
+                "write_latency_p50": _ms(self.writes.quantile(0.5)),
+                "decode_time": _ms(self.decodes.mean()),
+                "publish_time": _ms(self.publishes.mean()),
+                "reads": self.reads.count,
+                "writes": self.writes.count,
+                "errors": errors,
+                "error_rate": round(100 * errors / requests, 2) if requests else 0,
+                "reconnects": self.reconnects,
+                "blocks": {
+                    f"{register_type.name.split('_')[0].lower()} {address}+{count}": {
+                        "reads": block.count,
+                        "p50": _ms(block.quantile(0.5)),
+                        "p99": _ms(block.quantile(0.99)),
+                    }
+                    for (register_type, address, count), block in sorted(self.blocks.items(), key=lambda item: item[0][1:])
+                },
+            }
+            self._reset()
+        return summary
@@ -1,19 +1,34 @@
 import os
 import signal
-from typing import Callable
+import threading
+from typing import Any, Callable, Optional
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 import json
 import logging
+from functools import partial
 from .loader import AppOptions
 from .helpers import slugify
+from .enums import HAEntityType, PollTier
+from .discovery_cache import DiscoveryCache
+from .discovery_compact import compact_device_payload, compact_payload
+from .mqtt_egress import EgressQueue
+from .publish_policy import Delivery, PublishPolicy
+from .descriptors import ParameterDescriptor
+from .metrics import DIAGNOSTIC_SENSORS
 
 from random import getrandbits
-from time import time, sleep
+from time import monotonic, time, sleep
 from queue import Queue
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
+# application publishing device-based discovery configs
+DISCOVERY_ORIGIN = {"name": "ha-goodwe", "support_url": "https://github.com/Voyanti/ha-goodwe"}
+
+THROUGHPUT_LOG_INTERVAL = 60    # seconds
+
 
 class MqttClient(mqtt.Client):
     """
@@ -35,10 +50,54 @@ class MqttClient(mqtt.Client):
         self.username_pw_set(options.mqtt_user, options.mqtt_password)
         self.base_topic = options.mqtt_base_topic
         self.ha_discovery_topic = options.mwtt_ha_discovery_topic
+        self.host, self.port = options.mqtt_host, options.mqtt_port
+        self.use_discovery_cache = options.discovery_cache
+        self.compact_discovery = options.discovery_compact
+        self._discovery_caches: dict[str, DiscoveryCache] = {}     # server name: cache
+        self.discovered_servers: dict[str, Any] = {}               # server name: server, republished on HA's birth
+        self._available: dict[str, bool] = {}                      # server name: availability last published
+        # Home Assistant announces it (re)started, e.g. with the broker, on its birth message
+        self.ha_status_topic = f"{self.ha_discovery_topic}/status"
+        self.discovery_mode = options.discovery_mode
+        self.diagnostics_enabled = options.diagnostics_interval > 0
+
+        # "topics": one state topic per parameter. "json": one state document per server, see publish_state_documents
+        self.state_mode = options.mqtt_state_mode
+        self._state_lock = threading.Lock()     # documents are updated by the polling and the MQTT network threads
+        self._state_documents: dict[str, dict[str, Any]] = {}   # server name: {slug: value}
+        self._dirty_documents: set[str] = set()
+        # strictest delivery of the parameters in each document, server name: delivery
+        self._document_deliveries: dict[str, Delivery] = {}
+
+        self.publish_policy = PublishPolicy.from_options(options)
+        self._deliveries: dict[tuple[str, str], Delivery] = {}     # (server name, parameter name): delivery
+        # last values of PollTier.ONCE parameters, read only after connecting: republished on HA's birth
+        self._once_parameters: dict[tuple[str, str], bool] = {}    # (server name, parameter name): of PollTier.ONCE
+        self._once_values: dict[str, dict[str, Any]] = {}          # server name: {parameter name: value}
+
+        # latest message per topic, sent on a background thread once the broker keeps up, see enqueue
+        self.egress = EgressQueue(self._send, options.mqtt_rate_limit, options.mqtt_rate_burst,
+                                  options.mqtt_max_queued, ready=self._egress_ready)
+        self.max_inflight = options.mqtt_max_inflight
+        self.max_inflight_messages_set(options.mqtt_max_inflight)
+        self.max_queued_messages_set(options.mqtt_max_queued)
+        self._unacked: deque[mqtt.MQTTMessageInfo] = deque()     # only used on the egress thread
+        self.sent_by_qos = [0, 0, 0]
+        self._throughput_mark = (monotonic(), [0, 0, 0])         # (time, sent_by_qos) of the last throughput log
+
+        # command topic: (server, write descriptor), for the write parameters of every server discovered
+        self.command_routes: dict[str, tuple[Any, ParameterDescriptor]] = {}
+        # batch command topic: server, see batch_command_topic
+        self.batch_routes: dict[str, Any] = {}
+        # one subscription for the command topics of all servers, {base_topic}/{nickname}/{slug}/set
+        self.command_subscription = f"{self.base_topic}/+/+/set"
+        self._closing = False   # disconnecting on purpose, see close
 
         def on_connect(client, userdata, connect_flags, reason_code, properties):
             if reason_code == 0:
                 logger.info(f"Connected to MQTT broker.")
+                self.subscribe(self.command_subscription)
+                self.subscribe(self.ha_status_topic)
             else:
                 logger.info(
                     f"Not connected to MQTT broker.\nReturn code: {reason_code=}")
@@ -48,12 +107,22 @@ class MqttClient(mqtt.Client):
                         disconnect_flags,
                         reason,
                         properties):
+            if self._closing:
+                logger.info("Disconnected from MQTT broker")
+                return
             logger.error(f"Disconnected from MQTT broker, {reason=}\n{disconnect_flags=}\n{properties=}")
             logger.info(f"Stopping all threads")
             os.kill(os.getpid(), signal.SIGINT)
 
         def on_message(client, userdata, msg):
             logger.info("Received message on MQTT")
+            if msg.topic == self.ha_status_topic:
+                if msg.payload == b"online":
+                    logger.info("Home Assistant is online. Publishing all discovery configs")
+                    for server in list(self.discovered_servers.values()):
+                        self.publish_discovery_topics(server, force=True)
+                    self.republish_once_states()
+                return
             try: 
                 self.message_handler(msg.topic, msg.payload.decode('utf-8'))
 
@@ -68,7 +137,13 @@ class MqttClient(mqtt.Client):
         self.on_message = on_message
         self.message_handler: Callable[[str, str], None] = lambda topic, payload: None
 
-    def publish_discovery_topics(self, server):
+    def publish_discovery_topics(self, server, force: bool = False):
+        """ Publish the retained discovery configs of server, route its command topics and publish it as available.
+
+            With the discovery cache, configs the broker already retains unchanged are skipped unless force,
+            and retained configs of entities no longer defined are cleared.
+            The cache records the configs as the egress queue sends them.
+        """
         # TODO check if more separation from server is necessary/ possible
         nickname = slugify(server.name)
         if not server.model or not server.manufacturer or not server.serial or not nickname or not server.parameters:
@@ -78,6 +153,34 @@ class MqttClient(mqtt.Client):
                 f"Server not properly configured. Cannot publish MQTT info")
 
         logger.info(f"Publishing discovery topics for {nickname}")
+        configs = {topic: json.dumps(payload) for topic, payload in self.discovery_configs(server).items()}
+
+        cache = self._discovery_caches.get(server.name)
+        if cache is None:
+            cache = DiscoveryCache.for_server(server.name, self.host, self.port) if self.use_discovery_cache else DiscoveryCache()
+            self._discovery_caches[server.name] = cache
+        changed = {topic: payload for topic, payload in configs.items() if force or cache.changed(topic, payload)}
+        removed = cache.removed(configs)
+        cache.expect([*removed, *changed])
+        # clear first: after a discovery_mode switch the new configs reuse the unique ids of the removed ones
+        for topic in removed:
+            self.enqueue(topic, "", retain=True, on_sent=partial(cache.sent, topic, ""))     # an empty retained config removes the entity
+        for topic, payload in changed.items():
+            self.enqueue(topic, payload, retain=True, on_sent=partial(cache.sent, topic, payload))
+        self.discovered_servers[server.name] = server
+        logger.info(f"Published {len(changed)} of {len(configs)} discovery configs for {nickname}, cleared {len(removed)}")
+
+        self.publish_availability(self._available.get(server.name, True), server)
+
+        # command topics are received through command_subscription
+        for descriptor in server.write_descriptors_by_slug.values():
+            self.command_routes[descriptor.command_topic] = (server, descriptor)
+        self.batch_routes[self.batch_command_topic(server)] = server
+
+    def discovery_configs(self, server) -> dict[str, dict]:
+        """ Discovery config payloads of every parameter and write parameter of server, by discovery topic. """
+        nickname = slugify(server.name)
+        configs = {}
         device = {
             "manufacturer": server.manufacturer,
             "model": server.model,
@@ -92,12 +195,13 @@ class MqttClient(mqtt.Client):
 
         parameters = server.parameters
 
+        descriptors = server.descriptors
         for register_name, details in parameters.items():
-            state_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}/state"
+            descriptor = descriptors[register_name]
             discovery_payload = {
                 "name": register_name,
-                "unique_id": f"{nickname}_{slugify(register_name)}",
-                "state_topic": state_topic,
+                "unique_id": f"{nickname}_{descriptor.slug}",
+                "state_topic": self._entity_state_topic(descriptor, server),
                 "device": device,
                 "device_class": details["device_class"].value,
                 "unit_of_measurement": details["unit"],
@@ -116,22 +220,20 @@ class MqttClient(mqtt.Client):
             # from sungrow
             if details.get("value_template") is not None:
                 discovery_payload.update(value_template=details["value_template"])
-            discovery_topic = f"{self.ha_discovery_topic}/sensor/{nickname}/{slugify(register_name)}/config"
-
-            self.publish(discovery_topic, json.dumps(
-                discovery_payload), retain=True)
+            if self.state_mode == "json":
+                discovery_payload.update(value_template=self._json_value_template(descriptor.slug, details.get("value_template")))
+            discovery_topic = f"{self.ha_discovery_topic}/sensor/{nickname}/{descriptor.slug}/config"
+            configs[discovery_topic] = discovery_payload
 
-        self.publish_availability(True, server)
-
-        for register_name, details in server.write_parameters.items():
-            item_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}"
+        for descriptor in server.write_descriptors_by_slug.values():
+            register_name, details = descriptor.name, descriptor.definition
             discovery_payload = {
                 # required
-                "command_topic": item_topic + f"/set", 
-                "state_topic": item_topic + f"/state",
+                "command_topic": descriptor.command_topic, 
+                "state_topic": self._entity_state_topic(descriptor, server),
                 # optional
                 "name": register_name,
-                "unique_id": f"{nickname}_{slugify(register_name)}",
+                "unique_id": f"{nickname}_{descriptor.slug}",
                 # "unit_of_measurement": details["unit"],
                 "availability_topic": availability_topic,
                 "device": device
@@ -150,26 +252,218 @@ class MqttClient(mqtt.Client):
                 discovery_payload.update(payload_off=details["payload_off"], payload_on=details["payload_on"])
             if details.get("payload_press") is not None:
                 discovery_payload.update(payload_press=details["payload_press"])
+            if self.state_mode == "json" and details["ha_entity_type"] != HAEntityType.BUTTON:
+                discovery_payload.update(value_template=self._json_value_template(descriptor.slug, details.get("value_template")))
 
 
-            discovery_topic = f"{self.ha_discovery_topic}/{details['ha_entity_type'].value}/{nickname}/{slugify(register_name)}/config"
-            self.publish(discovery_topic, json.dumps(discovery_payload), retain=True)
+            discovery_topic = f"{self.ha_discovery_topic}/{details['ha_entity_type'].value}/{nickname}/{descriptor.slug}/config"
+            configs[discovery_topic] = discovery_payload
 
-            # subscribe to write topics
-            self.subscribe(discovery_payload["command_topic"])
+        if self.diagnostics_enabled:
+            configs.update(self.diagnostic_configs(server, device))
 
-    def publish_to_ha(self, register_name, value, server):
+        if self.discovery_mode == "device":
+            payload = self.device_discovery_config(device, configs)
+            if self.compact_discovery:
+                payload = compact_device_payload(payload, f"{self.base_topic}/{nickname}")
+            return {f"{self.ha_discovery_topic}/device/{nickname}/config": payload}
+
+        if self.compact_discovery:
+            # the first config describes the device, the others refer to it by its identifiers
+            base = f"{self.base_topic}/{nickname}"
+            configs = {topic: compact_payload(payload, base, full_device=i == 0)
+                       for i, (topic, payload) in enumerate(configs.items())}
+        return configs
+
+    def diagnostic_configs(self, server, device: dict) -> dict[str, dict]:
+        """ Discovery configs of the diagnostic sensors of server, reading fields of its diagnostics document.
+            The p99 read latency sensor carries the latencies per block as attributes. """
         nickname = slugify(server.name)
-        state_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}/state"
-        msg_info = self.publish(state_topic, value, qos=1)  # , retain=True)
+        state_topic = self.diagnostics_topic(server)
+        configs = {}
+        for field, (name, unit, device_class, state_class) in DIAGNOSTIC_SENSORS.items():
+            discovery_payload = {
+                "name": name,
+                "unique_id": f"{nickname}_diagnostics_{field}",
+                "state_topic": state_topic,
+                "value_template": f"{{{{ value_json.{field} }}}}",
+                "entity_category": "diagnostic",
+                "state_class": state_class,
+                "device": device,
+            }
+            if unit is not None:
+                discovery_payload.update(unit_of_measurement=unit)
+            if device_class is not None:
+                discovery_payload.update(device_class=device_class)
+            if field == "read_latency_p99":
+                discovery_payload.update(json_attributes_topic=state_topic,
+                                         json_attributes_template="{{ value_json.blocks | tojson }}")
+            configs[f"{self.ha_discovery_topic}/sensor/{nickname}/diagnostics_{field}/config"] = discovery_payload
+        return configs
+
+    def device_discovery_config(self, device: dict, configs: dict[str, dict]) -> dict:
+        """ Device-based discovery config, describing the entity configs of one server as components of its device.
+
+            Components are keyed by unique id. Their platform is taken from the per-entity discovery topic,
+            {ha_discovery_topic}/{platform}/{nickname}/{slug}/config
+        """
+        components = {}
+        for topic, payload in configs.items():
+            component = {key: value for key, value in payload.items() if key != "device"}
+            components[payload["unique_id"]] = {"platform": topic.split("/")[-4], **component}
+        return {"device": device, "origin": DISCOVERY_ORIGIN, "components": components}
+
+    def publish_to_ha(self, register_name, value, server):
+        if self.state_mode == "json":
+            self.stage_state(register_name, value, server)
+            self.publish_state_documents([server])
+            return
+        state_topic = server.descriptors[register_name].state_topic
+        delivery = self.delivery(register_name, server)
+        if self._is_once(register_name, server):
+            with self._state_lock:
+                self._once_values.setdefault(server.name, {})[register_name] = value
+        self.enqueue(state_topic, value, delivery.qos, delivery.retain)
+
+    def _is_once(self, register_name, server) -> bool:
+        key = (server.name, register_name)
+        if key not in self._once_parameters:
+            self._once_parameters[key] = server.poll_tier(register_name) == PollTier.ONCE
+        return self._once_parameters[key]
+
+    def republish_once_states(self) -> None:
+        """ Publish the last values of the PollTier.ONCE parameters again, e.g. once Home Assistant restarted.
+            They are not read again until the server reconnects, and their state messages may not be retained.
+            In JSON state mode, every state document is published again, as it holds the values of every tier. """
+        servers = list(self.discovered_servers.values())
+        if self.state_mode == "json":
+            with self._state_lock:
+                self._dirty_documents.update(self._state_documents)
+            self.publish_state_documents(servers)
+            return
+        for server in servers:
+            with self._state_lock:
+                values = dict(self._once_values.get(server.name, {}))
+            for register_name, value in values.items():
+                self.publish_to_ha(register_name, value, server)
+
+    def delivery(self, register_name, server) -> Delivery:
+        """ QoS and retain flag of the state messages of a parameter, by the publish policy. """
+        key = (server.name, register_name)
+        if key not in self._deliveries:
+            self._deliveries[key] = self.publish_policy.delivery(register_name, server.poll_tier(register_name))
+        return self._deliveries[key]
+
+    def stage_state(self, register_name, value, server) -> None:
+        """ Update a value in the JSON state document of server, published by the next publish_state_documents. """
+        slug = server.descriptors[register_name].slug
+        delivery = self.delivery(register_name, server)
+        with self._state_lock:
+            self._state_documents.setdefault(server.name, {})[slug] = value
+            self._dirty_documents.add(server.name)
+            document_delivery = self._document_deliveries.get(server.name)
+            self._document_deliveries[server.name] = delivery if document_delivery is None else document_delivery.strictest(delivery)
+
+    def publish_state_documents(self, servers) -> None:
+        """ Publish the JSON state document of every server given that changed since it was last published.
+            The document holds the last value of every parameter read, so each entity's value_template finds its field. """
+        for server in servers:
+            with self._state_lock:
+                if server.name not in self._dirty_documents:
+                    continue
+                self._dirty_documents.discard(server.name)
+                payload = json.dumps(self._state_documents[server.name])
+                delivery = self._document_deliveries[server.name]
+            # one document of parameters of every tier: delivered as the strictest policy among them requires
+            self.enqueue(self.device_state_topic(server), payload, delivery.qos, delivery.retain)
+
+    def batch_command_topic(self, server) -> str:
+        """ Topic of JSON commands writing several write parameters of server at once, {slug: value}. """
+        return f"{self.base_topic}/{slugify(server.name)}/commands/set"
+
+    def device_state_topic(self, server) -> str:
+        """ Topic of the JSON state document of server. """
+        return f"{self.base_topic}/{slugify(server.name)}/state"
+
+    def diagnostics_topic(self, server) -> str:
+        """ Topic of the JSON diagnostics document of server, see App.publish_diagnostics. """
+        return f"{self.base_topic}/{slugify(server.name)}/diagnostics"
+
+    def publish_diagnostics(self, server, summary: dict[str, Any]) -> None:
+        self.enqueue(self.diagnostics_topic(server), json.dumps(summary))
+
+    def _entity_state_topic(self, descriptor, server) -> str:
+        return self.device_state_topic(server) if self.state_mode == "json" else descriptor.state_topic
+
+    @staticmethod
+    def _json_value_template(slug: str, value_template: Optional[str] = None) -> str:
+        """ Extract a field of the JSON state document as value, then apply the parameter's own value_template if any. """
+        return f"{{% set value = value_json['{slug}'] | string %}}" + (value_template or "{{ value }}")
             
 
     def publish_availability(self, avail, server):
         nickname = slugify(server.name)
         availability_topic = f"{self.base_topic}/{nickname}/availability"
-        msg_info = self.publish(availability_topic,
-                     "online" if avail else "offline", qos=1, retain=True)
-        
+        self._available[server.name] = avail
+        self.enqueue(availability_topic, "online" if avail else "offline", qos=1, retain=True)
+
+    def enqueue(self, topic: str, payload, qos: int = 0, retain: bool = False,
+                on_sent: Optional[Callable[[], None]] = None) -> None:
+        """ Queue a message for the broker. It replaces any message of the same topic not sent yet. See EgressQueue.put """
+        self.egress.put(topic, payload, qos, retain, on_sent)
+
+    def _send(self, topic: str, payload, qos: int, retain: bool) -> None:
+        msg_info = self.publish(topic, payload, qos=qos, retain=retain)
+        self.sent_by_qos[qos] += 1
+        if qos > 0:
+            self._unacked.append(msg_info)
+
+    def _egress_ready(self) -> bool:
+        """ Connected, and the broker acknowledges messages about as fast as they are sent. """
+        if not self.is_connected():
+            return False
+        self._forget_acknowledged()
+        return len(self._unacked) < self.max_inflight
+
+    def _forget_acknowledged(self) -> None:
+        while self._unacked and self._unacked[0].is_published():
+            self._unacked.popleft()
+
+    def log_throughput(self, interval: float = THROUGHPUT_LOG_INTERVAL) -> None:
+        """ Log the messages per second sent by QoS, at most every interval seconds. """
+        now = monotonic()
+        since, sent_before = self._throughput_mark
+        if now - since < interval:
+            return
+        sent = list(self.sent_by_qos)
+        rates = ", ".join(f"QoS {qos}: {(n - before) / (now - since):.1f}/s"
+                          for qos, (n, before) in enumerate(zip(sent, sent_before)) if n > before)
+        logger.info(f"MQTT throughput {rates or 'idle'}, {len(self._unacked)} unacknowledged, egress {self.egress.stats()}")
+        self._throughput_mark = (now, sent)
+
+    def loop_start(self):
+        result = super().loop_start()
+        self.egress.start()
+        return result
+
+    def loop_stop(self):
+        self.egress.stop(flush=True)
+        return super().loop_stop()
+
+    def close(self, timeout: float = 5) -> None:
+        """ Send the queued messages and wait for the broker to acknowledge them, for at most timeout seconds,
+            then disconnect cleanly. Unlike a lost connection, this does not stop the process. """
+        self._closing = True
+        self.egress.stop(flush=False)
+        deadline = monotonic() + timeout
+        while self.is_connected() and monotonic() < deadline:
+            self.egress.drain(limit_rate=False)     # as far as the in-flight window allows
+            self._forget_acknowledged()
+            if not self.egress.depth and not self._unacked:
+                break
+            sleep(0.01)
+        self.disconnect()
+        super().loop_stop()
 
     def ensure_connected(self, max_attempts: int = 3) -> None:
         """Block while not connected to the broker. Retry every second, for _max_attempts_, before stopping the process.
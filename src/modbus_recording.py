@@ -0,0 +1,368 @@
+"""
+    Record and replay of Modbus traffic, to reproduce production sessions on the bench.
+
+    A recording is a JSON lines file, gzip compressed when its path ends in .gz. The first line is a header
+    with the start time and the configured servers; every other line is one transaction:
+        t: seconds from the start of the recording to the request, d: seconds until the response,
+        c: client name, op: "read" or "write", u: unit id, rt: register type (enums.RegisterTypes value),
+        a: 1-indexed address, n: register count, and the outcome: r: registers read, v: values written,
+        e: Modbus exception code of an error response, x: error raised, e.g. a timeout
+"""
+import atexit
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+from dataclasses import asdict
+import gzip
+import json
+import logging
+import os
+from statistics import LinearRegression, StatisticsError, linear_regression, mean
+import threading
+from time import monotonic, sleep
+from typing import Any, Callable, Optional
+
+from pymodbus import ModbusException
+from pymodbus.pdu import ExceptionResponse
+
+from .client import ILLEGAL_DATA_ADDRESS, Client, PriorityLock, SpoofClient
+from .enums import RegisterTypes
+from .helpers import DATA_PATH
+from .options import ServerOptions
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+FLUSH_EVERY = 100       # transactions buffered before the file is flushed
+
+# Modbus function codes of the requests, for the exception responses replayed
+_FUNCTION_CODES = {("read", RegisterTypes.HOLDING_REGISTER.value): 3, ("read", RegisterTypes.INPUT_REGISTER.value): 4,
+                   ("write", RegisterTypes.HOLDING_REGISTER.value): 16}
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode + "t") if path.endswith(".gz") else open(path, mode)
+
+
+class Recorder:
+    """
+        Appends the transactions of one or more RecordingClients to a recording file. Thread safe.
+
+        Once a file reaches max_bytes, it is closed and recording continues in a new part, a complete
+        recording of its own: {path}-1.jsonl.gz, {path}-2.jsonl.gz, ... Only the last max_files parts are kept.
+    """
+
+    def __init__(self, path: str, servers: Optional[list[ServerOptions]] = None,
+                 max_bytes: Optional[int] = None, max_files: int = 1) -> None:
+        self.path = path
+        self.paths = [path]     # parts kept, oldest first
+        self.parts = 1
+        gz = path.endswith(".jsonl.gz")
+        self._root, self._ext = (path[:-len(".jsonl.gz")], ".jsonl.gz") if gz else os.path.splitext(path)
+        self.max_bytes = max_bytes
+        self.max_files = max(1, max_files)
+        self.transactions = 0
+        self._servers = [asdict(s) for s in servers or []]
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._open()
+
+    @classmethod
+    def in_data_path(cls, servers: Optional[list[ServerOptions]] = None, data_path: str = DATA_PATH,
+                     max_bytes: Optional[int] = None, max_files: int = 1) -> "Recorder":
+        """ New recording in {data_path}/recordings, named by start time and process (one per shard). """
+        name = f"modbus-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl.gz"
+        recorder = cls(os.path.join(data_path, "recordings", name), servers, max_bytes, max_files)
+        atexit.register(recorder.close)
+        logger.info(f"Recording Modbus traffic to {recorder.path}")
+        return recorder
+
+    def record(self, entry: dict[str, Any], start: float, end: float) -> None:
+        entry = {"t": round(start - self._start, 6), "d": round(end - start, 6), **entry}
+        with self._lock:
+            if self._file.closed:
+                return
+            self._write(entry)
+            self.transactions += 1
+            if self.transactions % FLUSH_EVERY == 0:
+                self._file.flush()
+                if self.max_bytes is not None and os.path.getsize(self.path) >= self.max_bytes:
+                    self._rotate()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def _open(self) -> None:
+        self._start = monotonic()
+        self._file = _open(self.path, "w")
+        self._write({"version": FORMAT_VERSION, "started": datetime.now().isoformat(timespec="seconds"),
+                     "servers": self._servers})
+
+    def _rotate(self) -> None:
+        """ Continue in the next part, removing the oldest parts beyond max_files. """
+        self._file.close()
+        self.path = f"{self._root}-{self.parts}{self._ext}"
+        self.parts += 1
+        self.paths.append(self.path)
+        while len(self.paths) > self.max_files:
+            oldest = self.paths.pop(0)
+            try:
+                os.remove(oldest)
+            except OSError as e:
+                logger.warning(f"Could not remove recording {oldest}: {e}")
+        self._open()
+        logger.info(f"Recording Modbus traffic to {self.path}")
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+class RecordingClient(Client):
+    """
+        Wraps a Client and records every read and write, with its latency and outcome, to a Recorder.
+        Latencies are timed once the client lock is held, so they exclude waiting on other threads.
+    """
+
+    def __init__(self, client: Client, recorder: Recorder) -> None:
+        self.name = client.name
+        self.inner = client
+        self.lock = client.lock
+        self.recorder = recorder
+
+    def read(self, address, count, slave_id, register_type):
+        entry: dict[str, Any] = {"c": self.name, "op": "read", "u": slave_id, "rt": register_type.value,
+                                 "a": address, "n": count}
+        with self.lock:
+            start = monotonic()
+            try:
+                result = self.inner.read(address, count, slave_id, register_type)
+            except ModbusException as e:
+                self.recorder.record({**entry, "x": str(e)}, start, monotonic())
+                raise
+            end = monotonic()
+        if result.isError():
+            entry["e"] = getattr(result, "exception_code", None)
+        else:
+            entry["r"] = list(result.registers)
+        self.recorder.record(entry, start, end)
+        return result
+
+    def write(self, values: list[int], address: int, slave_id: int, register_type):
+        entry: dict[str, Any] = {"c": self.name, "op": "write", "u": slave_id, "rt": register_type.value,
+                                 "a": address, "n": len(values), "v": list(values)}
+        with self.lock:
+            start = monotonic()
+            try:
+                result = self.inner.write(values, address, slave_id, register_type)
+            except ModbusException as e:
+                self.recorder.record({**entry, "x": str(e)}, start, monotonic())
+                raise
+            end = monotonic()
+        self.recorder.record(entry, start, end)
+        return result
+
+    def command_priority(self):
+        return self.inner.command_priority()
+
+    def connect(self, num_retries=2, sleep_interval=3) -> None:
+        self.inner.connect(num_retries, sleep_interval)
+
+    def close(self):
+        self.inner.close()
+
+
+class Recording:
+    """ Transactions of a recording file. A file cut short, e.g. by a crash, is read up to the last full line. """
+
+    def __init__(self, header: dict[str, Any], transactions: list[dict[str, Any]]) -> None:
+        self.header = header
+        self.transactions = transactions
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        lines = []
+        with _open(path, "r") as f:
+            try:
+                for line in f:
+                    lines.append(line)
+            except EOFError:
+                logger.warning(f"Recording {path} is truncated")
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break   # partial last line
+        if not entries or entries[0].get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} Modbus recording")
+        return cls(entries[0], entries[1:])
+
+    @property
+    def servers(self) -> list[ServerOptions]:
+        return [ServerOptions(**s) for s in self.header.get("servers", [])]
+
+    @property
+    def clients(self) -> list[str]:
+        return list(dict.fromkeys(entry["c"] for entry in self.transactions))
+
+    @property
+    def duration(self) -> float:
+        return max((entry["t"] + entry["d"] for entry in self.transactions), default=0)
+
+
+class ReplayClient(Client):
+    """
+        Serves the transactions a client recorded, at the original pace (speed 1), accelerated (speed > 1),
+        or without any delay (speed 0). Transactions are serialised on the client lock, as on the bus.
+
+        A request also recorded (same operation, unit id, register type, address and count) gets the outcome
+        and latency of the next recorded transaction of that request, so slow responses and intermittent
+        exceptions recur in their recorded order. The recorded transactions of a request repeat once used up.
+
+        Other requests, e.g. blocks planned differently than when recorded, are composed register by register
+        from the registers read closest before the replay position in the recording, with a latency fitted
+        to the recorded reads by register count. Registers never read successfully respond with the exception
+        code recorded for them, by default illegal data address.
+        Writes always succeed unless recorded as failing, and are read back.
+    """
+
+    def __init__(self,
+                 name: str,
+                 recording: Recording,
+                 speed: float = 1.0,
+                 clock: Callable[[], float] = monotonic,
+                 wait: Callable[[float], None] = sleep) -> None:
+        self.name = name
+        self.lock = PriorityLock()
+        self.speed = speed
+        self.clock = clock
+        self.wait = wait
+        self.requests = 0
+        self.registers_read = 0
+        self.composed = 0           # requests that were not recorded, see _compose
+        self._started: Optional[float] = None
+        self._position = 0.0        # recording time of the last recorded transaction served
+        self._written: dict[tuple[int, int, int], int] = {}    # (unit id, register type, address): value written
+
+        transactions = [entry for entry in recording.transactions if entry["c"] == name]
+        self.duration = max((entry["t"] + entry["d"] for entry in transactions), default=0)
+        self._by_request: dict[tuple, list[dict[str, Any]]] = defaultdict(list)
+        self._cursors: dict[tuple, int] = defaultdict(int)
+        # (unit id, register type, address): ([recording time], [value]) of every successful read and write
+        self._history: dict[tuple[int, int, int], tuple[list[float], list[int]]] = defaultdict(lambda: ([], []))
+        self._exceptions: dict[tuple[int, int, int], int] = {}
+        for entry in transactions:
+            self._by_request[self._request(entry["op"], entry["u"], entry["rt"], entry["a"], entry["n"])].append(entry)
+            values = entry.get("r") if entry["op"] == "read" else entry.get("v") if "x" not in entry else None
+            for i in range(entry["n"]):
+                key = (entry["u"], entry["rt"], entry["a"] + i)
+                if values is not None:
+                    times, history = self._history[key]
+                    times.append(entry["t"])
+                    history.append(values[i])
+                elif entry.get("e") is not None:
+                    self._exceptions.setdefault(key, entry["e"])
+
+        reads = [(entry["n"], entry["d"]) for entry in transactions if entry["op"] == "read" and "x" not in entry]
+        try:
+            self._latency_fit = linear_regression([n for n, _ in reads], [d for _, d in reads])
+        except StatisticsError:     # fewer than two reads, or all of the same count
+            self._latency_fit = LinearRegression(slope=0.0, intercept=mean(d for _, d in reads) if reads else 0.0)
+
+    @classmethod
+    def from_file(cls, path: str, speed: float = 1.0) -> list["ReplayClient"]:
+        """ A ReplayClient for every client of the recording at path. """
+        recording = Recording.load(path)
+        return [cls(name, recording, speed) for name in recording.clients]
+
+    @staticmethod
+    def _request(op: str, unit: int, register_type: int, address: int, count: int) -> tuple:
+        return (op, unit, register_type, address, count)
+
+    def replay_position(self) -> float:
+        """ Current position in the recording, in seconds. Wraps around at the end of the recording. """
+        if self.speed <= 0 or self._started is None:
+            position = self._position
+        else:
+            position = (self.clock() - self._started) * self.speed
+        return position % self.duration if self.duration > 0 else 0
+
+    def read(self, address, count, slave_id, register_type):
+        with self.lock:
+            self.requests += 1
+            self.registers_read += count
+            entry = self._next_recorded("read", slave_id, register_type, address, count)
+            if entry is None:
+                return self._compose(address, count, slave_id, register_type)
+            self._delay(entry["d"])
+            if "x" in entry:
+                raise ModbusException(entry["x"])
+            if entry.get("e") is not None:
+                return ExceptionResponse(_FUNCTION_CODES[("read", entry["rt"])], entry["e"], slave_id)
+            return SpoofClient.SpoofResponse(self._overlay(entry["r"], address, slave_id, register_type))
+
+    def write(self, values: list[int], address: int, slave_id: int, register_type):
+        if not register_type == RegisterTypes.HOLDING_REGISTER:
+            raise ValueError(f"unsupported register type {register_type}")
+        with self.lock:
+            self.requests += 1
+            entry = self._next_recorded("write", slave_id, register_type, address, len(values))
+            self._delay(entry["d"] if entry is not None else self._fitted_latency(len(values)))
+            if entry is not None and "x" in entry:
+                raise ModbusException(entry["x"])
+            for i, value in enumerate(values):
+                self._written[(slave_id, register_type.value, address + i)] = value
+            return SpoofClient.SpoofResponse(values)
+
+    def command_priority(self):
+        return self.lock.urgent()
+
+    def connect(self, num_retries=2, sleep_interval=3) -> None:
+        if self._started is None:
+            self._started = self.clock()
+
+    def close(self):
+        pass
+
+    def _next_recorded(self, op: str, unit: int, register_type: RegisterTypes, address: int, count: int) -> Optional[dict[str, Any]]:
+        if self._started is None:
+            self._started = self.clock()
+        request = self._request(op, unit, register_type.value, address, count)
+        entries = self._by_request.get(request)
+        if not entries:
+            return None
+        entry = entries[self._cursors[request] % len(entries)]
+        self._cursors[request] += 1
+        self._position = entry["t"]
+        return entry
+
+    def _compose(self, address: int, count: int, slave_id: int, register_type: RegisterTypes):
+        """ Response to a request not recorded, from the registers recorded closest before the replay position. """
+        self.composed += 1
+        self._delay(self._fitted_latency(count))
+        position = self.replay_position()
+        registers = []
+        for addr in range(address, address + count):
+            key = (slave_id, register_type.value, addr)
+            if key in self._written:
+                registers.append(self._written[key])
+                continue
+            times, history = self._history.get(key, ((), ()))
+            if not history:
+                code = self._exceptions.get(key, ILLEGAL_DATA_ADDRESS)
+                return ExceptionResponse(_FUNCTION_CODES[("read", register_type.value)], code, slave_id)
+            registers.append(history[max(0, bisect_right(times, position) - 1)])
+        return SpoofClient.SpoofResponse(registers)
+
+    def _overlay(self, registers: list[int], address: int, slave_id: int, register_type: RegisterTypes) -> list[int]:
+        """ Recorded registers, with the values written during the replay. """
+        return [self._written.get((slave_id, register_type.value, address + i), value) for i, value in enumerate(registers)]
+
+    def _fitted_latency(self, count: int) -> float:
+        slope, intercept = self._latency_fit
+        return max(0.0, intercept + slope * count)
+
+    def _delay(self, latency: float) -> None:
+        if self.speed > 0 and latency > 0:
+            self.wait(latency / self.speed)
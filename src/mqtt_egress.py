@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import threading
+from time import monotonic
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EgressMessage:
+    payload: Any
+    qos: int = 0
+    retain: bool = False
+    on_sent: Optional[Callable[[], None]] = None    # called once sent, on the sender thread
+
+
+class TokenBucket:
+    """
+        Token bucket rate limit: rate tokens per second, up to burst tokens saved up while idle.
+        A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float = 0, burst: int = 100, clock: Callable[[], float] = monotonic) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self._updated = clock()
+
+    def take(self) -> float:
+        """ Take a token. Returns 0 if one was taken, else the seconds until one is available. """
+        if self.rate <= 0:
+            return 0
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+def _chain(first: Optional[Callable[[], None]], then: Optional[Callable[[], None]]) -> Optional[Callable[[], None]]:
+    if first is None or then is None:
+        return first or then
+
+    def both():
+        first()
+        then()
+    return both
+
+
+class EgressQueue:
+    """
+        Bounded stage between the publishers (poll loop, discovery, availability) and paho.
+
+        Only the latest message per topic is kept: a message put while an older one of the same topic is
+        still queued replaces it in place, so stale values are superseded rather than sent in a burst later.
+        Messages are sent in order on a background thread, when ready() allows (e.g. connected to the broker
+        and acknowledgements not lagging) and the token bucket has a token.
+        Beyond max_queued distinct topics, the oldest queued state message (not retained) is dropped.
+        Retained messages, i.e. discovery configs and availability, are never dropped: they are bounded
+        by the number of entities, and a lost one would not be sent again.
+    """
+
+    def __init__(self,
+                 send: Callable[[str, Any, int, bool], None],
+                 rate: float = 0,
+                 burst: int = 100,
+                 max_queued: int = 10000,
+                 ready: Callable[[], bool] = lambda: True,
+                 clock: Callable[[], float] = monotonic) -> None:
+        self.send = send
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.max_queued = max_queued
+        self.ready = ready
+        self._queue: OrderedDict[str, EgressMessage] = OrderedDict()
+        self._droppable: OrderedDict[str, None] = OrderedDict()    # queued topics of messages not retained, oldest first
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="mqtt-egress", daemon=True)
+        self.enqueued = 0
+        self.sent = 0
+        self.superseded = 0     # replaced by a newer message of the same topic before they were sent
+        self.dropped = 0        # state messages discarded because the queue was full
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {"depth": self.depth, "enqueued": self.enqueued, "sent": self.sent,
+                    "superseded": self.superseded, "dropped": self.dropped}
+
+    def put(self, topic: str, payload: Any, qos: int = 0, retain: bool = False,
+            on_sent: Optional[Callable[[], None]] = None) -> None:
+        """ Queue a message. on_sent is called once it was sent, after the on_sent of any message it supersedes. """
+        with self._condition:
+            self.enqueued += 1
+            if topic in self._queue:
+                self.superseded += 1
+                on_sent = _chain(self._queue[topic].on_sent, on_sent)
+            elif len(self._queue) >= self.max_queued:
+                if not self._droppable and not retain:
+                    self.dropped += 1       # only retained messages queued: drop this one
+                    return
+                if self._droppable:
+                    oldest, _ = self._droppable.popitem(last=False)
+                    del self._queue[oldest]
+                    self.dropped += 1
+            self._queue[topic] = EgressMessage(payload, qos, retain, on_sent)
+            if retain:
+                self._droppable.pop(topic, None)
+            else:
+                self._droppable[topic] = None
+            self._condition.notify()
+
+    def drain(self, limit_rate: bool = True) -> float:
+        """Send queued messages until the queue is empty, ready() fails, or the rate limit is reached.
+
+        Returns:
+            float: seconds to wait for the next token, 0 if the queue is empty or not ready
+        """
+        while True:
+            with self._condition:
+                if not self._queue or not self.ready():
+                    return 0
+                if limit_rate:
+                    wait = self.bucket.take()
+                    if wait > 0:
+                        return wait
+                topic, message = self._queue.popitem(last=False)
+                self._droppable.pop(topic, None)
+                self.sent += 1
+            self.send(topic, message.payload, message.qos, message.retain)
+            if message.on_sent is not None:
+                message.on_sent()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, flush: bool = True) -> None:
+        """ Stop the sender thread. With flush, messages still queued are sent first, without the rate limit. """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+        if flush:
+            self.drain(limit_rate=False)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+            try:
+                wait = self.drain()
+            except Exception as e:
+                logger.error(f"Exception while publishing to MQTT: {e}")
+                wait = 0.1
+            with self._condition:
+                if self._queue and not self._stopped:
+                    # not ready: poll again shortly, as readiness changes without a put
+                    self._condition.wait(timeout=wait or 0.1)
@@ -1,48 +1,72 @@
+import json
+import threading
+from typing import Any
 from .server import Server
+from .client import Client
+from .command_executor import CommandExecutor
+from .descriptors import ParameterDescriptor
 from .modbus_mqtt import MqttClient
+from .write_shadow import Debouncer, WriteShadow
 import logging
 logger = logging.getLogger(__name__)
 
 class MessageHandler:
-    def __init__(self, servers: list[Server], mqtt_client: MqttClient):
+    def __init__(self, servers: list[Server], mqtt_client: MqttClient, write_debounce: float = 0, write_dedupe: bool = True):
         self.devices = servers
         self.mqtt_client = mqtt_client
+        self.executors: dict[Client, CommandExecutor] = {}     # one command worker per modbus client
+        # executor is called from the paho network thread and the Debouncer timer threads
+        self._executors_lock = threading.Lock()
+        # commands to the same topic within write_debounce seconds are coalesced into the latest
+        self.debouncer = Debouncer(write_debounce, self._submit_write)
+        # writes of the value a write parameter already holds are skipped
+        self.write_dedupe = write_dedupe
+        self.shadow = WriteShadow()
 
-    def _decode_subscribed_topic(self, msg_topic: str) -> tuple[Server, str]:
+    def decode_and_write(self, msg_topic: str, msg_payload_decoded: str) -> None:
         """
-            Finds the implicated device and its register, by MQTT message topic.
+            Finds implied register from topic, and queues the write on the command worker of the server's client.
+            Called on the paho network thread.
 
-        Args:
-            msg_topic (str): topic of the incoming message (usually a command_topic)
+            Topics are looked up in MqttClient.command_routes. Others matching the wildcard command subscription,
+            e.g. of servers polled by another shard, are ignored.
+        """
+        batch_server = self.mqtt_client.batch_routes.get(msg_topic)
+        if batch_server is not None:
+            self.executor(batch_server.connected_client).submit(self.write_batch, batch_server, msg_payload_decoded)
+            return
 
-        Raises:
-            ValueError: If the command_topic format does not match any of the defined devices
+        # find implied register from topic
+        route = self.mqtt_client.command_routes.get(msg_topic)
+        if route is None:
+            logger.debug(f"Ignoring {msg_topic}: no write parameter of this process")
+            return
+        server, descriptor = route
+        logger.info(f"Decoded {msg_topic=}: {server.name=}, {descriptor.slug=}")
+        self.debouncer.submit(msg_topic, msg_payload_decoded)
 
-        Returns:
-            tuple[str, str]: _description_
-        """
-        # command_topic = f"{self.base_topic}/{server.nickname}/{slugify(register_name)}/set"
-        logger.info(f"decoding {msg_topic}")
-        server_ha_display_name: str = msg_topic.split('/')[1]
-        s = None
-        device = None
-        for s in self.devices: 
-            logger.info(f"comparing {s.name}, {server_ha_display_name}")
-            if s.name.lower() == server_ha_display_name:
-                device = s
-                break
-        if device is None: raise ValueError(f"Server {server_ha_display_name} not available. Cannot write.")
-        register_name: str = msg_topic.split('/')[2]
-
-        logger.info(f"Decoded {msg_topic=}: {device=}, {register_name=}")
-        return (device, register_name)
+    def _submit_write(self, msg_topic: str, msg_payload_decoded: str) -> None:
+        server, descriptor = self.mqtt_client.command_routes[msg_topic]
+        self.executor(server.connected_client).submit(self.write, server, descriptor, msg_payload_decoded)
 
-    def decode_and_write(self, msg_topic: str, msg_payload_decoded: str) -> None:
+    def executor(self, client: Client) -> CommandExecutor:
+        with self._executors_lock:
+            if client not in self.executors:
+                self.executors[client] = CommandExecutor(client)
+            return self.executors[client]
+
+    def join(self) -> None:
+        """ Block until every command received so far has been executed. """
+        with self._executors_lock:
+            executors = list(self.executors.values())
+        for executor in executors:
+            executor.join()
+
+    def write(self, server: Server, descriptor: ParameterDescriptor, msg_payload_decoded: str) -> None:
         """
-            Finds implied register from topic, writes and updates entity state by a read back.
+            Writes a write parameter and updates its entity state by a read back. Runs on the command worker.
         """
-        # find implied register from topic
-        server, register_name = self._decode_subscribed_topic(msg_topic)
+        register_name = descriptor.slug
 
         if register_name == "power_switch":
             logger.info(f"Work-around Switch logic for {register_name=}")
@@ -54,19 +78,61 @@ class MessageHandler:
 
             return
 
+        param_name = descriptor.name
+        param_details = descriptor.definition
+
+        if self._unchanged(server, descriptor, msg_payload_decoded):
+            logger.info(f"Skipping write of {param_name}: already {msg_payload_decoded}")
+            return
+
         # write
         server.write_registers(register_name, msg_payload_decoded)
 
         # update state by read back (skip for write-only button commands)
-        param_name = server.write_parameters_slug_to_name[register_name]
-        param_details = server.write_parameters[param_name]
-        
         if param_details.get("payload_press") is not None:
             logger.info(f"Skipping read back for button command {param_name}")
             return
             
         value = server.read_registers(param_name)
         logger.info(f"Read back after write attempt {value=}")
+        self.shadow.record(server, {param_name: value})
         self.mqtt_client.publish_to_ha(
-            register_name, value, server)
-    
\ No newline at end of file
+            param_name, value, server)
+
+    def write_batch(self, server: Server, msg_payload_decoded: str) -> None:
+        """
+            Writes several write parameters of a JSON command, {slug: value}, and publishes their read back.
+            Runs on the command worker, so the writes and read back are not interleaved with poll reads.
+        """
+        try:
+            values: dict[str, Any] = json.loads(msg_payload_decoded)
+        except ValueError as e:
+            logger.error(f"Invalid batch command for {server.name}: {e}")
+            return
+        if not isinstance(values, dict):
+            logger.error(f"Batch command for {server.name} must be a JSON object of write parameter slugs to values")
+            return
+        if "power_switch" in values:
+            logger.error(f"power_switch of {server.name} cannot be batched. Use its own command topic")
+            del values["power_switch"]
+        descriptors = server.write_descriptors_by_slug
+        values = {slug: value for slug, value in values.items()
+                  if slug not in descriptors or not self._unchanged(server, descriptors[slug], value)}
+        if not values:
+            logger.info(f"Skipping batch write to {server.name}: no changed values")
+            return
+
+        read_back = server.write_batch(values)
+        self.shadow.record(server, read_back)
+        logger.info(f"Read back after batch write {read_back}")
+        for param_name, value in read_back.items():
+            self.mqtt_client.publish_to_ha(param_name, value, server)
+
+    def _unchanged(self, server: Server, descriptor: ParameterDescriptor, value: Any) -> bool:
+        """ Whether a write can be skipped, as the write parameter already holds value. Buttons are always written. """
+        if not self.write_dedupe or descriptor.definition.get("payload_press") is not None:
+            return False
+        if self.shadow.matches(server, descriptor, value):
+            self.shadow.skipped += 1
+            return True
+        return False
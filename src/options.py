@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import Union
+from dataclasses import dataclass, field
+from typing import Optional, Union
 
 
 @dataclass
@@ -34,6 +34,32 @@ class ModbusRTUOptions(ClientOptions):
     stopbits: int
 
 
+@dataclass
+class PollOverride:
+    """ Poll tier override for one parameter of a server type, as read from config json"""
+    server_type: str
+    parameter: str
+    tier: str       # one of enums.PollTier values: fast, normal, slow, once
+
+
+@dataclass
+class DeadbandOptions:
+    """ Publish deadband of a device class or a parameter, as read from config json"""
+    device_class: Optional[str] = None      # one of enums.DeviceClass values, e.g. power
+    parameter: Optional[str] = None
+    absolute: float = 0     # in the unit of the parameter
+    relative: float = 0     # fraction of the last published value
+
+
+@dataclass
+class PublishPolicyOptions:
+    """ QoS and retain flag of the state messages of a poll tier or a parameter, as read from config json"""
+    tier: Optional[str] = None              # one of enums.PollTier values: fast, normal, slow, once
+    parameter: Optional[str] = None
+    qos: Optional[int] = None               # 0, 1 or 2. Defaults to mqtt_qos
+    retain: Optional[bool] = None           # defaults to mqtt_retain
+
+
 @dataclass
 class AppOptions:
     """ Concatenated options for reading specific format of all options from config json """
@@ -54,3 +80,39 @@ class AppOptions:
     mqtt_reconnect_attempts: int
 
     debug: bool
+
+    read_max_gap: int = 0   # unmapped registers bridged when merging parameters into one block read
+    runtime: str = "sync"   # "sync": poll all clients in turn; "async": poll each client concurrently on asyncio
+    shards: int = 1         # number of worker processes the clients are partitioned across
+
+    poll_interval_normal: float = 10    # seconds between reads of PollTier.NORMAL parameters
+    poll_interval_slow: float = 300     # seconds between reads of PollTier.SLOW parameters
+    poll_overrides: list[PollOverride] = field(default_factory=list)
+
+    publish_on_change: bool = True      # publish values only when changed beyond their deadband
+    publish_min_interval: float = 0     # minimum seconds between publishes of a changed value
+    publish_max_silence: float = 300    # seconds after which an unchanged value is published again, even if not read again. 0 disables
+    deadbands: list[DeadbandOptions] = field(default_factory=list)
+
+    mqtt_state_mode: str = "topics"     # "topics": a state topic per parameter; "json": one state document per server and cycle
+    discovery_cache: bool = True        # only publish discovery configs that changed since the last start
+    discovery_compact: bool = False     # abbreviated discovery keys, `~` base topic and collapsed templates
+    discovery_mode: str = "entity"      # "entity": one config per parameter. "device": one config per server
+
+    mqtt_rate_limit: float = 0          # messages per second sent to the broker. 0 disables
+    mqtt_rate_burst: int = 100          # messages sent at once after an idle period, within the rate limit
+    mqtt_max_queued: int = 10000        # topics queued for the broker before the oldest is dropped
+
+    mqtt_qos: int = 1                   # QoS of state messages
+    mqtt_retain: bool = False           # retain flag of state messages
+    publish_policies: list[PublishPolicyOptions] = field(default_factory=list)
+    mqtt_max_inflight: int = 20         # QoS 1/2 messages sent but not acknowledged by the broker
+
+    write_debounce: float = 0.2         # seconds in which commands to the same parameter are coalesced into the latest
+    write_dedupe: bool = True           # skip writes of the value a write parameter already holds
+
+    diagnostics_interval: float = 60    # seconds between published summaries of request latencies and errors. 0 disables
+
+    modbus_recording: bool = False      # record all Modbus transactions to {data path}/recordings, see modbus_recording.py
+    modbus_recording_max_size: int = 50     # MB per recording file, before recording continues in a new part
+    modbus_recording_max_files: int = 4     # recording parts kept per process, the oldest are removed
@@ -0,0 +1,85 @@
+import logging
+from math import inf
+from typing import Collection, Optional
+
+from .enums import Parameter, PollTier, WriteParameter, device_class_to_poll_tier
+from .read_planner import ReadBlock, plan_reads
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_poll_tier(param: Parameter | WriteParameter, is_write_parameter: bool,
+                      override: Optional[PollTier] = None) -> PollTier:
+    """ Poll tier of a parameter: the add-on option override, else the register map poll_tier,
+        else a default by device class for read-only parameters, else PollTier.NORMAL. """
+    if override is not None:
+        return override
+    if "poll_tier" in param:
+        return param["poll_tier"]
+    if is_write_parameter:
+        return PollTier.NORMAL
+    return device_class_to_poll_tier.get(param.get("device_class"), PollTier.NORMAL)  # type: ignore
+
+
+class PollSchedule:
+    """
+        Block reads of one server, planned separately per poll tier, and when each tier is next due.
+
+        Tiers are due by time: a tier polled in the cycle sampled at t is due again at t + its interval.
+        Times are the sample instants of the cycle scheduler, not the time of each read, so that a
+        late wake-up or a slow bus does not push a tier into the next cycle.
+        PollTier.ONCE is due only after construction or reset(), i.e. after every (re)connect.
+    """
+
+    def __init__(self, plans: dict[PollTier, list[ReadBlock]], intervals: dict[PollTier, float]) -> None:
+        self.plans = plans
+        self.intervals = intervals
+        self.next_due: dict[PollTier, float] = {}
+        self.reset()
+
+    @classmethod
+    def build(cls, parameters: dict[str, Parameter | WriteParameter], write_parameter_names,
+              intervals: dict[PollTier, float], overrides: Optional[dict[str, PollTier]] = None,
+              max_gap: int = 0, split_before: Collection[str] = ()) -> "PollSchedule":
+        """Plan block reads for each tier.
+
+        Args:
+            parameters (dict[str, Parameter | WriteParameter]): parameters and write parameters to poll, by name
+            write_parameter_names: names in parameters that are write parameters
+            intervals (dict[PollTier, float]): seconds between polls of each tier
+            overrides (dict[str, PollTier], optional): tier by parameter name, taking precedence over the register map
+            max_gap (int, optional): see read_planner.plan_reads. Defaults to 0.
+            split_before (Collection[str], optional): see read_planner.plan_reads. Defaults to ().
+        """
+        overrides = overrides or {}
+        by_tier: dict[PollTier, dict] = {}
+        for name, param in parameters.items():
+            tier = resolve_poll_tier(param, name in write_parameter_names, overrides.get(name))
+            by_tier.setdefault(tier, {})[name] = param
+
+        plans = {tier: plan_reads(params, max_gap=max_gap, split_before=split_before) for tier, params in by_tier.items()}
+        return cls(plans, intervals)
+
+    def reset(self) -> None:
+        """ Make every tier, including PollTier.ONCE, due immediately. """
+        self.next_due = {tier: 0.0 for tier in self.plans}
+
+    def replan(self, plans: dict[PollTier, list[ReadBlock]]) -> None:
+        """ Replace the block reads, keeping when each tier is next due. New tiers are due immediately. """
+        self.plans = plans
+        self.next_due = {tier: self.next_due.get(tier, 0.0) for tier in plans}
+
+    def due(self, now: float) -> list[PollTier]:
+        """ Tiers due in the cycle sampled at time now, in PollTier order. """
+        return [tier for tier in PollTier if tier in self.plans and self.next_due[tier] <= now]
+
+    def polled(self, tier: PollTier, now: float) -> None:
+        """ Record that tier was read in the cycle sampled at time now. """
+        if tier == PollTier.ONCE:
+            self.next_due[tier] = inf
+        else:
+            self.next_due[tier] = now + self.intervals.get(tier, 0)
+
+    @property
+    def num_reads(self) -> int:
+        return sum(len(blocks) for blocks in self.plans.values())
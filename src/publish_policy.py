@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from .enums import PollTier
+from .options import AppOptions
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """ MQTT QoS and retain flag of a state message. """
+    qos: int = 1
+    retain: bool = False
+
+    def strictest(self, other: "Delivery") -> "Delivery":
+        """ Delivery meeting both: the higher QoS, retained if either is. """
+        return Delivery(max(self.qos, other.qos), self.retain or other.retain)
+
+
+class PublishPolicy:
+    """
+        Delivery of the state messages of each parameter: set per parameter, else per poll tier, else the default.
+
+        E.g. high rate telemetry on QoS 0, while energy counters and setpoint read-backs stay on QoS 1.
+    """
+
+    def __init__(self,
+                 default: Delivery = Delivery(),
+                 by_tier: Optional[dict[PollTier, Delivery]] = None,
+                 by_parameter: Optional[dict[str, Delivery]] = None) -> None:
+        self.default = default
+        self.by_tier = by_tier or {}
+        self.by_parameter = by_parameter or {}
+
+    @classmethod
+    def from_options(cls, opts: AppOptions) -> "PublishPolicy":
+        default = Delivery(opts.mqtt_qos, opts.mqtt_retain)
+
+        def delivery(policy) -> Delivery:
+            return Delivery(default.qos if policy.qos is None else policy.qos,
+                            default.retain if policy.retain is None else policy.retain)
+
+        by_tier = {PollTier(p.tier): delivery(p) for p in opts.publish_policies if p.tier}
+        by_parameter = {p.parameter: delivery(p) for p in opts.publish_policies if p.parameter}
+        return cls(default, by_tier, by_parameter)
+
+    def delivery(self, parameter_name: str, tier: Optional[PollTier] = None) -> Delivery:
+        if parameter_name in self.by_parameter:
+            return self.by_parameter[parameter_name]
+        return self.by_tier.get(tier, self.default)  # type: ignore
@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+from itertools import groupby
+import logging
+from typing import Collection
+
+from .enums import Parameter, RegisterTypes, WriteParameter
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of 16-bit registers in a single read request (Modbus PDU limit)
+MAX_READ_COUNT = 125
+
+
+@dataclass
+class ReadBlock:
+    """
+        A single Modbus read request covering one or more parameters.
+
+        address is 1-indexed, as in the register maps. Each parameter is sliced from the
+        block result at offset parameter["addr"] - address.
+    """
+    register_type: RegisterTypes
+    address: int
+    count: int
+    parameters: dict[str, Parameter | WriteParameter] = field(default_factory=dict)
+
+    @property
+    def end(self) -> int:
+        """ First address after the block. """
+        return self.address + self.count
+
+    def offset(self, parameter_name: str) -> int:
+        return self.parameters[parameter_name]["addr"] - self.address
+
+    @classmethod
+    def covering(cls, parameters: dict[str, Parameter | WriteParameter]) -> "ReadBlock":
+        """ The smallest block covering all parameters, which must share a register_type. """
+        address = min(param["addr"] for param in parameters.values())
+        end = max(param["addr"] + param["count"] for param in parameters.values())
+        register_type = next(iter(parameters.values()))["register_type"]
+        return cls(register_type=register_type, address=address, count=end - address, parameters=dict(parameters))
+
+
+def plan_reads(parameters: dict[str, Parameter | WriteParameter],
+               max_gap: int = 0,
+               max_count: int = MAX_READ_COUNT,
+               split_before: Collection[str] = ()) -> list[ReadBlock]:
+    """Group parameters into the fewest read requests.
+
+    Parameters are grouped by register_type and sorted by address. Consecutive parameters
+    are merged into one block while the unused registers between them do not exceed
+    max_gap and the block stays within max_count registers. Overlapping parameters
+    (e.g. two names for the same register) share a block.
+    Parameters named in split_before always start a new block, e.g. because the device
+    rejects reads of the unmapped registers before them.
+
+    Args:
+        parameters (dict[str, Parameter | WriteParameter]): parameters to read, by name
+        max_gap (int, optional): number of unmapped registers that may be bridged. Defaults to 0.
+        max_count (int, optional): maximum registers per request. Defaults to MAX_READ_COUNT.
+        split_before (Collection[str], optional): parameter names that must start a new block. Defaults to ().
+
+    Returns:
+        list[ReadBlock]: read requests covering every parameter exactly once
+    """
+    def sort_key(item):
+        name, param = item
+        return (param["register_type"].value, param["addr"], -param["count"])
+
+    blocks: list[ReadBlock] = []
+    for register_type_value, group in groupby(sorted(parameters.items(), key=sort_key),
+                                              key=lambda item: item[1]["register_type"].value):
+        block: ReadBlock | None = None
+        for name, param in group:
+            param_end = param["addr"] + param["count"]
+            if (block is not None
+                    and name not in split_before
+                    and param["addr"] - block.end <= max_gap
+                    and max(block.end, param_end) - block.address <= max_count):
+                block.count = max(block.end, param_end) - block.address
+                block.parameters[name] = param
+                continue
+
+            block = ReadBlock(register_type=param["register_type"],
+                              address=param["addr"],
+                              count=param["count"],
+                              parameters={name: param})
+            blocks.append(block)
+
+    logger.debug(f"Planned {len(parameters)} parameters into {len(blocks)} reads")
+    return blocks
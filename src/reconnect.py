@@ -0,0 +1,113 @@
+import logging
+from queue import Empty, Queue
+from random import random
+import threading
+from time import monotonic
+from typing import Callable
+
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+# delay before the first reconnect attempt, doubled after every failed attempt
+RECONNECT_DELAY_MIN = 2
+RECONNECT_DELAY_MAX = 300
+
+
+class Backoff:
+    """
+        Exponential backoff with jitter: the n-th delay is drawn uniformly from
+        [d/2, d], with d = min(max_delay, min_delay * 2**n).
+    """
+
+    def __init__(self, min_delay: float = RECONNECT_DELAY_MIN, max_delay: float = RECONNECT_DELAY_MAX,
+                 rng: Callable[[], float] = random) -> None:
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.rng = rng
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.max_delay, self.min_delay * 2 ** self.attempts)
+        self.attempts += 1
+        return delay * (0.5 + self.rng() / 2)
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+class ReconnectSupervisor:
+    """
+        Reconnects disconnected servers on a background thread, so that Server.connect
+        (client reconnect retries, availability check, model read) never runs on the polling thread.
+
+        Servers are retried with per-server exponential backoff and jitter. A server that answers
+        is handed back through take_reconnected(); the polling thread resumes polling it.
+    """
+
+    def __init__(self, clock: Callable[[], float] = monotonic, rng: Callable[[], float] = random) -> None:
+        self.clock = clock
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._pending: dict[Server, tuple[float, Backoff]] = {}     # server: (next attempt, backoff)
+        self._reconnected: Queue[Server] = Queue()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="reconnect", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wake.set()
+
+    def add(self, server: Server) -> None:
+        """ Start reconnect attempts for a server that is no longer polled. """
+        backoff = Backoff(rng=self.rng)
+        with self._lock:
+            self._pending[server] = (self.clock() + backoff.next_delay(), backoff)
+        self._wake.set()
+
+    def take_reconnected(self) -> list[Server]:
+        """ Servers that reconnected since the last call. """
+        servers = []
+        while True:
+            try:
+                servers.append(self._reconnected.get_nowait())
+            except Empty:
+                return servers
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.clear()
+            next_attempt = self.attempt_due()
+            self._wake.wait(timeout=max(0.0, next_attempt - self.clock()))
+
+    def attempt_due(self) -> float:
+        """ Try to connect the servers whose next attempt is due. Returns the time of the next attempt. """
+        now = self.clock()
+        with self._lock:
+            due = [server for server, (next_attempt, _) in self._pending.items() if next_attempt <= now]
+
+        for server in due:
+            logger.info("Retrying connection to %s" % server.name)
+            try:
+                success: bool = server.connect()
+            except Exception as e:
+                logger.error(f"Exception while reconnecting to server {server.name}: {e}")
+                success = False
+
+            with self._lock:
+                _, backoff = self._pending[server]
+                if success:
+                    del self._pending[server]
+                else:
+                    delay = backoff.next_delay()
+                    self._pending[server] = (self.clock() + delay, backoff)
+                    logger.error(f"Error Connecting to server {server.name}. Retrying in {delay:.0f}s")
+            if success:
+                self._reconnected.put(server)
+
+        with self._lock:
+            return min((t for t, _ in self._pending.values()), default=now + 60)
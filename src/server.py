@@ -1,18 +1,31 @@
 from abc import abstractmethod, ABC
 import logging
-from typing import Any, Optional, TypedDict
+from time import perf_counter
+from typing import Any, Callable, Optional, TypedDict
 
 from pymodbus import ModbusException
-from .enums import DataType, HAEntityType, RegisterTypes, Parameter, DeviceClass, WriteParameter
-from .client import Client
+from .enums import DataType, HAEntityType, RegisterTypes, Parameter, DeviceClass, WriteParameter, PollTier
+from .client import Client, ILLEGAL_DATA_ADDRESS
 from .options import ServerOptions
 from .parameter_types import ParamInfo, HAParamInfo
 from .helpers import slugify, with_retries
+from .read_planner import ReadBlock, plan_reads
+from .poll_schedule import PollSchedule, resolve_poll_tier
+from .address_map import AddressMap
+from . import codec
+from .descriptors import ParameterDescriptor, compile_descriptors
+from .metrics import ServerMetrics
+
+# MQTT base topic of descriptors compiled before App sets the configured one
+DEFAULT_BASE_TOPIC = "modbus"
+MAX_WRITE_COUNT = 123   # registers per Write Multiple Registers request
 
 logger = logging.getLogger(__name__)
 
 class ReadException(Exception):
-    pass
+    def __init__(self, msg: str = "", exception_code: Optional[int] = None) -> None:
+        super().__init__(msg)
+        self.exception_code = exception_code    # Modbus exception code of the error response, if any
 
 
 class Server(ABC):
@@ -30,6 +43,13 @@ class Server(ABC):
         self.connected_client: Client = connected_client
 
         self._model: str = "unknown"
+        self.poll_schedule: PollSchedule = PollSchedule({}, {})
+        self.address_map: Optional[AddressMap] = None       # unreadable registers, learned by bisect_block. Set once the model is known
+        self._poll_schedule_args: tuple = ((), {}, None, 0)
+        self._base_topic: str = DEFAULT_BASE_TOPIC
+        self._descriptors: Optional[dict[str, ParameterDescriptor]] = None
+        self._write_descriptors_by_slug: dict[str, ParameterDescriptor] = {}
+        self.metrics = ServerMetrics()      # request latencies and errors, see App.publish_diagnostics
 
         logger.info(f"Server {self.name} set up.")
 
@@ -59,9 +79,35 @@ class Server(ABC):
     @property
     def write_parameters_slug_to_name(self) -> dict[str, str]:
         """ Return a dictionary of mapping slugs to writeparameter names."""
-        write_parameters_slug_to_name: dict[str, str] = {slugify(name):name for name in self.write_parameters.copy()}
-        # logging.info(f"map {write_parameters_slug_to_name}" )
-        return write_parameters_slug_to_name
+        return {slug: descriptor.name for slug, descriptor in self.write_descriptors_by_slug.items()}
+
+    @property
+    def descriptors(self) -> dict[str, ParameterDescriptor]:
+        """ Compiled parameters and write parameters by name. Parameters take precedence over write parameters of the same name. """
+        if self._descriptors is None:
+            self.compile_descriptors()
+        return self._descriptors  # type: ignore
+
+    @property
+    def write_descriptors_by_slug(self) -> dict[str, ParameterDescriptor]:
+        """ Compiled write parameters by slug, as used in command topics. """
+        if self._descriptors is None:
+            self.compile_descriptors()
+        return self._write_descriptors_by_slug
+
+    def compile_descriptors(self, base_topic: Optional[str] = None) -> None:
+        """ Compile the register maps into descriptors. Call again after parameters or write parameters change.
+
+            Args:
+                base_topic (str, optional): MQTT base topic. Defaults to the last one used.
+        """
+        if base_topic is not None:
+            self._base_topic = base_topic
+        nickname = slugify(self.name)
+        write_descriptors = compile_descriptors(self.write_parameters, nickname, self._base_topic, self._decoder, self._encoder)
+        read_descriptors = compile_descriptors(self.parameters, nickname, self._base_topic, self._decoder, self._encoder)
+        self._write_descriptors_by_slug = {descriptor.slug: descriptor for descriptor in write_descriptors.values()}
+        self._descriptors = write_descriptors | read_descriptors
 
     @abstractmethod
     def read_model(self) -> str:
@@ -79,21 +125,16 @@ class Server(ABC):
             Requires self.model. Call self.read_model() first."""
 
     @classmethod
-    @abstractmethod
-    def _decoded(cls, registers: list, dtype: DataType):
-        """
-        Server-specific decoding for registers read.
-
-        Parameters:
-        -----------
-        registers: list: list of ints as read from 16-bit ModBus Registers
-        dtype: (DataType.U16, DataType.I16, DataType.U32, DataType.I32, ...)
-        """
+    def _decoder(cls, dtype: DataType, count: int) -> Callable[[bytes, int], Any]:
+        """ Decoder of a value of a single DataType from a buffer of packed registers, resolved once per parameter by compile_descriptors.
+            Defaults to the big-endian Modbus codec. Override for servers with other encodings. """
+        return codec.buffer_decoder(dtype, count)
 
     @classmethod
-    @abstractmethod
-    def _encoded(cls, content):
-        "Server-specific encoding of content"
+    def _encoder(cls, dtype: DataType) -> Callable[[Any], list[int]]:
+        """ Encoder of values of a single DataType, resolved once per parameter by compile_descriptors.
+            Defaults to the big-endian Modbus codec. Override for servers with other encodings. """
+        return codec.encoder(dtype)
 
     @property
     def model(self) -> str:
@@ -155,7 +196,7 @@ class Server(ABC):
     def read_registers(self, parameter_name: str):
         """Read a group of registers (parameter) using pymodbus
 
-            Requires implementation of the abstract method 'Server._decoded()'
+            Decoded by the decoder of the parameter's DataType, see Server._decoder
 
         Args:
             parameter_name (str): slave parameter name string as defined in register map
@@ -166,90 +207,240 @@ class Server(ABC):
         Returns:
             _type_: _description_
         """
-        device_class_to_rounding: dict[DeviceClass, int] = {    # TODO define in deviceClass type
-            DeviceClass.REACTIVE_POWER: 0,
-            DeviceClass.ENERGY: 1,
-            DeviceClass.FREQUENCY: 2,
-            DeviceClass.POWER_FACTOR: 1,
-            DeviceClass.APPARENT_POWER: 0, 
-            DeviceClass.CURRENT: 1,
-            DeviceClass.VOLTAGE: 1,
-            DeviceClass.POWER: 1
-        }
-        param = self.parameters.get(parameter_name, self.write_parameters.get(parameter_name))  # type: ignore
-        if param is None:
+        descriptor = self.descriptors.get(parameter_name)
+        if descriptor is None:
             logger.info(f"No parameter {parameter_name=} for server {self.name} defined. Attempt to read.")
             raise ValueError(f"No parameter {parameter_name=} for server {self.name} defined. Attempt to read.")
 
-        address = param["addr"]
-        dtype = param["dtype"]
-        multiplier = param["multiplier"]
-        # count = param.get('count', dtype.size // 2) #TODO
-        count = param["count"]  # TODO
-        unit = param.get("unit", None)
-        device_class = param.get('device_class', None)
-        slave_id = self.modbus_id
-        register_type = param['register_type']
-
-        # TODO count
         logger.debug(
-            f"Reading param {parameter_name} ({register_type}) of {dtype=} from {address=}, {multiplier=}, {count=}, {self.modbus_id=}")
+            f"Reading param {parameter_name} ({descriptor.register_type}) of {descriptor.dtype=} from {descriptor.addr=}, "
+            f"{descriptor.multiplier=}, {descriptor.count=}, {self.modbus_id=}")
 
         result = self.connected_client.read(
-            address, count, self.modbus_id, register_type)
+            descriptor.addr, descriptor.count, self.modbus_id, descriptor.register_type)
 
         if result.isError(): # config error, not connection
             self.connected_client._handle_error_response(result)
             raise ReadException(f"Error reading register {parameter_name}") 
 
         logger.debug(f"Raw register value: {result.registers}")
-        val = self._decoded(result.registers, dtype)
-        if multiplier != 1:
-            val *= multiplier
-        if isinstance(val, int) or isinstance(val, float):
-            val = round(
-                val, device_class_to_rounding.get(device_class, 2))
-        logger.debug(f"Read {parameter_name} = {val} {unit}")
-
+        val = descriptor.decode(result.registers)
+        logger.debug(f"Read {parameter_name} = {val} {descriptor.unit}")
         return val
 
+    def build_read_plan(self, parameter_names, max_gap: int = 0) -> list[ReadBlock]:
+        """ Plan block reads for the named parameters/ write parameters, regardless of poll tier. """
+        return plan_reads(self._parameters_by_name(parameter_names), max_gap=max_gap)
+
+    def build_poll_schedule(self, parameter_names, intervals, overrides=None, max_gap: int = 0) -> PollSchedule:
+        """ Plan block reads per poll tier for the named parameters/ write parameters and store the schedule in self.poll_schedule.
+
+            Call after setup_valid_registers_for_model(), which may remove unsupported registers.
+            Parameters the address map marks as unreadable are left out.
+        """
+        self._poll_schedule_args = (parameter_names, intervals, overrides, max_gap)
+        self.poll_schedule = self._build_poll_schedule(parameter_names, intervals, overrides, max_gap)
+        logger.info(f"Server {self.name}: {len(parameter_names)} parameters planned into {self.poll_schedule.num_reads} reads "
+                    f"({', '.join(f'{tier.value}: {len(blocks)}' for tier, blocks in self.poll_schedule.plans.items())})")
+        return self.poll_schedule
+
+    def _build_poll_schedule(self, parameter_names, intervals, overrides, max_gap: int) -> PollSchedule:
+        illegal, split_before = (self.address_map.illegal, self.address_map.split_before) if self.address_map else (set(), set())
+        excluded = [name for name in parameter_names if name in illegal]
+        if excluded:
+            logger.info(f"Server {self.name}: not polling unreadable parameters {excluded}")
+        params = self._parameters_by_name([name for name in parameter_names if name not in illegal])
+        return PollSchedule.build(params, set(self.write_parameters), intervals, overrides=overrides,
+                                  max_gap=max_gap, split_before=split_before)
+
+    def poll_tier(self, parameter_name: str) -> PollTier:
+        """ Poll tier of a parameter or write parameter, with the overrides of the last build_poll_schedule. """
+        overrides = self._poll_schedule_args[2] or {}
+        param = self._parameters_by_name([parameter_name])[parameter_name]
+        return resolve_poll_tier(param, parameter_name in self.write_parameters, overrides.get(parameter_name))
+
+    def _parameters_by_name(self, parameter_names) -> dict[str, Parameter | WriteParameter]:
+        return {name: self.parameters.get(name, self.write_parameters.get(name)) for name in parameter_names}  # type: ignore
+
+    def read_block(self, block: ReadBlock) -> dict[str, Any]:
+        """Read a planned block of registers with a single request and decode every parameter in it.
+
+        Args:
+            block (ReadBlock): block as planned by read_planner.plan_reads
+
+        If the device rejects the block with Illegal Data Address and an address map is set,
+        the block is bisected to find the unreadable registers. See bisect_block.
+
+        Raises:
+            ReadException: if the device returns an error response, or fewer registers than requested
+
+        Returns:
+            dict[str, Any]: decoded value by parameter name
+        """
+        try:
+            return self._read_block_once(block)
+        except ReadException as e:
+            if e.exception_code != ILLEGAL_DATA_ADDRESS or self.address_map is None:
+                raise
+            return self.bisect_block(block)
+
+    def _read_block_once(self, block: ReadBlock) -> dict[str, Any]:
+        logger.debug(
+            f"Reading block ({block.register_type}) {block.address=}, {block.count=}, {self.modbus_id=}")
+
+        start = perf_counter()
+        error = True
+        try:
+            result = self.connected_client.read(
+                block.address, block.count, self.modbus_id, block.register_type)
+            error = result.isError()
+        finally:
+            self.metrics.observe_read(block.register_type, block.address, block.count, perf_counter() - start, error)
+
+        decode_start = perf_counter()
+        values = self.decode_block(block, result)
+        self.metrics.observe_decode(perf_counter() - decode_start)
+        return values
+
+    def bisect_block(self, block: ReadBlock) -> dict[str, Any]:
+        """Find the registers of a block rejected with Illegal Data Address, by reading ever smaller halves of it.
+
+        A single parameter that is rejected is marked unreadable. If both halves of a rejected block
+        read fine, the unmapped registers between them are to blame, and the second half is marked
+        to start a new block. Probing repeats until the block's readable parameters plan into reads
+        the device accepts. The learned address map is saved and the poll schedule replanned,
+        keeping when each tier is next due.
+
+        Raises:
+            ReadException: if probing learns nothing while the replanned reads are still rejected,
+                e.g. of a device rejecting the same registers only some of the time
+
+        Returns:
+            dict[str, Any]: decoded value by parameter name, for the readable parameters of the block
+        """
+        assert self.address_map is not None
+        logger.warning(f"Server {self.name}: Illegal Data Address reading block at address {block.address}, "
+                       f"count {block.count}. Probing for unsupported registers")
+        illegal_before = set(self.address_map.illegal)
+        values = self._bisect(block.parameters)
+
+        # the readable parameters may still be planned into blocks bridging the unreadable registers
+        max_gap = self._poll_schedule_args[3]
+        while True:
+            readable = {name: param for name, param in block.parameters.items() if name not in self.address_map.illegal}
+            failing = []
+            for replanned in plan_reads(readable, max_gap=max_gap, split_before=self.address_map.split_before):
+                try:
+                    self._read_block_once(replanned)
+                except ReadException as e:
+                    if e.exception_code != ILLEGAL_DATA_ADDRESS:
+                        raise
+                    failing.append(replanned)
+            if not failing:
+                break
+            learned = (len(self.address_map.illegal), len(self.address_map.split_before))
+            for replanned in failing:
+                values.update(self._bisect(replanned.parameters))
+            if (len(self.address_map.illegal), len(self.address_map.split_before)) == learned:
+                # the same plan would be rejected again: the device answers inconsistently
+                self.address_map.save()
+                self.replan()
+                raise ReadException(f"Server {self.name}: Illegal Data Address reading block at address "
+                                    f"{failing[0].address}, count {failing[0].count}, which probing read fine",
+                                    ILLEGAL_DATA_ADDRESS)
+
+        found = self.address_map.illegal - illegal_before
+        if found:
+            logger.warning(f"Server {self.name}: parameters {sorted(found)} are not supported by the device and will not be polled")
+        self.address_map.save()
+        self.replan()
+        return values
+
+    def _bisect(self, parameters: dict[str, Parameter | WriteParameter]) -> dict[str, Any]:
+        """ Read parameters as one block, splitting it on Illegal Data Address. Returns the values read. """
+        assert self.address_map is not None
+        try:
+            return self._read_block_once(ReadBlock.covering(parameters))
+        except ReadException as e:
+            if e.exception_code != ILLEGAL_DATA_ADDRESS:
+                raise
+
+        addresses = sorted({param["addr"] for param in parameters.values()})
+        if len(addresses) == 1:
+            self.address_map.illegal.update(parameters)
+            return {}
+
+        split = addresses[len(addresses) // 2]
+        first = {name: param for name, param in parameters.items() if param["addr"] < split}
+        second = {name: param for name, param in parameters.items() if param["addr"] >= split}
+        num_illegal = len(self.address_map.illegal)
+        values = self._bisect(first) | self._bisect(second)
+        if len(self.address_map.illegal) == num_illegal:
+            # both halves are readable: the registers between them are not
+            first_of_second = min(second, key=lambda name: (second[name]["addr"], -second[name]["count"]))
+            self.address_map.split_before.add(first_of_second)
+        return values
+
+    def replan(self) -> None:
+        """ Rebuild the poll schedule with the arguments of the last build_poll_schedule, e.g. after the address map changed. """
+        self.poll_schedule.replan(self._build_poll_schedule(*self._poll_schedule_args).plans)
+
+    def decode_block(self, block: ReadBlock, result) -> dict[str, Any]:
+        """Decode every parameter of a block from the read response.
+
+        Split from read_block so that the async runtime can await the request itself.
+
+        Raises:
+            ReadException: if the response is an error response, or holds fewer registers than requested
+        """
+        if result.isError():
+            self.connected_client._handle_error_response(result)
+            raise ReadException(f"Error reading block at address {block.address}, count {block.count}",
+                                exception_code=getattr(result, "exception_code", None))
+
+        registers = result.registers
+        if len(registers) < block.count:
+            raise ReadException(f"Short response reading block at address {block.address}: "
+                                f"expected {block.count} registers, got {len(registers)}")
+
+        descriptors = self.descriptors
+        buffer = codec.registers_to_buffer(registers[:block.count])
+        values = {}
+        for name in block.parameters:
+            descriptor = descriptors[name]
+            values[name] = descriptor.decode_from(buffer, 2 * (descriptor.addr - block.address))
+        logger.debug(f"Read {values}")
+        return values
+
     def write_registers(self, parameter_name_slug: str, value: Any, modbus_id_override: Optional[int]=None) -> None:
         """ 
         Write a group of registers (parameter) using pymodbus
 
-        Requires implementation of the abstract method 'Server._encoded()'
+        Encoded by the encoder of the parameter's DataType, see Server._encoder
 
-        Finds correct write register name using mapping from Server.write_registers_slug_to_name
+        Finds correct write register by slug using Server.write_descriptors_by_slug
         """
-        parameter_name = self.write_parameters_slug_to_name[parameter_name_slug]
-        param: WriteParameter = self.write_parameters[parameter_name]
+        descriptor = self.write_descriptors_by_slug[parameter_name_slug]
+        parameter_name = descriptor.name
 
-        address = param["addr"]
-        dtype = param["dtype"]
-        multiplier = param["multiplier"]
-        count = param["count"]  # TODO
+        address = descriptor.addr
+        dtype = descriptor.dtype
+        multiplier = descriptor.multiplier
+        count = descriptor.count
         if modbus_id_override is not None: 
             modbus_id = modbus_id_override
         else:
             modbus_id = self.modbus_id
-        register_type = param["register_type"]
-        unit = param.get("unit")
+        register_type = descriptor.register_type
 
-        if param["ha_entity_type"] == HAEntityType.SWITCH or param['ha_entity_type'] == HAEntityType.BUTTON:
-            value = int(value, base=0) # interpret string as integer literal. supports auto detecting base
-        elif dtype != DataType.UTF8:
-            value = float(value)
-            if multiplier != 1:
-                value /= multiplier
-        print(value, dtype)
-        values = self._encoded(value, dtype)
+        values = self._encode_write(descriptor, value)
 
         logger.info(
             f"Writing {values} to param {parameter_name} ({register_type}) of {dtype=} from {address=}, {multiplier=}, {count=}, {modbus_id=}")
 
         # attempt to write to the register 3 times
         try:
-            with_retries(self.connected_client.write,
+            with_retries(self._write,
                         values, address, modbus_id, register_type,
                         exception = ModbusException,
                         msg = f"Error writing register {parameter_name}")
@@ -257,6 +448,80 @@ class Server(ABC):
             logger.error(f"Failure to write after 3 attempts. Continuing")
             return
 
+    def _write(self, values: list[int], address: int, modbus_id: int, register_type: RegisterTypes) -> Any:
+        """ Write registers with connected_client, timing the request into the server metrics. """
+        start = perf_counter()
+        error = True
+        try:
+            result = self.connected_client.write(values, address, modbus_id, register_type)
+            error = False
+        finally:
+            self.metrics.observe_write(perf_counter() - start, error)
+        return result
+
+    @staticmethod
+    def _encode_write(descriptor: ParameterDescriptor, value: Any) -> list[int]:
+        """ Registers of a value received for a write parameter, e.g. from an MQTT command payload. """
+        if descriptor.ha_entity_type == HAEntityType.SWITCH or descriptor.ha_entity_type == HAEntityType.BUTTON:
+            # interpret string as integer literal. supports auto detecting base
+            value = int(value, base=0) if isinstance(value, str) else int(value)
+        elif descriptor.dtype != DataType.UTF8:
+            value = float(value)
+            if descriptor.multiplier != 1:
+                value /= descriptor.multiplier
+        return descriptor.encoder(value)
+
+    def write_batch(self, values_by_slug: dict[str, Any]) -> dict[str, Any]:
+        """Write several write parameters, then read them back with planned block reads.
+
+        Parameters are written in the order given. Consecutive parameters at adjacent holding registers
+        are merged into one Write Multiple Registers request, of at most MAX_WRITE_COUNT registers.
+        Every value is encoded before the first write, and writing stops at the first failed request.
+
+        Args:
+            values_by_slug (dict[str, Any]): values by write parameter slug
+
+        Raises:
+            KeyError: if a slug is not a write parameter of the server
+            ValueError: if a value cannot be encoded
+
+        Returns:
+            dict[str, Any]: values read back by parameter name, except for write-only buttons
+        """
+        unknown = [slug for slug in values_by_slug if slug not in self.write_descriptors_by_slug]
+        if unknown:
+            raise KeyError(f"Not write parameters of {self.name}: {unknown}")
+        encoded = [(self.write_descriptors_by_slug[slug], self._encode_write(self.write_descriptors_by_slug[slug], value))
+                   for slug, value in values_by_slug.items()]
+
+        runs: list[tuple[int, RegisterTypes, list[int], list[str]]] = []    # (address, type, registers, names) per request
+        for descriptor, registers in encoded:
+            if runs:
+                address, register_type, run_registers, names = runs[-1]
+                if (register_type == descriptor.register_type and address + len(run_registers) == descriptor.addr
+                        and len(run_registers) + len(registers) <= MAX_WRITE_COUNT):
+                    run_registers.extend(registers)
+                    names.append(descriptor.name)
+                    continue
+            runs.append((descriptor.addr, descriptor.register_type, list(registers), [descriptor.name]))
+
+        for address, register_type, registers, names in runs:
+            logger.info(f"Writing {registers} to params {names} of {self.name} from {address=}")
+            try:
+                with_retries(self._write,
+                             registers, address, self.modbus_id, register_type,
+                             exception=ModbusException,
+                             msg=f"Error writing registers {names}")
+            except ModbusException:
+                logger.error(f"Failure to write {names} after 3 attempts. Not writing the remaining parameters")
+                break
+
+        read_back = [descriptor.name for descriptor, _ in encoded if descriptor.definition.get("payload_press") is None]
+        values: dict[str, Any] = {}
+        for block in self.build_read_plan(read_back):
+            values.update(self.read_block(block))
+        return values
+
        
        
 
@@ -274,6 +539,7 @@ class Server(ABC):
         
         self.set_model()
         self.setup_valid_registers_for_model()
+        self._descriptors = None    # recompiled for the registers valid for the model
         return True
 
     @classmethod
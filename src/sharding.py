@@ -0,0 +1,209 @@
+from dataclasses import dataclass, replace
+import logging
+import multiprocessing
+from queue import Empty
+from time import monotonic, time
+from typing import Callable, Optional
+
+from .options import AppOptions
+
+logger = logging.getLogger(__name__)
+
+# seconds between shard health summaries in the log
+SHARD_REPORT_INTERVAL = 60
+# cap on the delay before restarting a shard that keeps crashing
+SHARD_MAX_RESTART_DELAY = 300
+# extra seconds per server a starting shard has before its first heartbeat: connecting to an unreachable
+# inverter takes the pymodbus timeout times its retries, for each request
+SHARD_STARTUP_SECONDS_PER_SERVER = 30
+
+
+@dataclass
+class ShardHealth:
+    """ Heartbeat sent by a shard to the supervisor once connected, and at the end of every poll cycle. """
+    shard: int
+    pid: int
+    cycles: int
+    servers_connected: int
+    servers_disconnected: int
+    time: float
+
+
+def partition_options(opts: AppOptions, num_shards: int) -> list[AppOptions]:
+    """Partition the configured clients, with the servers connected to them, across num_shards.
+
+    A client is never split across shards, since it owns one Modbus connection. Clients are
+    assigned greedily to the shard with the fewest servers, largest clients first.
+    Shards that would be empty are dropped.
+    """
+    servers_by_client: dict[str, list] = {c.name: [] for c in opts.clients}
+    for server in opts.servers:
+        servers_by_client[server.connected_client].append(server)
+
+    shards: list[tuple[list, list]] = [([], []) for _ in range(num_shards)]
+    for client in sorted(opts.clients, key=lambda c: len(servers_by_client[c.name]), reverse=True):
+        clients, servers = min(shards, key=lambda shard: len(shard[1]))
+        clients.append(client)
+        servers.extend(servers_by_client[client.name])
+
+    return [replace(opts, clients=clients, servers=servers, shards=1)
+            for clients, servers in shards if clients]
+
+
+def run_shard(shard: int, options: AppOptions, client_instantiator, server_instantiator,
+              message_handler_instantiator, health_queue) -> None:
+    """ Worker process entry point. Runs a complete App (own Modbus and MQTT connections) for a subset of clients. """
+    import os
+    from .app import App
+
+    app = App(client_instantiator, server_instantiator, message_handler_instantiator, options=options)
+
+    def report_health():
+        health_queue.put(ShardHealth(shard=shard, pid=os.getpid(), cycles=app.cycle_count,
+                                     servers_connected=len(app.servers),
+                                     servers_disconnected=len(app.disconnected_servers),
+                                     time=time()))
+    app.cycle_callbacks.append(report_health)
+
+    # the first heartbeat, before the first cycle: connecting may take long with unreachable servers
+    connect = app.connect
+
+    def connect_then_report():
+        connect()
+        report_health()
+    app.connect = connect_then_report  # type: ignore[method-assign]
+
+    app.setup()
+    if options.runtime == "async":
+        from .async_runtime import AsyncRuntime
+        AsyncRuntime(app).run()
+    else:
+        app.connect()
+        app.loop()
+
+
+class ShardSupervisor:
+    """
+        Runs the configured clients partitioned across worker processes (add-on option shards).
+
+        Each shard owns its Modbus connections, polling loop and MQTT connection (with its own
+        client id). The supervisor collects per-shard heartbeats, logs a health summary, and
+        restarts a shard that exited or stopped reporting, without touching the others.
+    """
+
+    def __init__(self, options: AppOptions, client_instantiator, server_instantiator, message_handler_instantiator,
+                 clock: Callable[[], float] = monotonic) -> None:
+        self.shard_options = partition_options(options, options.shards)
+        self.callbacks = (client_instantiator, server_instantiator, message_handler_instantiator)
+        self.clock = clock
+
+        # a shard is considered hung when it does not finish a cycle within this time.
+        # Generous, since a shard sleeps around midnight and may block on reconnects.
+        self.heartbeat_timeout: float = max(120, 30 * options.pause_interval_seconds)
+        if options.midnight_sleep_enabled:
+            self.heartbeat_timeout += 60 * (3 + options.midnight_sleep_wakeup_after)
+        # until its first heartbeat, a shard is also given the time to connect to all its servers
+        self.startup_timeouts: list[float] = [self.heartbeat_timeout + SHARD_STARTUP_SECONDS_PER_SERVER * len(o.servers)
+                                              for o in self.shard_options]
+
+        self.ctx = multiprocessing.get_context("spawn")
+        self.health_queue = self.ctx.Queue()
+        self.processes: list[Optional[multiprocessing.process.BaseProcess]] = [None] * len(self.shard_options)
+        self.last_health: list[Optional[ShardHealth]] = [None] * len(self.shard_options)
+        self.last_seen: list[float] = [0.0] * len(self.shard_options)
+        self.reported: list[bool] = [False] * len(self.shard_options)     # the running process sent a heartbeat
+        self.restarts: list[int] = [0] * len(self.shard_options)
+        self.next_start: list[float] = [0.0] * len(self.shard_options)
+
+        logger.info(f"Partitioned {len(options.clients)} clients into {len(self.shard_options)} shards: "
+                    f"{[[c.name for c in o.clients] for o in self.shard_options]}")
+
+    def start_shard(self, shard: int) -> None:
+        process = self.ctx.Process(target=run_shard, name=f"shard-{shard}", daemon=True,
+                                   args=(shard, self.shard_options[shard], *self.callbacks, self.health_queue))
+        process.start()
+        self.processes[shard] = process
+        self.last_seen[shard] = self.clock()
+        self.reported[shard] = False
+        logger.info(f"Started shard {shard} (pid {process.pid})")
+
+    def run(self) -> None:
+        for shard in range(len(self.shard_options)):
+            self.start_shard(shard)
+
+        last_report = self.clock()
+        try:
+            while True:
+                self.collect_health(timeout=1)
+                self.supervise()
+
+                if self.clock() - last_report > SHARD_REPORT_INTERVAL:
+                    self.report()
+                    last_report = self.clock()
+        except KeyboardInterrupt:
+            logger.info("Stopping shards")
+        finally:
+            self.stop()
+
+    def collect_health(self, timeout: float) -> None:
+        try:
+            health: ShardHealth = self.health_queue.get(timeout=timeout)
+        except Empty:
+            return
+        while True:
+            self.record_health(health)
+            try:
+                health = self.health_queue.get_nowait()
+            except Empty:
+                return
+
+    def record_health(self, health: ShardHealth) -> None:
+        process = self.processes[health.shard]
+        if process is None or process.pid != health.pid:
+            return      # sent by a process since terminated
+        self.last_health[health.shard] = health
+        self.last_seen[health.shard] = self.clock()
+        self.reported[health.shard] = True
+        self.restarts[health.shard] = 0     # healthy again
+
+    def supervise(self) -> None:
+        """ Restart shards that exited or stopped reporting, with exponential backoff for repeated failures. """
+        now = self.clock()
+        for shard, process in enumerate(self.processes):
+            if process is None:
+                if now >= self.next_start[shard]:
+                    self.start_shard(shard)
+                continue
+
+            timeout = self.heartbeat_timeout if self.reported[shard] else self.startup_timeouts[shard]
+            if not process.is_alive():
+                logger.error(f"Shard {shard} (pid {process.pid}) exited with code {process.exitcode}")
+            elif now - self.last_seen[shard] > timeout:
+                logger.error(f"Shard {shard} (pid {process.pid}) sent no heartbeat for {timeout}s. Terminating")
+                process.terminate()
+                process.join(5)
+            else:
+                continue
+
+            delay = min(SHARD_MAX_RESTART_DELAY, 5 * 2 ** self.restarts[shard])
+            self.restarts[shard] += 1
+            self.processes[shard] = None
+            self.next_start[shard] = now + delay
+            logger.info(f"Restarting shard {shard} in {delay}s (restart {self.restarts[shard]})")
+
+    def report(self) -> None:
+        for shard, health in enumerate(self.last_health):
+            if health is None:
+                logger.info(f"Shard {shard}: no heartbeat yet")
+                continue
+            logger.info(f"Shard {shard} (pid {health.pid}): {health.cycles} cycles, "
+                        f"{health.servers_connected} servers connected, {health.servers_disconnected} disconnected, "
+                        f"last heartbeat {time() - health.time:.0f}s ago")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(5)
@@ -0,0 +1,343 @@
+"""
+    Local Modbus device simulator, generated from the register maps of the implemented servers.
+
+    Serves simulated GoodWe devices over Modbus TCP, or over RTU on a pair of bridged pseudo terminals,
+    to test and benchmark the add-on without real inverters. Values vary over a simulated day,
+    requests can be delayed, and chosen addresses can answer with Modbus exceptions.
+
+        python -m src.simulator --server-type GOODWE_HT --port 5020 --unit-ids 1-3 --latency 0.02 --exception 32065:4
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+import logging
+from math import pi, sin
+import os
+import random
+import select
+import threading
+import tty
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseDeviceContext
+from pymodbus.server import ModbusSerialServer, ModbusTcpServer
+
+from . import codec
+from .enums import DataType, DeviceClass, Parameter, RegisterTypes, WriteParameter
+from .implemented_servers import ServerTypes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERIOD = 3600           # seconds of one simulated day
+RATED_POWER_KW = 100
+
+# function codes: register type read or written
+_REGISTER_TYPES = {3: RegisterTypes.HOLDING_REGISTER, 4: RegisterTypes.INPUT_REGISTER,
+                   6: RegisterTypes.HOLDING_REGISTER, 16: RegisterTypes.HOLDING_REGISTER}
+
+
+def _unit_scale(unit: Optional[str]) -> float:
+    """ Factor from the kilo-unit values simulated to the unit of a parameter, e.g. 1000 for W. """
+    return 1000 if unit in ("W", "Wh", "var", "VA") else 1
+
+
+def simulated_value(name: str, param: Parameter | WriteParameter, t: float, period: float = DEFAULT_PERIOD,
+                    serial: str = "SIM00001", model: str = "") -> Any:
+    """Value of a parameter at t seconds into the simulation, in the unit of the parameter.
+
+    Power and current follow the sun over a day of period seconds, starting mid-morning. Energy counters accumulate,
+    voltages, frequency and temperature fluctuate around nominal values. Other parameters are constant.
+    """
+    if param["dtype"] == DataType.UTF8:
+        if "serial" in name.lower():
+            return serial
+        if "model" in name.lower():
+            return model
+        return name
+
+    sun = max(0.0, sin(2 * pi * t / period + pi / 4))
+    ripple = sin(2 * pi * t / 7)    # a few seconds, so that consecutive polls differ
+    device_class = param.get("device_class")
+    scale = _unit_scale(param.get("unit"))
+    if device_class in (DeviceClass.POWER, DeviceClass.APPARENT_POWER):
+        return RATED_POWER_KW * scale * sun * (1 + 0.01 * ripple)
+    if device_class == DeviceClass.REACTIVE_POWER:
+        return 0.1 * RATED_POWER_KW * scale * sun
+    if device_class == DeviceClass.CURRENT:
+        return 145 * sun * (1 + 0.01 * ripple)
+    if device_class == DeviceClass.VOLTAGE:
+        return (600 if "pv" in name.lower() else 230) + 2 * ripple
+    if device_class == DeviceClass.FREQUENCY:
+        return 50 + 0.02 * ripple
+    if device_class == DeviceClass.TEMPERATURE:
+        return 35 + 10 * sun + ripple
+    if device_class == DeviceClass.POWER_FACTOR:
+        return 0.99
+    if device_class == DeviceClass.ENERGY:
+        # mean power of the sun curve over the days simulated so far, on top of an initial reading
+        return scale * (10000 + RATED_POWER_KW / pi * t / 3600)
+    return 0
+
+
+def encode_value(value: Any, param: Parameter | WriteParameter) -> list[int]:
+    """ Registers of a value in the unit of a parameter: descaled, clamped to the range of its dtype. """
+    dtype, count = param["dtype"], param["count"]
+    if dtype == DataType.UTF8:
+        raw = str(value).encode("ascii", errors="ignore")[:2 * count].ljust(2 * count, b"\x00")
+        return codec.buffer_to_registers(raw)
+    if dtype not in codec.STRUCTS:
+        return [0] * count
+    min_value, max_value = codec.RANGES[dtype]
+    return codec.encode(min(max_value, max(min_value, round(value / param["multiplier"]))), dtype)
+
+
+class SimulatedDevice(ModbusBaseDeviceContext):
+    """
+        Register space of one simulated device, one unit id of a simulator.
+
+        Registers of the parameters and write parameters of server_type are generated on every read,
+        see simulated_value. Written registers hold the value written, so writes are read back.
+        Unmapped registers read as 0, or with strict as an illegal data address, as on most GoodWe devices.
+    """
+
+    def __init__(self,
+                 server_type: ServerTypes,
+                 serial: str = "SIM00001",
+                 latency: float = 0,
+                 jitter: float = 0,
+                 exceptions: Optional[dict[int, int]] = None,
+                 strict: bool = False,
+                 period: float = DEFAULT_PERIOD,
+                 clock: Callable[[], float] = monotonic) -> None:
+        server = server_type.value("simulator", serial, 1, None)
+        self.parameters: dict[str, Parameter | WriteParameter] = {**server.write_parameters, **server.parameters}
+        self.serial = serial
+        self.model = server.supported_models[0] if server.supported_models else ""
+        self.latency = latency                  # seconds added to every request
+        self.jitter = jitter                    # random seconds up to which are added to latency
+        self.exceptions = exceptions or {}      # 1-indexed address: exception code of requests including it
+        self.strict = strict
+        self.period = period
+        self.clock = clock
+        self._start = clock()
+        self.written: dict[tuple[RegisterTypes, int], int] = {}
+        self.requests = 0
+        self.registers_read = 0
+
+        # (register type, 1-indexed address): parameter name, for every register of every parameter
+        self._owners: dict[tuple[RegisterTypes, int], str] = {}
+        for name, param in self.parameters.items():
+            for addr in range(param["addr"], param["addr"] + param["count"]):
+                self._owners.setdefault((param["register_type"], addr), name)
+
+    def reset(self) -> None:
+        self.written.clear()
+
+    def registers(self, register_type: RegisterTypes, addr: int, count: int) -> list[int] | ExcCodes:
+        """ Current registers addr to addr + count (1-indexed), or the exception code injected or due. """
+        self.requests += 1
+        self.registers_read += count
+        for code_addr, code in self.exceptions.items():
+            if addr <= code_addr < addr + count:
+                return ExcCodes(code)
+
+        t = self.clock() - self._start
+        encoded: dict[str, list[int]] = {}
+        registers = []
+        for a in range(addr, addr + count):
+            key = (register_type, a)
+            if key in self.written:
+                registers.append(self.written[key])
+                continue
+            name = self._owners.get(key)
+            if name is None:
+                if self.strict:
+                    return ExcCodes.ILLEGAL_ADDRESS
+                registers.append(0)
+                continue
+            if name not in encoded:
+                param = self.parameters[name]
+                encoded[name] = encode_value(simulated_value(name, param, t, self.period, self.serial, self.model), param)
+            registers.append(encoded[name][a - self.parameters[name]["addr"]])
+        return registers
+
+    def getValues(self, func_code: int, address: int, count: int = 1) -> list[int] | ExcCodes:
+        register_type = _REGISTER_TYPES.get(func_code)
+        if register_type is None:
+            return ExcCodes.ILLEGAL_FUNCTION
+        return self.registers(register_type, address + 1, count)
+
+    def setValues(self, func_code: int, address: int, values: list[int] | list[bool]) -> None | ExcCodes:
+        addr = address + 1
+        self.requests += 1
+        for code_addr, code in self.exceptions.items():
+            if addr <= code_addr < addr + len(values):
+                return ExcCodes(code)
+        if self.strict and any((RegisterTypes.HOLDING_REGISTER, a) not in self._owners
+                               for a in range(addr, addr + len(values))):
+            return ExcCodes.ILLEGAL_ADDRESS
+        for offset, value in enumerate(values):
+            self.written[(RegisterTypes.HOLDING_REGISTER, addr + offset)] = value
+        return None
+
+    async def async_getValues(self, func_code: int, address: int, count: int = 1) -> list[int] | ExcCodes:
+        await self._delay()
+        return self.getValues(func_code, address, count)
+
+    async def async_setValues(self, func_code: int, address: int, values: list[int] | list[bool]) -> None | ExcCodes:
+        await self._delay()
+        return self.setValues(func_code, address, values)
+
+    async def _delay(self) -> None:
+        delay = self.latency + self.jitter * random.random()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class PtyBridge:
+    """
+        Two pseudo terminals whose traffic is copied to each other, like a null modem cable:
+        an RTU server opens server_port, a client connects to client_port.
+    """
+
+    def __init__(self) -> None:
+        self._master_a, slave_a = os.openpty()
+        self._master_b, slave_b = os.openpty()
+        for fd in (slave_a, slave_b):
+            tty.setraw(fd)
+        self.server_port = os.ttyname(slave_a)
+        self.client_port = os.ttyname(slave_b)
+        self._slaves = (slave_a, slave_b)    # kept open, so the masters never read EOF
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="pty-bridge", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        peers = {self._master_a: self._master_b, self._master_b: self._master_a}
+        while not self._stopped:
+            readable, _, _ = select.select(list(peers), [], [], 0.1)
+            for fd in readable:
+                try:
+                    data = os.read(fd, 1024)
+                except OSError:
+                    continue
+                os.write(peers[fd], data)
+
+    def close(self) -> None:
+        self._stopped = True
+        self._thread.join(timeout=1)
+        for fd in (self._master_a, self._master_b, *self._slaves):
+            os.close(fd)
+
+
+@dataclass
+class SimulatorOptions:
+    """ Simulated devices and transport, as read from the command line """
+    server_type: str = "GOODWE_HT"      # ServerTypes member name
+    unit_ids: tuple[int, ...] = (1,)
+    host: str = "127.0.0.1"
+    port: int = 5020                    # 0 picks a free port
+    rtu: bool = False                   # serve RTU on a pseudo terminal instead of TCP
+    latency: float = 0
+    jitter: float = 0
+    exceptions: Optional[dict[int, int]] = None
+    strict: bool = False
+    period: float = DEFAULT_PERIOD
+
+
+class Simulator:
+    """
+        Simulated devices of one server type on consecutive unit ids, served over TCP or RTU
+        on a pymodbus server running on its own thread and event loop.
+    """
+
+    def __init__(self, options: SimulatorOptions = SimulatorOptions()) -> None:
+        self.options = options
+        self.devices = {unit_id: SimulatedDevice(ServerTypes[options.server_type], serial=f"SIM{unit_id:05d}",
+                                                 latency=options.latency, jitter=options.jitter,
+                                                 exceptions=options.exceptions, strict=options.strict,
+                                                 period=options.period)
+                        for unit_id in options.unit_ids}
+        self.context = ModbusServerContext(devices=self.devices, single=False)
+        self.pty: Optional[PtyBridge] = None
+        self.port = options.port
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[ModbusTcpServer | ModbusSerialServer] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="simulator", daemon=True)
+
+    @property
+    def client_port(self) -> str | int:
+        """ Serial port path for RTU, else the TCP port the simulator listens on. """
+        return self.pty.client_port if self.pty else self.port
+
+    def start(self) -> "Simulator":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result(timeout=10)
+        logger.info(f"Simulating {self.options.server_type} unit ids {list(self.devices)} on {self.client_port}")
+        return self
+
+    async def _serve(self) -> None:
+        if self.options.rtu:
+            self.pty = PtyBridge()
+            self._server = ModbusSerialServer(self.context, port=self.pty.server_port, baudrate=19200)
+        else:
+            self._server = ModbusTcpServer(self.context, address=(self.options.host, self.options.port))
+        await self._server.serve_forever(background=True)
+        if not self.options.rtu:
+            self.port = self._server.transport.sockets[0].getsockname()[1]  # type: ignore
+
+    def stop(self) -> None:
+        if self._server is not None:
+            asyncio.run_coroutine_threadsafe(self._server.shutdown(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+        if self.pty is not None:
+            self.pty.close()
+
+    def __enter__(self) -> "Simulator":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def parse_unit_ids(text: str) -> tuple[int, ...]:
+    """ Unit ids from e.g. "1,3,10-12". """
+    unit_ids: list[int] = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        unit_ids.extend(range(int(first), int(last or first) + 1))
+    return tuple(unit_ids)
+
+
+def parse_options(argv: Optional[list[str]] = None) -> SimulatorOptions:
+    parser = argparse.ArgumentParser(description="Simulate GoodWe Modbus devices from the register maps")
+    parser.add_argument("--server-type", default="GOODWE_HT", choices=[t.name for t in ServerTypes])
+    parser.add_argument("--unit-ids", default="1", help="e.g. 1,3,10-12")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--rtu", action="store_true", help="serve RTU on a pseudo terminal instead of TCP")
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0, help="random seconds up to which are added to the latency")
+    parser.add_argument("--exception", action="append", default=[], metavar="ADDRESS:CODE",
+                        help="answer requests including the 1-indexed address with the exception code")
+    parser.add_argument("--strict", action="store_true", help="answer unmapped registers with an illegal data address")
+    parser.add_argument("--period", type=float, default=DEFAULT_PERIOD, help="seconds of one simulated day")
+    args = parser.parse_args(argv)
+    exceptions = {int(address): int(code) for address, code in (e.split(":") for e in args.exception)}
+    return SimulatorOptions(args.server_type, parse_unit_ids(args.unit_ids), args.host, args.port, args.rtu,
+                            args.latency, args.jitter, exceptions, args.strict, args.period)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    simulator = Simulator(parse_options()).start()
+    print(f"Serving on {simulator.client_port}. Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -0,0 +1,93 @@
+import logging
+import threading
+from typing import Any, Callable, Generic, Hashable, TypeVar
+
+from .descriptors import ParameterDescriptor
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class WriteShadow:
+    """
+        Last confirmed value of every write parameter, from read backs after writes and from poll reads.
+
+        Lets MessageHandler skip commands that would write the value the device already holds.
+        Values are compared as the registers they encode to, so "50", 50 and 50.0 are the same setpoint.
+    """
+
+    def __init__(self) -> None:
+        self._confirmed: dict[tuple[str, str], Any] = {}    # (server name, parameter name): value
+        # recorded by the command workers and the poll, forgotten by the reconnect
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def record(self, server: Server, values: dict[str, Any]) -> None:
+        """ Record the values of the write parameters among values read from server. """
+        write_parameters = server.write_parameters
+        with self._lock:
+            for name, value in values.items():
+                if name in write_parameters:
+                    self._confirmed[(server.name, name)] = value
+
+    def matches(self, server: Server, descriptor: ParameterDescriptor, value: Any) -> bool:
+        """ Whether writing value would leave the write parameter unchanged. """
+        with self._lock:
+            if (server.name, descriptor.name) not in self._confirmed:
+                return False
+            confirmed = self._confirmed[(server.name, descriptor.name)]
+        try:
+            return Server._encode_write(descriptor, value) == Server._encode_write(descriptor, confirmed)
+        except (TypeError, ValueError):
+            return False
+
+    def forget(self, server: Server) -> None:
+        """ Forget the values of a server, e.g. once it disconnected and may have changed meanwhile. """
+        with self._lock:
+            for key in [key for key in self._confirmed if key[0] == server.name]:
+                del self._confirmed[key]
+
+
+class Debouncer(Generic[K, V]):
+    """
+        Coalesces bursts of values per key: the first value of a key is passed to callback immediately and
+        starts a window of window seconds. At the end of the window the latest value received for the key
+        within it, if any, is passed to callback. With a window of 0 every value is passed on immediately.
+    """
+
+    def __init__(self, window: float, callback: Callable[[K, V], None]) -> None:
+        self.window = window
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._open: set[K] = set()          # keys within their window
+        self._pending: dict[K, V] = {}      # latest value received within the window of a key
+        self.superseded = 0
+
+    def submit(self, key: K, value: V) -> None:
+        if self.window <= 0:
+            self.callback(key, value)
+            return
+        with self._lock:
+            first = key not in self._open
+            if first:
+                self._open.add(key)
+            else:
+                if key in self._pending:
+                    self.superseded += 1
+                self._pending[key] = value
+        if first:
+            self.callback(key, value)
+            timer = threading.Timer(self.window, self._fire, (key,))
+            timer.daemon = True
+            timer.start()
+
+    def _fire(self, key: K) -> None:
+        with self._lock:
+            self._open.discard(key)
+            if key not in self._pending:
+                return
+            value = self._pending.pop(key)
+        self.callback(key, value)
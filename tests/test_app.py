@@ -1,32 +1,87 @@
+from dataclasses import replace
+import json
 import unittest
 import src.app as app
-from src.client import SpoofClient
+from benchmarks.broker import StandInBroker
+from src.loader import load_validate_options
+from src.mqtt_message_handler import MessageHandler
+from src.options import ModbusTCPOptions, ServerOptions
+from src.simulator import Simulator, SimulatorOptions
+from tests.helpers import FakeClock
 import logging
 logging.disable(logging.CRITICAL)
 
 
 class TestApp(unittest.TestCase):
+    """ The App against a simulated inverter and the MQTT broker stand-in """
 
     def setUp(self):
-        def instantiate_spoof_clients(Options) -> list[SpoofClient]:
-            return [SpoofClient()]
+        self.simulator = Simulator(SimulatorOptions(unit_ids=(1,), port=0)).start()
+        self.broker = StandInBroker().start()
+        options = replace(load_validate_options("config.yaml"),
+                          servers=[ServerOptions("HT", "SIM00001", "GOODWE_HT", "gateway", 1)],
+                          clients=[ModbusTCPOptions("gateway", "TCP", "127.0.0.1", self.simulator.port)],
+                          mqtt_host="127.0.0.1", mqtt_port=self.broker.port, pause_interval_seconds=0,
+                          midnight_sleep_enabled=False, discovery_cache=False, write_debounce=0)
 
         self.app = app.App(
-            client_instantiator_callback=instantiate_spoof_clients,
+            client_instantiator_callback=app.instantiate_clients,
             server_instantiator_callback=app.instantiate_servers,
-            options_rel_path="config.yaml"
+            message_handler_instantiator=MessageHandler,
+            options=options
         )
 
         self.app.setup()
-        for s in self.app.servers:
-            s.connect = lambda: None
         self.app.connect()
 
+    def tearDown(self):
+        self.app.mqtt_client.close()
+        for client in self.app.clients:
+            client.close()
+        self.broker.stop()
+        self.simulator.stop()
+
     def test_setup(self):
-        self.assertEqual(1, 1)
+        self.assertEqual([server.name for server in self.app.servers], ["HT"])
+        # published after the discovery configs
+        self.assertEqual(self.broker.wait_for_message("modbus/ht/availability", 0), b"online")
+        self.assertIn("homeassistant/sensor/ht/active_power/config", self.broker.retained)
 
     def test_one_loop(self):
-        self.app.loop(loop_once=True)
+        self.app.loop(loop_count=1)
+        self.assertEqual(self.app.cycle_count, 1)
+        self.assertIsNotNone(self.broker.wait_for_message("modbus/ht/active_power/state", 0))
+        # NORMAL tier, not deferred by back to back cycles
+        self.assertIsNotNone(self.broker.wait_for_message("modbus/ht/status_1/state", 0))
+
+    def test_once_tier_heartbeat(self):
+        clock = FakeClock()
+        self.app.change_filter.clock = clock
+        self.app.loop(loop_count=1)
+        serial = "modbus/ht/serial_number/state"
+        first = self.broker.wait_for_message(serial, 0)
+        self.assertIsNotNone(first)
+        clock.now = self.app.change_filter.max_silence
+        self.app.loop(loop_count=1)
+        self.assertEqual(self.broker.wait_for_message(serial, 1), first)
+
+    def test_diagnostics(self):
+        self.app._diagnostics_due = 0
+        self.app.loop(loop_count=1)
+        summary = json.loads(self.broker.wait_for_message("modbus/ht/diagnostics", 0))
+        self.assertGreater(summary["reads"], 0)
+        self.assertIsNotNone(summary["read_latency_p99"])
+        self.assertEqual(summary["error_rate"], 0)
+
+    def test_command_read_back(self):
+        self.app.loop(loop_count=1)
+        readback = "modbus/ht/active_power_control/state"
+        count = self.broker.count(readback)
+        self.broker.inject("modbus/ht/active_power_control/set", "42")
+        self.assertEqual(float(self.broker.wait_for_message(readback, count)), 42)
+        device = self.simulator.devices[1]
+        param = device.parameters["Active Power Control"]
+        self.assertEqual(device.written, {(param["register_type"], param["addr"]): 420})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+from dataclasses import replace
+import unittest
+import src.app as app
+from benchmarks.broker import StandInBroker
+from src.async_runtime import AsyncRuntime
+from src.client import AsyncClient
+from src.loader import load_validate_options
+from src.mqtt_message_handler import MessageHandler
+from src.options import ModbusTCPOptions, ServerOptions
+from src.simulator import Simulator, SimulatorOptions
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class TestAsyncRuntime(unittest.TestCase):
+    """ The async runtime against simulated inverters on two gateways and the MQTT broker stand-in """
+
+    def setUp(self):
+        self.simulators = [Simulator(SimulatorOptions(unit_ids=(1,), port=0)).start() for _ in range(2)]
+        self.broker = StandInBroker().start()
+        options = replace(load_validate_options("config.yaml"),
+                          servers=[ServerOptions("HT1", "SIM00001", "GOODWE_HT", "gateway1", 1),
+                                   ServerOptions("HT2", "SIM00002", "GOODWE_HT", "gateway2", 1)],
+                          clients=[ModbusTCPOptions(f"gateway{i + 1}", "TCP", "127.0.0.1", simulator.port)
+                                   for i, simulator in enumerate(self.simulators)],
+                          mqtt_host="127.0.0.1", mqtt_port=self.broker.port, pause_interval_seconds=0,
+                          midnight_sleep_enabled=False, discovery_cache=False, write_debounce=0, runtime="async")
+
+        self.app = app.App(
+            client_instantiator_callback=app.instantiate_clients,
+            server_instantiator_callback=app.instantiate_servers,
+            message_handler_instantiator=MessageHandler,
+            options=options
+        )
+        self.app.setup()
+
+    def tearDown(self):
+        self.app.mqtt_client.close()
+        self.broker.stop()
+        for simulator in self.simulators:
+            simulator.stop()
+
+    def test_run(self):
+        self.assertTrue(all(isinstance(client, AsyncClient) for client in self.app.clients))
+        AsyncRuntime(self.app).run(loop_count=2)
+        self.assertEqual(self.app.cycle_count, 2)     # once per cycle of all clients, not per client
+        self.assertEqual([server.name for server in self.app.servers], ["HT1", "HT2"])
+        for nickname in ("ht1", "ht2"):
+            self.assertIsNotNone(self.broker.wait_for_message(f"modbus/{nickname}/active_power/state", 0))
+        self.assertTrue(all(simulator.devices[1].registers_read > 0 for simulator in self.simulators))
+
+    def test_exit(self):
+        AsyncRuntime(self.app).run(loop_count=1)
+        app.exit_handler(self.app.servers, self.app.clients, self.app.mqtt_client)    # after the loop closed
+        for nickname in ("ht1", "ht2"):
+            self.assertEqual(self.broker.wait_for_message(f"modbus/{nickname}/availability", 1), b"offline")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from src.change_filter import ChangeFilter, Deadband
+from src.enums import DeviceClass
+from tests.helpers import FakeClock
+
+
+class TestChangeFilter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.filter = ChangeFilter({DeviceClass.POWER: Deadband(absolute=0.5)},
+                                   {"Grid Frequency": Deadband(relative=0.01)},
+                                   min_interval=0, max_silence=60, clock=self.clock)
+
+    def publish(self, name, value, device_class=None):
+        return self.filter.should_publish("inverter", name, value, device_class)
+
+    def test_unchanged_suppressed(self):
+        self.assertTrue(self.publish("Status", "Running"))
+        self.assertFalse(self.publish("Status", "Running"))
+        self.assertTrue(self.publish("Status", "Fault"))
+
+    def test_absolute_deadband_by_device_class(self):
+        self.assertTrue(self.publish("Active Power", 10.0, DeviceClass.POWER))
+        self.assertFalse(self.publish("Active Power", 10.4, DeviceClass.POWER))
+        self.assertFalse(self.publish("Active Power", 9.6, DeviceClass.POWER))
+        self.assertTrue(self.publish("Active Power", 10.6, DeviceClass.POWER))
+        # without a deadband any change is published
+        self.assertTrue(self.publish("Energy", 1.0, DeviceClass.ENERGY))
+        self.assertTrue(self.publish("Energy", 1.1, DeviceClass.ENERGY))
+
+    def test_relative_deadband_by_parameter(self):
+        self.assertTrue(self.publish("Grid Frequency", 50.0, DeviceClass.FREQUENCY))
+        self.assertFalse(self.publish("Grid Frequency", 50.4, DeviceClass.FREQUENCY))
+        self.assertTrue(self.publish("Grid Frequency", 50.6, DeviceClass.FREQUENCY))
+
+    def test_max_silence_heartbeat(self):
+        self.assertTrue(self.publish("Status", "Running"))
+        self.clock.now = 59
+        self.assertFalse(self.publish("Status", "Running"))
+        self.clock.now = 60
+        self.assertTrue(self.publish("Status", "Running"))
+        self.clock.now = 61
+        self.assertFalse(self.publish("Status", "Running"))
+
+    def test_stale_values_not_read_again(self):
+        self.assertTrue(self.publish("Serial Number", "ABC"))     # PollTier.ONCE: read after connecting only
+        self.assertTrue(self.publish("Status", "Running"))
+        self.clock.now = 30
+        self.assertFalse(self.publish("Status", "Running"))
+        self.assertEqual(self.filter.stale(), [])
+        self.clock.now = 60
+        self.assertEqual(self.filter.stale(), [("inverter", "Serial Number", "ABC"), ("inverter", "Status", "Running")])
+        self.clock.now = 119
+        self.assertEqual(self.filter.stale(), [])
+        self.clock.now = 120
+        self.assertEqual(self.filter.stale(), [("inverter", "Serial Number", "ABC"), ("inverter", "Status", "Running")])
+        self.filter.forget("inverter")
+        self.clock.now = 180
+        self.assertEqual(self.filter.stale(), [])
+
+    def test_min_interval(self):
+        self.filter.min_interval = 10
+        self.assertTrue(self.publish("Status", 1))
+        self.clock.now = 5
+        self.assertFalse(self.publish("Status", 2))
+        self.clock.now = 10
+        self.assertTrue(self.publish("Status", 2))
+
+    def test_forget_and_disabled(self):
+        self.assertTrue(self.publish("Status", 1))
+        self.filter.forget("inverter")
+        self.assertTrue(self.publish("Status", 1))
+        self.filter.enabled = False
+        self.assertTrue(self.publish("Status", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from src import codec
+from src.enums import DataType
+
+
+class TestCodec(unittest.TestCase):
+    def test_decode(self):
+        self.assertEqual(codec.decode([0xFFFE], DataType.U16), 0xFFFE)
+        self.assertEqual(codec.decode([0xFFFE], DataType.I16), -2)
+        self.assertEqual(codec.decode([0x0001, 0x86A0], DataType.U32), 100000)
+        self.assertEqual(codec.decode([0xFFFF, 0xFC18], DataType.I32), -1000)
+        self.assertEqual(codec.decode([0, 0, 0x0001, 0x0000], DataType.U64), 65536)
+        self.assertEqual(codec.decode([0xFFFF] * 4, DataType.I64), -1)
+        self.assertEqual(codec.decode([0x4757, 0x2D31, 0x3030, 0x4854, 0x0000], DataType.UTF8), "GW-100HT")
+
+    def test_buffer_decoder(self):
+        buffer = codec.registers_to_buffer([0x1234, 0xFFFF, 0xFC18, 0x4142, 0x4300])
+        self.assertEqual(codec.buffer_decoder(DataType.I32, 2)(buffer, 2), -1000)
+        self.assertEqual(codec.buffer_decoder(DataType.UTF8, 2)(buffer, 6), "ABC")
+        with self.assertRaises(NotImplementedError):
+            codec.buffer_decoder(DataType.F32, 2)(buffer, 0)
+
+    def test_encode_round_trip(self):
+        for dtype, value in [(DataType.U16, 65535), (DataType.I16, -32768), (DataType.U32, 100000),
+                             (DataType.I32, -1000), (DataType.I64, -2), (DataType.UTF8, "GW-100HT")]:
+            self.assertEqual(codec.decode(codec.encode(value, dtype), dtype), value)
+        self.assertEqual(codec.encode(12.7, DataType.I16), [12])
+        self.assertEqual(codec.encode("abc", DataType.UTF8), [0x6162, 0x6300])
+
+    def test_encode_out_of_range(self):
+        with self.assertRaises(ValueError):
+            codec.encode(-1, DataType.U16)
+        with self.assertRaises(ValueError):
+            codec.encode(2**31, DataType.I32)
+        with self.assertRaises(ValueError):
+            codec.encode("é", DataType.UTF8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import threading
+from time import sleep
+import unittest
+from src.client import PriorityLock, SpoofClient
+from src.command_executor import CommandExecutor
+
+
+def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        sleep(0.01)
+    raise TimeoutError
+
+
+class TestPriorityLock(unittest.TestCase):
+    def test_urgent_first(self):
+        lock = PriorityLock()
+        order = []
+
+        def acquire(name, urgent):
+            lock.acquire(urgent=urgent)
+            order.append(name)
+            lock.release()
+
+        lock.acquire()      # a poll read in flight
+        poll = threading.Thread(target=acquire, args=("poll", False))
+        poll.start()
+        wait_for(lambda: poll.is_alive())
+        command = threading.Thread(target=acquire, args=("command", True))
+        command.start()
+        wait_for(lambda: lock._urgent_waiting == 1)
+        lock.release()
+        poll.join(timeout=2)
+        command.join(timeout=2)
+        self.assertEqual(order, ["command", "poll"])
+
+    def test_reentrant(self):
+        lock = PriorityLock()
+        with lock.urgent():
+            with lock:
+                pass
+            self.assertEqual(lock._depth, 1)
+        self.assertIsNone(lock._owner)
+
+
+class TestCommandExecutor(unittest.TestCase):
+    def test_commands_in_order_off_the_calling_thread(self):
+        executor = CommandExecutor(SpoofClient("client"))
+        threads = []
+        executor.submit(lambda: 1 / 0)     # failing commands are logged, later ones still run
+        for i in range(3):
+            executor.submit(lambda i=i: threads.append((i, threading.current_thread().name)))
+        executor.join()
+        self.assertEqual(threads, [(i, "commands-client") for i in range(3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from src.cycle_scheduler import CycleScheduler
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class TestCycleScheduler(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.scheduler = CycleScheduler(10, clock=lambda: self.now)
+
+    def test_fixed_rate(self):
+        self.now += 3       # reads took 3 s
+        self.assertEqual(self.scheduler.remaining(), 7)
+        self.assertEqual(self.scheduler.wait_time(), 7)
+        self.now += 7.5     # woke up late
+        self.assertEqual(self.scheduler.sample_instant, 110)
+        self.assertEqual(self.scheduler.wait_time(), 9.5)
+        self.assertEqual(self.scheduler.sample_instant, 120)
+        self.assertEqual(self.scheduler.overruns, 0)
+
+    def test_overrun_skips_missed_instants(self):
+        self.now += 25      # overran by 15 s: the instants at 110 and 120 are missed
+        self.assertEqual(self.scheduler.remaining(), -15)
+        self.assertEqual(self.scheduler.wait_time(), 5)
+        self.assertEqual((self.scheduler.overruns, self.scheduler.skipped), (1, 2))
+        self.assertEqual(self.scheduler.sample_instant, 130)
+        self.now += 5
+        self.assertEqual(self.scheduler.remaining(), 10)
+
+    def test_reset(self):
+        self.now += 1000
+        self.scheduler.reset()
+        self.assertEqual((self.scheduler.sample_instant, self.scheduler.remaining()), (1100, 10))
+
+    def test_back_to_back(self):
+        scheduler = CycleScheduler(0, clock=lambda: self.now)
+        self.now += 3
+        self.assertEqual(scheduler.remaining(), float("inf"))     # never defers tiers
+        self.assertEqual(scheduler.wait_time(), 0)
+        self.assertEqual(scheduler.sample_instant, 103)
+        self.assertEqual(scheduler.overruns, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import dataclasses
+import unittest
+from src.client import SpoofClient
+from src.goodwe_ht import GoodweHT
+
+
+class RecordingClient(SpoofClient):
+    """ Records the writes made """
+    def __init__(self, name):
+        super().__init__(name)
+        self.writes = []
+
+    def write(self, values, address, slave_id, register_type):
+        self.writes.append((values, address))
+        return super().write(values, address, slave_id, register_type)
+
+
+class TestDescriptors(unittest.TestCase):
+    def setUp(self):
+        self.server = GoodweHT("HT Inverter", "1234", 1, RecordingClient("client"))
+
+    def test_compiled(self):
+        self.server.compile_descriptors("base")
+        descriptor = self.server.descriptors["Active Power"]
+        self.assertEqual(descriptor.slug, "active_power")
+        self.assertEqual(descriptor.state_topic, "base/ht_inverter/active_power/state")
+        self.assertEqual(descriptor.rounding, 1)
+        self.assertFalse(hasattr(descriptor, "__dict__"))
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            descriptor.addr = 0  # type: ignore
+        self.assertCountEqual(self.server.descriptors, set(self.server.parameters) | set(self.server.write_parameters))
+
+    def test_decode(self):
+        self.assertEqual(self.server.descriptors["Active Power"].decode([0xFFFF, 0xFC18]), -1.0)
+        self.assertEqual(self.server.descriptors["Power Factor"].decode([987]), 1.0)
+
+    def test_rounding(self):
+        """ Same digits as the per-read rounding of the uncompiled Server """
+        self.assertEqual(self.server.descriptors["Grid Frequency"].decode([5003]), 50.03)
+        self.assertEqual(self.server.descriptors["Grid AB Voltage"].decode([2305]), 230.5)
+        self.assertEqual(self.server.descriptors["Active Power"].decode([0, 1234]), 1.2)
+
+    def test_write_by_slug(self):
+        self.server.write_registers("active_power_control", "50")
+        self.assertEqual(self.server.connected_client.writes,
+                         [([500], self.server.write_parameters["Active Power Control"]["addr"])])
+        self.assertEqual(self.server.write_parameters_slug_to_name["active_power_control"], "Active Power Control")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from time import monotonic
+import unittest
+from pymodbus import ModbusException
+from pymodbus.client import ModbusTcpClient
+from src.client import Client
+from src.enums import RegisterTypes
+from src.fault_proxy import FaultProxy, FaultProxyOptions, Faults, parse_options
+from src.options import ModbusTCPOptions
+from src.simulator import Simulator, SimulatorOptions
+
+HOLDING = RegisterTypes.HOLDING_REGISTER
+
+
+class TestFaultProxy(unittest.TestCase):
+    def setUp(self):
+        self.simulator = Simulator(SimulatorOptions(unit_ids=(1, 2), port=0)).start()
+        self.proxy = FaultProxy(FaultProxyOptions(upstream_port=self.simulator.port, seed=1)).start()
+        self.client = Client(ModbusTCPOptions("gateway", "TCP", "127.0.0.1", self.proxy.port))
+        # fail fast on dropped responses, rather than after the default timeouts and retries
+        self.client.client = ModbusTcpClient("127.0.0.1", port=self.proxy.port, timeout=0.2, retries=0)
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.close()
+        self.proxy.stop()
+        self.simulator.stop()
+
+    def read(self, unit_id: int) -> float:
+        """ Seconds a read of unit_id takes """
+        start = monotonic()
+        self.client.read(42401, 5, unit_id, HOLDING)
+        return monotonic() - start
+
+    def test_delay_of_one_unit(self):
+        self.proxy.set_faults(2, delay=0.1)
+        self.assertGreaterEqual(self.read(2), 0.1)
+        self.assertLess(self.read(1), 0.1)
+
+    def test_dropped_response(self):
+        self.proxy.set_faults(2, drop=1)
+        with self.assertRaises(ModbusException):
+            self.read(2)
+        self.read(1)
+        self.assertEqual(self.proxy.dropped, 1)
+
+    def test_truncated_response(self):
+        self.read(1)
+        self.proxy.set_faults(2, truncate=1)
+        with self.assertRaises(ModbusException):    # incomplete frame: no response within the timeout
+            self.read(2)
+        self.assertEqual(self.proxy.truncated, 1)
+
+    def test_connection_reset(self):
+        self.proxy.set_faults(2, reset=1)
+        with self.assertRaises(ModbusException):
+            self.read(2)
+        self.read(1)    # reconnects
+        self.assertEqual((self.proxy.resets, self.proxy.connections), (1, 2))
+
+    def test_gateway_down(self):
+        self.proxy.set_down()
+        with self.assertRaises(ModbusException):    # not the socket error of the reset
+            self.read(1)
+        self.proxy.set_down(False)
+        self.read(1)
+
+    def test_parse_options(self):
+        options = parse_options(["--upstream", "10.0.0.2:502", "--delay", "0.05", "--unit", "3:drop=0.5,reset=0.1"])
+        self.assertEqual((options.upstream_host, options.upstream_port), ("10.0.0.2", 502))
+        self.assertEqual(options.unit_faults, {3: Faults(delay=0.05, drop=0.5, reset=0.1)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from src.enums import RegisterTypes
+from src.metrics import BUCKET_BOUNDS, LatencyHistogram, ServerMetrics
+
+HOLDING = RegisterTypes.HOLDING_REGISTER
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.quantile(0.5))
+        for i in range(1, 101):
+            histogram.observe(i / 1000)     # 1 to 100 ms
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.050, delta=0.010)
+        self.assertAlmostEqual(histogram.quantile(0.99), 0.099, delta=0.010)
+        self.assertEqual(histogram.quantile(1), 0.1)
+        self.assertAlmostEqual(histogram.mean(), 0.0505)
+
+    def test_overflow(self):
+        histogram = LatencyHistogram()
+        histogram.observe(100)
+        self.assertEqual(histogram.quantile(1), 100)
+        self.assertGreater(histogram.quantile(0.5), BUCKET_BOUNDS[-1])
+
+
+class TestServerMetrics(unittest.TestCase):
+    def test_summary(self):
+        metrics = ServerMetrics()
+        for _ in range(9):
+            metrics.observe_read(HOLDING, 42400, 10, 0.02)
+        metrics.observe_read(HOLDING, 42400, 10, 3, error=True)
+        metrics.observe_poll(0.1)
+        metrics.observe_poll(0.2)
+        metrics.end_cycle()
+        metrics.mark_reconnected()
+
+        summary = metrics.summary()
+        self.assertAlmostEqual(summary["read_latency_p50"], 20, delta=4)
+        self.assertGreater(summary["read_latency_p99"], 1000)
+        self.assertEqual(summary["cycle_duration"], 300)
+        self.assertEqual(summary["error_rate"], 10)
+        self.assertEqual(summary["blocks"]["holding 42400+10"]["reads"], 10)
+
+        # a new window, reconnects keep counting
+        summary = metrics.summary()
+        self.assertEqual((summary["reads"], summary["read_latency_p50"], summary["cycle_duration"]), (0, None, None))
+        self.assertEqual((summary["error_rate"], summary["reconnects"]), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
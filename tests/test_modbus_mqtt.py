@@ -0,0 +1,333 @@
+from dataclasses import replace
+import json
+import os
+import tempfile
+import threading
+from time import sleep
+import unittest
+from unittest.mock import patch
+from paho.mqtt.client import MQTTMessage
+from src.client import SpoofClient
+from src.discovery_cache import DiscoveryCache
+from src.enums import PollTier
+from src.goodwe_ht import GoodweHT
+from src.loader import load_validate_options
+from src.metrics import DIAGNOSTIC_SENSORS
+from src.modbus_mqtt import MqttClient
+from src.mqtt_message_handler import MessageHandler
+from src.options import PublishPolicyOptions
+from src.publish_policy import Delivery
+from src.write_shadow import Debouncer
+
+
+class RecordingMqttClient(MqttClient):
+    """ Records publishes instead of sending them """
+    def __init__(self, options):
+        super().__init__(options)
+        self.egress.ready = lambda: True
+        self._published: list[tuple[str, str]] = []
+        self.deliveries: list[tuple[str, int, bool]] = []     # (topic, qos, retain) of every publish
+
+    @property
+    def published(self) -> list[tuple[str, str]]:
+        self.egress.drain(limit_rate=False)
+        return self._published
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self._published.append((topic, payload))
+        self.deliveries.append((topic, qos, retain))
+
+    def subscribe(self, topic, *args, **kwargs):
+        pass
+
+
+class WriteRecordingClient(SpoofClient):
+    def __init__(self, name):
+        super().__init__(name)
+        self.writes: list[tuple[int, list[int]]] = []
+
+    def write(self, values, address, slave_id, register_type):
+        self.writes.append((address, values))
+        return super().write(values, address, slave_id, register_type)
+
+
+def mqtt_client(**options) -> RecordingMqttClient:
+    options = {"discovery_cache": False, **options}
+    return RecordingMqttClient(replace(load_validate_options("config.yaml"), **options))
+
+
+def ht_server() -> GoodweHT:
+    server = GoodweHT("HT", "1234", 1, SpoofClient("client"))
+    server.model = "GW-100HT"
+    return server
+
+
+class TestJsonStateMode(unittest.TestCase):
+    def setUp(self):
+        self.mqtt = mqtt_client(mqtt_state_mode="json", mqtt_base_topic="base")
+        self.server = ht_server()
+        self.server.compile_descriptors("base")
+
+    def test_discovery_extracts_fields(self):
+        self.mqtt.publish_discovery_topics(self.server)
+        configs = {topic: json.loads(payload) for topic, payload in self.mqtt.published if topic.endswith("/config")}
+        sensor = configs["homeassistant/sensor/ht/active_power/config"]
+        self.assertEqual(sensor["state_topic"], "base/ht/state")
+        self.assertEqual(sensor["value_template"], "{% set value = value_json['active_power'] | string %}{{ value }}")
+
+    def test_one_document_per_cycle(self):
+        self.mqtt.stage_state("Active Power", 1.5, self.server)
+        self.mqtt.stage_state("Serial Number", "ABC", self.server)
+        self.mqtt.publish_state_documents([self.server])
+        self.mqtt.publish_state_documents([self.server])    # unchanged: not published again
+        self.assertEqual(self.mqtt.published, [("base/ht/state", json.dumps({"active_power": 1.5, "serial_number": "ABC"}))])
+
+        self.mqtt.publish_to_ha("Active Power", 2.0, self.server)
+        self.assertEqual(json.loads(self.mqtt.published[-1][1]), {"active_power": 2.0, "serial_number": "ABC"})
+
+    def test_document_delivery(self):
+        self.mqtt = mqtt_client(mqtt_state_mode="json", mqtt_base_topic="base", mqtt_qos=1,
+                                publish_policies=[PublishPolicyOptions(tier="fast", qos=0),
+                                                  PublishPolicyOptions(parameter="Grid Frequency", qos=1, retain=True)])
+        self.mqtt.publish_to_ha("Active Power", 1.5, self.server)
+        self.assertEqual(self.mqtt.published[-1][0], "base/ht/state")
+        self.assertEqual(self.mqtt.deliveries[-1], ("base/ht/state", 0, False))
+
+        # the strictest policy of the parameters in the document
+        self.mqtt.publish_to_ha("Grid Frequency", 50.0, self.server)
+        self.mqtt.publish_to_ha("Active Power", 1.6, self.server)
+        self.assertEqual(json.loads(self.mqtt.published[-1][1]), {"active_power": 1.6, "grid_frequency": 50.0})
+        self.assertEqual(self.mqtt.deliveries[-1], ("base/ht/state", 1, True))
+
+    def test_republished_on_ha_birth(self):
+        self.mqtt.publish_discovery_topics(self.server)
+        self.mqtt.publish_to_ha("Serial Number", "ABC", self.server)
+        self.mqtt.republish_once_states()
+        self.assertEqual(self.mqtt.published[-1], ("base/ht/state", json.dumps({"serial_number": "ABC"})))
+
+
+class TestPublishPolicy(unittest.TestCase):
+    def test_delivery_by_tier_and_parameter(self):
+        mqtt = mqtt_client(mqtt_qos=1, publish_policies=[PublishPolicyOptions(tier="fast", qos=0),
+                                                         PublishPolicyOptions(parameter="Grid Frequency", qos=1, retain=True)])
+        server = ht_server()
+        self.assertEqual(mqtt.delivery("Active Power", server), Delivery(qos=0))
+        self.assertEqual(mqtt.delivery("Grid Frequency", server), Delivery(qos=1, retain=True))
+        self.assertEqual(mqtt.delivery("Serial Number", server), Delivery(qos=1))
+        self.assertEqual(server.poll_tier("Active Power"), PollTier.FAST)
+
+
+class TestCommandRoutes(unittest.TestCase):
+    def setUp(self):
+        self.mqtt = mqtt_client()
+        self.server = ht_server()
+        self.mqtt.publish_discovery_topics(self.server)
+        self.handler = MessageHandler([self.server], self.mqtt)
+
+    def test_routes(self):
+        self.assertEqual(self.mqtt.command_subscription, "modbus/+/+/set")
+        self.assertEqual(len(self.mqtt.command_routes), len(self.server.write_parameters))
+        server, descriptor = self.mqtt.command_routes["modbus/ht/active_power_control/set"]
+        self.assertIs(server, self.server)
+        self.assertEqual(descriptor.name, "Active Power Control")
+
+    def test_write_and_read_back(self):
+        self.handler.decode_and_write("modbus/ht/active_power_control/set", "50")
+        self.handler.join()     # written on the command worker of the client
+        self.assertEqual(self.mqtt.published[-1], ("modbus/ht/active_power_control/state", 7.3))
+
+    def test_batch(self):
+        self.server.connected_client = WriteRecordingClient("client")
+        self.handler.decode_and_write("modbus/ht/commands/set",
+                                      json.dumps({"command_power_on": 1, "command_power_off": 1, "active_power_control": 50}))
+        self.handler.join()
+        # adjacent registers merged into one request, buttons not read back
+        self.assertEqual(self.server.connected_client.writes, [(41331, [1, 1]), (42409, [500])])
+        self.assertEqual(self.mqtt.published[-1], ("modbus/ht/active_power_control/state", 7.3))
+
+    def test_batch_encodes_before_writing(self):
+        self.server.connected_client = WriteRecordingClient("client")
+        with self.assertRaises(ValueError):
+            self.server.write_batch({"command_power_on": 1, "active_power_control": "much"})
+        self.assertEqual(self.server.connected_client.writes, [])
+
+    def test_unchanged_writes_skipped(self):
+        self.server.connected_client = WriteRecordingClient("client")   # reads back 73, 7.3 %
+        for value in ("7.3", "7.30", "50"):
+            self.handler.decode_and_write("modbus/ht/active_power_control/set", value)
+        self.handler.decode_and_write("modbus/ht/command_power_on/set", "0")    # buttons always written
+        self.handler.decode_and_write("modbus/ht/command_power_on/set", "0")
+        self.handler.join()
+        self.assertEqual(self.server.connected_client.writes, [(42409, [73]), (42409, [500]), (41331, [0]), (41331, [0])])
+        self.assertEqual(self.handler.shadow.skipped, 1)
+
+    def test_debounce(self):
+        written = []
+        debouncer = Debouncer(0.05, lambda key, value: written.append((key, value)))
+        for value in range(5):
+            debouncer.submit("a", value)
+        debouncer.submit("b", 0)
+        self.assertEqual(written, [("a", 0), ("b", 0)])    # the first value of a key is not delayed
+        sleep(0.2)
+        self.assertEqual(sorted(written), [("a", 0), ("a", 4), ("b", 0)])
+        self.assertEqual(debouncer.superseded, 3)
+
+    def test_one_executor_per_client(self):
+        client = self.server.connected_client
+        start = threading.Barrier(8)
+        executors = []
+
+        def executor():
+            start.wait()
+            executors.append(self.handler.executor(client))
+
+        threads = [threading.Thread(target=executor) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=2)
+        self.assertEqual(len(set(map(id, executors))), 1)
+        self.assertEqual(list(self.handler.executors), [client])
+
+    def test_other_topics_ignored(self):
+        published = len(self.mqtt.published)
+        self.handler.decode_and_write("modbus/other_shard/active_power_control/set", "50")
+        self.assertEqual(len(self.mqtt.published), published)
+
+
+class TestCompactDiscovery(unittest.TestCase):
+    def test_compact(self):
+        server = ht_server()
+        full = mqtt_client().discovery_configs(server)
+        compact = mqtt_client(discovery_compact=True).discovery_configs(server)
+        self.assertEqual(list(full), list(compact))
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(full)))
+
+        topic = "homeassistant/sensor/ht/status_1/config"
+        self.assertEqual(compact[topic]["~"], "modbus/ht")
+        self.assertEqual(compact[topic]["stat_t"], "~/status_1/state")
+        self.assertEqual(compact[topic]["uniq_id"], full[topic]["unique_id"])
+        self.assertEqual(compact[topic]["dev"], {"mf": "Goodwe", "mdl": "GW-100HT", "ids": ["HT"], "name": "ht"})
+        self.assertNotIn("\n", compact[topic]["val_tpl"])
+        self.assertEqual(compact["homeassistant/switch/ht/power_switch/config"]["dev"], {"ids": ["HT"]})
+
+
+class TestDiagnostics(unittest.TestCase):
+    def test_diagnostic_sensors(self):
+        configs = mqtt_client().discovery_configs(ht_server())
+        sensor = configs["homeassistant/sensor/ht/diagnostics_read_latency_p99/config"]
+        self.assertEqual(sensor["state_topic"], "modbus/ht/diagnostics")
+        self.assertEqual(sensor["entity_category"], "diagnostic")
+        self.assertEqual(sensor["value_template"], "{{ value_json.read_latency_p99 }}")
+        self.assertEqual(sensor["unit_of_measurement"], "ms")
+
+        disabled = mqtt_client(diagnostics_interval=0).discovery_configs(ht_server())
+        self.assertEqual(len(configs) - len(disabled), len(DIAGNOSTIC_SENSORS))
+
+
+class TestDeviceDiscovery(unittest.TestCase):
+    def test_one_config_per_server(self):
+        server = ht_server()
+        entities = mqtt_client().discovery_configs(server)
+        configs = mqtt_client(discovery_mode="device").discovery_configs(server)
+        self.assertEqual(list(configs), ["homeassistant/device/ht/config"])
+
+        payload = configs["homeassistant/device/ht/config"]
+        self.assertEqual(payload["device"]["identifiers"], ["HT"])
+        self.assertEqual(len(payload["components"]), len(entities))
+        sensor = entities["homeassistant/sensor/ht/active_power/config"]
+        component = payload["components"][sensor["unique_id"]]
+        self.assertEqual(component["platform"], "sensor")
+        self.assertNotIn("device", component)
+        self.assertEqual(component["state_topic"], sensor["state_topic"])
+        switch = entities["homeassistant/switch/ht/power_switch/config"]
+        self.assertEqual(payload["components"][switch["unique_id"]]["platform"], "switch")
+
+    def test_compact(self):
+        configs = mqtt_client(discovery_mode="device", discovery_compact=True).discovery_configs(ht_server())
+        payload = configs["homeassistant/device/ht/config"]
+        self.assertEqual(set(payload), {"dev", "o", "cmps"})
+        component = next(c for c in payload["cmps"].values() if c["stat_t"] == "~/status_1/state")
+        self.assertEqual((component["p"], component["~"]), ("sensor", "modbus/ht"))
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+        self.server = ht_server()
+
+    def publish_discovery(self, server, **options):
+        mqtt = mqtt_client(discovery_cache=True, **options)
+        cache = DiscoveryCache.for_server(server.name, mqtt.host, mqtt.port, data_path=self.data_path)
+        with patch.object(DiscoveryCache, "for_server", return_value=cache):
+            mqtt.publish_discovery_topics(server)
+        return [(topic, payload) for topic, payload in mqtt.published if topic.startswith("homeassistant/")]
+
+    def test_unchanged_configs_skipped(self):
+        first = self.publish_discovery(self.server)
+        self.assertEqual(len(first), len(self.server.parameters) + len(self.server.write_parameters) + len(DIAGNOSTIC_SENSORS))
+        self.assertEqual(self.publish_discovery(self.server), [])
+
+        self.server.parameters["Active Power"] = dict(self.server.parameters["Active Power"], unit="W")
+        self.assertEqual([topic for topic, _ in self.publish_discovery(self.server)],
+                         ["homeassistant/sensor/ht/active_power/config"])
+
+    def test_recorded_once_sent(self):
+        mqtt = mqtt_client(discovery_cache=True)
+        cache = DiscoveryCache.for_server(self.server.name, mqtt.host, mqtt.port, data_path=self.data_path)
+        with patch.object(DiscoveryCache, "for_server", return_value=cache):
+            mqtt.publish_discovery_topics(self.server)
+        self.assertFalse(os.path.exists(cache.path))       # nothing sent yet
+        self.assertEqual(cache.hashes, {})
+        mqtt.egress.drain(limit_rate=False)
+        self.assertTrue(os.path.exists(cache.path))
+        self.assertEqual(self.publish_discovery(self.server), [])
+
+    def test_republished_on_ha_birth(self):
+        mqtt = mqtt_client()
+        mqtt.publish_discovery_topics(self.server)
+        mqtt.publish_availability(False, self.server)
+        configs = [topic for topic, _ in mqtt.published if topic.startswith("homeassistant/")]
+        birth = MQTTMessage(topic=b"homeassistant/status")
+        birth.payload = b"online"
+        mqtt.on_message(mqtt, None, birth)
+        published = mqtt.published[-len(configs) - 1:]
+        self.assertEqual([topic for topic, _ in published[:-1]], configs)
+        self.assertEqual(published[-1], ("modbus/ht/availability", "offline"))
+
+    def test_once_states_republished_on_ha_birth(self):
+        mqtt = mqtt_client()
+        self.server.compile_descriptors(mqtt.base_topic)
+        mqtt.publish_discovery_topics(self.server)
+        mqtt.publish_to_ha("Serial Number", "ABC", self.server)
+        mqtt.publish_to_ha("Active Power", 1.5, self.server)
+        sent = len(mqtt.published)
+        birth = MQTTMessage(topic=b"homeassistant/status")
+        birth.payload = b"online"
+        mqtt.on_message(mqtt, None, birth)
+        states = [message for message in mqtt.published[sent:] if not message[0].startswith("homeassistant/")]
+        self.assertEqual(states, [("modbus/ht/availability", "online"), ("modbus/ht/serial_number/state", "ABC")])
+
+    def test_removed_configs_cleared(self):
+        self.publish_discovery(self.server)
+        del self.server.parameters["Active Power"]
+        self.assertEqual(self.publish_discovery(self.server), [("homeassistant/sensor/ht/active_power/config", "")])
+
+    def test_mode_switch(self):
+        entities = self.publish_discovery(self.server)
+        published = self.publish_discovery(self.server, discovery_mode="device")
+        self.assertEqual(published[:len(entities)], [(topic, "") for topic, _ in entities])
+        self.assertEqual([topic for topic, _ in published[len(entities):]], ["homeassistant/device/ht/config"])
+
+    def test_other_broker(self):
+        cache = DiscoveryCache(os.path.join(self.data_path, "cache.json"), "a:1883")
+        cache.sent("topic", "payload")     # saved, nothing else pending
+        same, other = DiscoveryCache(cache.path, "a:1883"), DiscoveryCache(cache.path, "b:1883")
+        same.load()
+        other.load()
+        self.assertFalse(same.changed("topic", "payload"))
+        self.assertTrue(other.changed("topic", "payload"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from pymodbus.pdu import ExceptionResponse
+from src.client import Client
+from src.enums import RegisterTypes
+from src.modbus_recording import Recorder, Recording, RecordingClient, ReplayClient
+from src.options import ModbusTCPOptions, ServerOptions
+from src.simulator import Simulator, SimulatorOptions
+
+HOLDING = RegisterTypes.HOLDING_REGISTER
+
+
+class TestModbusRecording(unittest.TestCase):
+    def setUp(self):
+        self.simulator = Simulator(SimulatorOptions(unit_ids=(1,), port=0, exceptions={42410: 6})).start()
+        self.path = os.path.join(tempfile.mkdtemp(), "session.jsonl.gz")
+        self.recorder = Recorder(self.path, [ServerOptions("HT", "SIM00001", "GOODWE_HT", "gateway", 1)])
+        client = Client(ModbusTCPOptions("gateway", "TCP", "127.0.0.1", self.simulator.port))
+        client.connect()
+        self.client = RecordingClient(client, self.recorder)
+
+    def tearDown(self):
+        self.client.close()
+        self.simulator.stop()
+
+    def record_session(self) -> list[int]:
+        registers = self.client.read(42400, 10, 1, HOLDING).registers
+        self.assertTrue(self.client.read(42405, 10, 1, HOLDING).isError())     # exception 6 at 42410
+        self.client.write([500], 42409, 1, HOLDING)
+        self.recorder.close()
+        return registers
+
+    def test_recording(self):
+        self.record_session()
+        recording = Recording.load(self.path)
+        self.assertEqual(recording.servers[0].name, "HT")
+        self.assertEqual(recording.clients, ["gateway"])
+        read, error, write = recording.transactions
+        self.assertEqual((read["op"], read["a"], read["n"], len(read["r"])), ("read", 42400, 10, 10))
+        self.assertEqual(error["e"], 6)
+        self.assertEqual((write["op"], write["v"]), ("write", [500]))
+        self.assertTrue(all(entry["d"] >= 0 for entry in recording.transactions))
+
+    def test_replay(self):
+        registers = self.record_session()
+        replay = ReplayClient("gateway", Recording.load(self.path), speed=0)
+        self.assertEqual(replay.read(42400, 10, 1, HOLDING).registers, registers)
+        response = replay.read(42405, 10, 1, HOLDING)
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, 6)
+
+        # requests not recorded are composed from the registers recorded
+        self.assertEqual(replay.read(42402, 3, 1, HOLDING).registers, registers[2:5])
+        self.assertEqual(replay.read(42410, 1, 1, HOLDING).exception_code, 6)
+        self.assertEqual(replay.read(1, 1, 1, HOLDING).exception_code, 2)
+        self.assertEqual(replay.composed, 3)
+
+        replay.write([250], 42409, 1, HOLDING)
+        self.assertEqual(replay.read(42400, 10, 1, HOLDING).registers, registers[:9] + [250])
+
+    def test_pace(self):
+        self.record_session()
+        recording = Recording.load(self.path)
+        waits = []
+        replay = ReplayClient("gateway", recording, speed=4, wait=waits.append)
+        replay.read(42400, 10, 1, HOLDING)
+        self.assertEqual(waits, [recording.transactions[0]["d"] / 4])
+
+    def test_rotation(self):
+        directory = tempfile.mkdtemp()
+        servers = [ServerOptions("HT", "SIM00001", "GOODWE_HT", "gateway", 1)]
+        recorder = Recorder(os.path.join(directory, "session.jsonl.gz"), servers, max_bytes=1, max_files=2)
+        for i in range(350):
+            recorder.record({"c": "gateway", "op": "read", "u": 1, "rt": 4, "a": 42400, "n": 1, "r": [i]}, 0, 0)
+        recorder.close()
+        self.assertEqual(sorted(os.listdir(directory)), ["session-2.jsonl.gz", "session-3.jsonl.gz"])
+        recording = Recording.load(os.path.join(directory, "session-3.jsonl.gz"))
+        self.assertEqual(recording.servers[0].name, "HT")
+        self.assertEqual([entry["r"] for entry in recording.transactions], [[i] for i in range(300, 350)])
+
+    def test_truncated(self):
+        self.record_session()
+        with open(self.path, "rb") as f:
+            data = f.read()
+        with open(self.path, "wb") as f:
+            f.write(data[:-10])
+        self.assertLessEqual(len(Recording.load(self.path).transactions), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+from time import sleep
+import unittest
+from src.mqtt_egress import EgressQueue, TokenBucket
+from tests.helpers import FakeClock
+
+
+class TestEgressQueue(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.clock = FakeClock()
+        self.ready = True
+        self.queue = EgressQueue(lambda topic, payload, qos, retain: self.sent.append((topic, payload)),
+                                 max_queued=3, ready=lambda: self.ready, clock=self.clock)
+
+    def test_latest_per_topic(self):
+        self.ready = False      # e.g. broker stalled
+        for value in range(100):
+            self.queue.put("a/state", value)
+            self.queue.put("b/state", -value)
+        self.assertEqual(self.queue.drain(), 0)
+        self.assertEqual(self.queue.depth, 2)
+
+        self.ready = True
+        self.queue.drain()
+        self.assertEqual(self.sent, [("a/state", 99), ("b/state", -99)])
+        self.assertEqual(self.queue.stats(), {"depth": 0, "enqueued": 200, "sent": 2, "superseded": 198, "dropped": 0})
+
+    def test_bounded(self):
+        for topic in "abcde":
+            self.queue.put(topic, 1)
+        self.queue.drain()
+        self.assertEqual([topic for topic, _ in self.sent], ["c", "d", "e"])
+        self.assertEqual(self.queue.dropped, 2)
+
+    def test_retained_never_dropped(self):
+        self.queue.put("config/a", "{}", retain=True)
+        self.queue.put("a/state", 1)
+        self.queue.put("config/b", "{}", retain=True)
+        self.queue.put("availability", "online", retain=True)   # drops the state message instead of a config
+        self.queue.put("b/state", 2)                            # only retained messages queued: dropped itself
+        self.queue.put("config/c", "{}", retain=True)           # beyond max_queued
+        self.queue.drain()
+        self.assertEqual([topic for topic, _ in self.sent], ["config/a", "config/b", "availability", "config/c"])
+        self.assertEqual(self.queue.dropped, 2)
+
+    def test_on_sent(self):
+        calls = []
+        self.ready = False
+        self.queue.put("config", "old", retain=True, on_sent=lambda: calls.append("old"))
+        self.queue.put("config", "new", retain=True, on_sent=lambda: calls.append("new"))
+        self.queue.drain()
+        self.assertEqual(calls, [])
+        self.ready = True
+        self.queue.drain()
+        self.assertEqual(calls, ["old", "new"])     # superseded first, so the latest payload is recorded last
+
+    def test_rate_limit(self):
+        self.queue.bucket = TokenBucket(rate=2, burst=1, clock=self.clock)
+        for topic in "abc":
+            self.queue.put(topic, 1)
+        self.assertAlmostEqual(self.queue.drain(), 0.5)
+        self.assertEqual(len(self.sent), 1)
+        self.clock.now = 0.5
+        self.queue.drain()
+        self.assertEqual(len(self.sent), 2)
+        self.queue.stop(flush=True)     # remaining messages sent without the rate limit
+        self.assertEqual(len(self.sent), 3)
+
+    def test_thread(self):
+        self.queue.start()
+        self.queue.put("a", 1)
+        for _ in range(100):
+            if self.sent:
+                break
+            sleep(0.01)
+        self.queue.stop(flush=False)
+        self.assertEqual(self.sent, [("a", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import random
+import unittest
+from pymodbus.pdu import ExceptionResponse
+from src.address_map import AddressMap
+from src.read_planner import MAX_READ_COUNT, plan_reads
+from src.goodwe_ht import GoodweHT
+from src.goodwe_ht_registers import goodwe_ht_parameters
+from src.client import SpoofClient
+from src.cycle_scheduler import CycleScheduler
+from src.server import ReadException
+from src.enums import DataType, DeviceClass, Parameter, PollTier, RegisterTypes
+
+
+def param(addr, count=1, register_type=RegisterTypes.HOLDING_REGISTER) -> Parameter:
+    return Parameter(addr=addr, count=count, dtype=DataType.U16, multiplier=1, unit="",
+                     device_class=DeviceClass.ENUM, register_type=register_type)
+
+
+class SequentialClient(SpoofClient):
+    """ Returns the register address as its value """
+    def read(self, address, count, slave_id, register_type):
+        return SpoofClient.SpoofResponse(list(range(address, address + count)))
+
+
+class IllegalAddressClient(SequentialClient):
+    """ Rejects any read touching one of the illegal addresses with Illegal Data Address """
+    def __init__(self, name, illegal):
+        super().__init__(name)
+        self.illegal = set(illegal)
+        self.reads = 0
+
+    def read(self, address, count, slave_id, register_type):
+        self.reads += 1
+        if self.illegal & set(range(address, address + count)):
+            return ExceptionResponse(3, 2)
+        return super().read(address, count, slave_id, register_type)
+
+
+class InconsistentClient(SequentialClient):
+    """ Rejects every other read with Illegal Data Address """
+    def __init__(self, name):
+        super().__init__(name)
+        self.reads = 0
+
+    def read(self, address, count, slave_id, register_type):
+        self.reads += 1
+        if self.reads % 2:
+            return ExceptionResponse(3, 2)
+        return super().read(address, count, slave_id, register_type)
+
+
+class TestReadPlanner(unittest.TestCase):
+    def test_contiguous_merged(self):
+        blocks = plan_reads({"a": param(10), "b": param(11, 2), "c": param(13)})
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual((blocks[0].address, blocks[0].count), (10, 4))
+
+    def test_gap(self):
+        params = {"a": param(10), "b": param(14)}
+        self.assertEqual(len(plan_reads(params)), 2)
+        self.assertEqual(len(plan_reads(params, max_gap=3)), 1)
+        self.assertEqual(len(plan_reads(params, max_gap=2)), 2)
+
+    def test_register_types_split(self):
+        params = {"a": param(10), "b": param(11, register_type=RegisterTypes.INPUT_REGISTER)}
+        self.assertEqual(len(plan_reads(params)), 2)
+
+    def test_overlapping(self):
+        blocks = plan_reads({"a": param(10), "b": param(10)})
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0].count, 1)
+
+    def test_ht_parameters_covered(self):
+        blocks = plan_reads(goodwe_ht_parameters, max_gap=10)
+        self.assertLess(len(blocks), len(goodwe_ht_parameters))
+        for block in blocks:
+            self.assertLessEqual(block.count, MAX_READ_COUNT)
+        planned = [name for block in blocks for name in block.parameters]
+        self.assertCountEqual(planned, goodwe_ht_parameters)
+
+    def test_split_before(self):
+        blocks = plan_reads({"a": param(10), "b": param(12), "c": param(13)}, max_gap=5, split_before={"b"})
+        self.assertEqual([list(block.parameters) for block in blocks], [["a"], ["b", "c"]])
+
+    def test_read_block_matches_read_registers(self):
+        server = GoodweHT("ht", "1234", 1, SequentialClient("client"))
+        for block in server.build_read_plan(list(server.parameters), max_gap=10):
+            for name, value in server.read_block(block).items():
+                self.assertEqual(value, server.read_registers(name), name)
+
+
+class TestIllegalAddressBisection(unittest.TestCase):
+    def setUp(self):
+        self.server = GoodweHT("ht", "1234", 1, SequentialClient("client"))
+        self.server.address_map = AddressMap()
+        self.intervals = {PollTier.FAST: 0, PollTier.NORMAL: 10, PollTier.SLOW: 300}
+        self.active_power = self.server.parameters["Active Power"]
+
+    def test_illegal_parameter_excluded(self):
+        self.server.connected_client = IllegalAddressClient("client", [self.active_power["addr"]])
+        self.server.build_poll_schedule(list(self.server.parameters), self.intervals, max_gap=10)
+        values = {}
+        for blocks in self.server.poll_schedule.plans.values():
+            for block in blocks:
+                values.update(self.server.read_block(block))
+
+        self.assertEqual(self.server.address_map.illegal, {"Active Power"})
+        self.assertNotIn("Active Power", values)
+        self.assertEqual(len(values), len(self.server.parameters) - 1)
+        planned = [name for blocks in self.server.poll_schedule.plans.values() for block in blocks for name in block.parameters]
+        self.assertNotIn("Active Power", planned)
+
+        # replanned: no further probing
+        reads = self.server.connected_client.reads
+        for blocks in self.server.poll_schedule.plans.values():
+            for block in blocks:
+                self.server.read_block(block)
+        self.assertEqual(self.server.connected_client.reads - reads, self.server.poll_schedule.num_reads)
+
+    def test_illegal_gap_split(self):
+        params = {"a": param(10), "b": param(14)}
+        self.server.connected_client = IllegalAddressClient("client", [12])
+        self.server._parameters = params
+        self.server._write_parameters = {}
+        self.server.build_poll_schedule(list(params), self.intervals, max_gap=10)
+
+        values = self.server.read_block(self.server.poll_schedule.plans[PollTier.NORMAL][0])
+        self.assertEqual(values, {"a": 10, "b": 14})
+        self.assertEqual(self.server.address_map.illegal, set())
+        self.assertEqual(self.server.address_map.split_before, {"b"})
+        self.assertEqual(len(self.server.poll_schedule.plans[PollTier.NORMAL]), 2)
+
+    def test_inconsistent_device_raises(self):
+        params = {"a": param(10)}
+        self.server.connected_client = InconsistentClient("client")
+        self.server._parameters = params
+        self.server._write_parameters = {}
+        self.server.build_poll_schedule(list(params), self.intervals, max_gap=10)
+
+        with self.assertRaises(ReadException):     # instead of probing forever
+            self.server.read_block(self.server.poll_schedule.plans[PollTier.NORMAL][0])
+        self.assertEqual(self.server.address_map.illegal, set())
+
+    def test_other_errors_raise(self):
+        self.server.address_map = None
+        self.server.connected_client = IllegalAddressClient("client", [self.active_power["addr"]])
+        block = self.server.build_read_plan(["Active Power"])[0]
+        with self.assertRaises(ReadException):
+            self.server.read_block(block)
+
+
+class TestPollSchedule(unittest.TestCase):
+    def setUp(self):
+        self.server = GoodweHT("ht", "1234", 1, SequentialClient("client"))
+        intervals = {PollTier.FAST: 0, PollTier.NORMAL: 10, PollTier.SLOW: 300}
+        self.schedule = self.server.build_poll_schedule(
+            list(self.server.parameters), intervals, overrides={"Daily Energy": PollTier.SLOW})
+
+    def planned_tier(self, name):
+        return [tier for tier, blocks in self.schedule.plans.items()
+                for block in blocks if name in block.parameters][0]
+
+    def test_tiers(self):
+        self.assertEqual(self.planned_tier("Active Power"), PollTier.FAST)
+        self.assertEqual(self.planned_tier("Status 1"), PollTier.NORMAL)
+        self.assertEqual(self.planned_tier("Serial Number"), PollTier.ONCE)
+        self.assertEqual(self.planned_tier("Daily Energy"), PollTier.SLOW)
+
+    def test_due(self):
+        self.assertEqual(self.schedule.due(0), list(PollTier))
+        for tier in self.schedule.due(0):
+            self.schedule.polled(tier, 0)
+        self.assertEqual(self.schedule.due(1), [PollTier.FAST])
+        self.assertEqual(self.schedule.due(10), [PollTier.FAST, PollTier.NORMAL])
+        self.assertNotIn(PollTier.ONCE, self.schedule.due(10**6))
+
+        self.schedule.reset()
+        self.assertIn(PollTier.ONCE, self.schedule.due(1))
+
+    def test_due_on_sample_instants(self):
+        # 1 s cycles that wake up late and read for a while: NORMAL stays on its 10 s grid
+        rng = random.Random(1)
+        clock = [0.0]
+        scheduler = CycleScheduler(1, clock=lambda: clock[0])
+        polled = []
+        for _ in range(100):
+            clock[0] += rng.uniform(0, 0.3)     # wake-up delay
+            for tier in self.schedule.due(scheduler.sample_instant):
+                clock[0] += rng.uniform(0, 0.05)
+                self.schedule.polled(tier, scheduler.sample_instant)
+                if tier == PollTier.NORMAL:
+                    polled.append(clock[0])
+            clock[0] += scheduler.wait_time()
+        gaps = [round(b - a) for a, b in zip(polled, polled[1:])]
+        self.assertEqual(set(gaps), {10})
+
+
+if __name__ == "__main__":
+    unittest.main()
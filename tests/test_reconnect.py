@@ -0,0 +1,75 @@
+import unittest
+from src.reconnect import RECONNECT_DELAY_MAX, Backoff, ReconnectSupervisor
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class FakeServer:
+    """ Answers connect() with the results given, in turn. An exception result is raised """
+    def __init__(self, name: str, *results):
+        self.name = name
+        self.results = list(results)
+        self.attempts = 0
+
+    def connect(self) -> bool:
+        self.attempts += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestBackoff(unittest.TestCase):
+    def test_bounds(self):
+        backoff = Backoff(rng=lambda: 1)
+        delays = [backoff.next_delay() for _ in range(10)]
+        self.assertEqual(delays, [2, 4, 8, 16, 32, 64, 128, 256, RECONNECT_DELAY_MAX, RECONNECT_DELAY_MAX])
+        backoff.reset()
+        self.assertEqual(backoff.next_delay(), 2)
+
+    def test_jitter(self):
+        self.assertEqual([Backoff(rng=lambda: 0).next_delay() for _ in range(2)], [1, 1])     # d/2
+        backoff = Backoff(rng=lambda: 0.5)
+        self.assertEqual([backoff.next_delay() for _ in range(3)], [1.5, 3, 6])
+        backoff.attempts = 20
+        self.assertEqual(backoff.next_delay(), 0.75 * RECONNECT_DELAY_MAX)
+
+
+class TestReconnectSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.supervisor = ReconnectSupervisor(clock=lambda: self.now, rng=lambda: 1)
+
+    def test_take_reconnected(self):
+        server = FakeServer("ht", False, OSError("unreachable"), True)
+        self.supervisor.add(server)
+        self.now = 1
+        self.assertEqual(self.supervisor.attempt_due(), 2)     # not due yet
+        self.assertEqual(server.attempts, 0)
+
+        self.now = 2
+        self.assertEqual(self.supervisor.attempt_due(), 6)     # failed, next after 4 s
+        self.now = 6
+        self.assertEqual(self.supervisor.attempt_due(), 14)    # raised, next after 8 s
+        self.assertEqual(self.supervisor.take_reconnected(), [])
+
+        self.now = 14
+        self.supervisor.attempt_due()
+        self.assertEqual(self.supervisor.take_reconnected(), [server])
+        self.assertEqual(self.supervisor.take_reconnected(), [])
+        self.assertEqual(server.attempts, 3)
+
+    def test_backoff_per_server(self):
+        flaky, down = FakeServer("flaky", True), FakeServer("down", False, False)
+        self.supervisor.add(down)
+        self.now = 2
+        self.supervisor.attempt_due()
+        self.supervisor.add(flaky)
+        self.now = 4
+        self.assertEqual(self.supervisor.attempt_due(), 6)     # flaky back, down still waits for its 4 s
+        self.assertEqual(self.supervisor.take_reconnected(), [flaky])
+        self.assertEqual(down.attempts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+from dataclasses import replace
+import itertools
+import unittest
+from src.loader import load_validate_options
+from src.options import ModbusTCPOptions, ServerOptions
+from src.sharding import SHARD_MAX_RESTART_DELAY, SHARD_STARTUP_SECONDS_PER_SERVER, ShardHealth, ShardSupervisor, \
+    partition_options
+import logging
+logging.disable(logging.CRITICAL)
+
+PIDS = itertools.count(1000)
+
+
+class FakeProcess:
+    def __init__(self, target, name, daemon, args):
+        self.pid = next(PIDS)
+        self.alive = True
+        self.exitcode = None
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.alive = False
+        self.exitcode = -15
+
+    def join(self, timeout=None):
+        pass
+
+
+class FakeContext:
+    Process = FakeProcess
+
+
+def options(servers_per_client: list[int], shards: int = 2):
+    clients = [ModbusTCPOptions(f"gateway{i}", "TCP", "127.0.0.1", 502) for i in range(len(servers_per_client))]
+    servers = [ServerOptions(f"HT{i}{j}", f"SN{i}{j}", "GOODWE_HT", f"gateway{i}", j + 1)
+               for i, n in enumerate(servers_per_client) for j in range(n)]
+    return replace(load_validate_options("config.yaml"), clients=clients, servers=servers, shards=shards,
+                   pause_interval_seconds=1, midnight_sleep_enabled=False)
+
+
+class TestPartitionOptions(unittest.TestCase):
+    def test_balanced(self):
+        shards = partition_options(options([5, 3, 2, 1]), 2)
+        self.assertEqual([[c.name for c in shard.clients] for shard in shards],
+                         [["gateway0", "gateway3"], ["gateway1", "gateway2"]])
+        for shard in shards:
+            self.assertEqual(shard.shards, 1)
+            self.assertEqual({s.connected_client for s in shard.servers}, {c.name for c in shard.clients})
+        self.assertEqual(sum(len(shard.servers) for shard in shards), 11)
+
+    def test_empty_shards_dropped(self):
+        self.assertEqual(len(partition_options(options([2, 2]), 4)), 2)
+
+
+class TestShardSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.supervisor = ShardSupervisor(options([3, 1]), None, None, None, clock=lambda: self.now)
+        self.supervisor.ctx = FakeContext()
+        for shard in range(2):
+            self.supervisor.start_shard(shard)
+
+    def heartbeat(self, shard: int, pid: int | None = None):
+        pid = self.supervisor.processes[shard].pid if pid is None else pid
+        self.supervisor.record_health(ShardHealth(shard, pid, cycles=1, servers_connected=1,
+                                                  servers_disconnected=0, time=self.now))
+
+    def test_restart_backoff(self):
+        delays = []
+        for _ in range(8):
+            self.heartbeat(1)
+            self.supervisor.processes[0].alive = False
+            self.supervisor.supervise()
+            self.assertIsNone(self.supervisor.processes[0])
+            delays.append(self.supervisor.next_start[0] - self.now)
+            self.now = self.supervisor.next_start[0]
+            self.heartbeat(1)
+            self.supervisor.supervise()
+            self.assertIsNotNone(self.supervisor.processes[0])
+        self.assertEqual(delays, [5, 10, 20, 40, 80, 160, SHARD_MAX_RESTART_DELAY, SHARD_MAX_RESTART_DELAY])
+
+        # a heartbeat of the restarted process resets the backoff
+        self.heartbeat(0)
+        self.supervisor.processes[0].alive = False
+        self.supervisor.supervise()
+        self.assertEqual(self.supervisor.next_start[0] - self.now, 5)
+
+    def test_startup_grace(self):
+        timeout = self.supervisor.heartbeat_timeout
+        self.assertEqual(self.supervisor.startup_timeouts, [timeout + 3 * SHARD_STARTUP_SECONDS_PER_SERVER,
+                                                            timeout + SHARD_STARTUP_SECONDS_PER_SERVER])
+        first = self.supervisor.processes[0]
+        self.now = timeout + 1      # still connecting
+        self.heartbeat(1)
+        self.supervisor.supervise()
+        self.assertTrue(first.alive)
+
+        self.now = self.supervisor.startup_timeouts[0] + 1
+        self.heartbeat(1)
+        self.supervisor.supervise()
+        self.assertFalse(first.alive)
+        self.assertIsNone(self.supervisor.processes[0])
+
+    def test_hung_after_heartbeat(self):
+        self.heartbeat(0)
+        self.now = self.supervisor.heartbeat_timeout + 1
+        process = self.supervisor.processes[0]
+        self.supervisor.supervise()
+        self.assertFalse(process.alive)
+
+    def test_stale_heartbeat_ignored(self):
+        old = self.supervisor.processes[0].pid
+        self.supervisor.processes[0].alive = False
+        self.supervisor.supervise()
+        self.now = self.supervisor.next_start[0]
+        self.supervisor.supervise()
+        self.heartbeat(0, pid=old)
+        self.assertFalse(self.supervisor.reported[0])
+        self.assertEqual(self.supervisor.restarts[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from pymodbus.constants import ExcCodes
+from src.client import Client
+from src.enums import RegisterTypes
+from src.goodwe_ht import GoodweHT
+from src.implemented_servers import ServerTypes
+from src.options import ModbusTCPOptions
+from src.simulator import SimulatedDevice, Simulator, SimulatorOptions, parse_unit_ids
+from tests.helpers import FakeClock
+
+
+class TestSimulatedDevice(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.device = SimulatedDevice(ServerTypes.GOODWE_HT, exceptions={32106 + 1: 4}, clock=self.clock)
+        self.server = GoodweHT("HT", "SIM00001", 1, None)
+
+    def read(self, name):
+        descriptor = self.server.descriptors[name]
+        return descriptor.decode(self.device.registers(descriptor.register_type, descriptor.addr, descriptor.count))
+
+    def test_values_vary_over_time(self):
+        power = self.read("Active Power")
+        self.assertGreater(power, 0)
+        self.assertAlmostEqual(self.read("Grid Frequency"), 50, delta=0.1)
+        self.clock.now = 1800       # evening of the simulated day
+        self.assertNotEqual(self.read("Active Power"), power)
+        self.assertEqual(self.read("Model"), "GW-100HT")
+
+    def test_exceptions_and_strict(self):
+        self.assertEqual(self.device.registers(RegisterTypes.HOLDING_REGISTER, 32100, 10), ExcCodes.DEVICE_FAILURE)
+        self.assertEqual(self.device.registers(RegisterTypes.HOLDING_REGISTER, 1, 2), [0, 0])
+        self.device.strict = True
+        self.assertEqual(self.device.registers(RegisterTypes.HOLDING_REGISTER, 1, 2), ExcCodes.ILLEGAL_ADDRESS)
+
+    def test_writes_read_back(self):
+        self.device.setValues(16, 42409 - 1, [500])
+        self.assertEqual(self.read("Active Power Control"), 50)
+
+    def test_parse_unit_ids(self):
+        self.assertEqual(parse_unit_ids("1,3,10-12"), (1, 3, 10, 11, 12))
+
+
+class TestSimulator(unittest.TestCase):
+    def test_tcp(self):
+        with Simulator(SimulatorOptions(port=0, unit_ids=(1, 2))) as simulator:
+            client = Client(ModbusTCPOptions("client", "TCP", "127.0.0.1", simulator.port))
+            client.connect()
+            server = GoodweHT("HT", "SIM00002", 2, client)
+            self.assertTrue(server.connect())
+            self.assertAlmostEqual(server.read_registers("Grid Frequency"), 50, delta=0.1)
+            self.assertEqual(simulator.devices[2].requests, 2)
+            client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()